@@ -19,7 +19,7 @@ call venv\Scripts\activate.bat
 
 echo [+] Estado: Verificando Herramientas de Compilacion...
 python -m pip install -q --upgrade pip
-pip install -q flet PyInstaller requests Pillow cryptography pystray
+pip install -q flet PyInstaller httpx Pillow cryptography pystray
 
 echo.
 echo [+] Estado: Iniciando proceso de Compilacion (PyInstaller)...
@@ -10,17 +10,22 @@ _current_user_id: contextvars.ContextVar[Optional[UUID]] = contextvars.ContextVa
 _current_path: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
     "current_path", default=None
 )
+_current_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_trace_id", default=None
+)
 
 
-def set_audit_context(user_id: Optional[UUID], path: Optional[str]):
+def set_audit_context(user_id: Optional[UUID], path: Optional[str], trace_id: Optional[str] = None):
     token_user = _current_user_id.set(user_id)
     token_path = _current_path.set(path)
-    return token_user, token_path
+    token_trace = _current_trace_id.set(trace_id)
+    return token_user, token_path, token_trace
 
 
-def reset_audit_context(token_user, token_path):
+def reset_audit_context(token_user, token_path, token_trace):
     _current_user_id.reset(token_user)
     _current_path.reset(token_path)
+    _current_trace_id.reset(token_trace)
 
 
 class DBAuditLogHandler(logging.Handler):
@@ -54,6 +59,7 @@ class DBAuditLogHandler(logging.Handler):
 
             user_id = _current_user_id.get()
             path = _current_path.get()
+            trace_id = _current_trace_id.get()
 
             action = f"LOG/{record.levelname}"
             details = record.getMessage()
@@ -62,8 +68,11 @@ class DBAuditLogHandler(logging.Handler):
 
             # Add basic origin for debugging.
             details = f"{details} (logger={record.name})"
+            if trace_id:
+                details = f"{details} (trace={trace_id})"
 
-            with Session(self._engine) as session:
+            from .tracing import span
+            with span("audit.write"), Session(self._engine) as session:
                 session.add(
                     AuditLog(
                         user_id=user_id,
@@ -81,10 +90,14 @@ class DBAuditLogHandler(logging.Handler):
 
 
 def configure_audit_logging(engine) -> None:
+    root = logging.getLogger()
+    # Idempotent: the startup hook may run more than once in a worker process.
+    if any(isinstance(h, DBAuditLogHandler) for h in root.handlers):
+        return
+
     handler = DBAuditLogHandler(engine)
 
     # Attach to root and common uvicorn loggers.
-    root = logging.getLogger()
     root.addHandler(handler)
     root.setLevel(logging.INFO)
 
@@ -14,4 +14,146 @@ class Settings:
     # Client must send header: X-Client-Version: <version>
     REQUIRED_CLIENT_VERSION: str = os.getenv("REQUIRED_CLIENT_VERSION", "3.0")
 
+    # Worker processes serving the API (gunicorn/uvicorn read the same variable).
+    WORKERS: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # Host-wide budgets, divided between workers (see core/startup.per_worker).
+    DB_POOL_SIZE_TOTAL: int = int(os.getenv("DB_POOL_SIZE_TOTAL", "20"))
+    # Extra connections opened under load beyond the pool, also host-wide (0: none).
+    DB_POOL_OVERFLOW_TOTAL: int = int(os.getenv("DB_POOL_OVERFLOW_TOTAL", "0"))
+    MIKROTIK_THREADS_TOTAL: int = int(os.getenv("MIKROTIK_THREADS_TOTAL", "10"))
+    INIT_LOCK_PATH: str = os.getenv("INIT_LOCK_PATH", "./.init.lock")
+
+    # Token-bucket rate limiting per source IP / user / device.
+    # Limits are "<requests>/<seconds>"; an empty value disables the route's limit.
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMITS: dict = {
+        "login": os.getenv("RATE_LIMIT_LOGIN", "10/60"),
+        # Per source IP + login name: stricter, it only limits guessing at one account.
+        "login-username": os.getenv("RATE_LIMIT_LOGIN_USERNAME", "5/300"),
+        "wireguard-config": os.getenv("RATE_LIMIT_WIREGUARD_CONFIG", "6/60"),
+    }
+    # "memory" (per process) or "sqlite" (shared by every worker on the host).
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "sqlite" if WORKERS > 1 else "memory")
+    RATE_LIMIT_SQLITE_PATH: str = os.getenv("RATE_LIMIT_SQLITE_PATH", "./rate_limits.db")
+    RATE_LIMIT_SHARDS: int = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+
+    # Server-Sent Events stream of node availability (GET /regions/events).
+    NODE_EVENTS_POLL_INTERVAL: float = float(os.getenv("NODE_EVENTS_POLL_INTERVAL", "1.0"))
+    NODE_EVENTS_KEEPALIVE: float = float(os.getenv("NODE_EVENTS_KEEPALIVE", "15"))
+    NODE_EVENTS_RETENTION: int = int(os.getenv("NODE_EVENTS_RETENTION", "10000"))
+    NODE_EVENTS_QUEUE_SIZE: int = int(os.getenv("NODE_EVENTS_QUEUE_SIZE", "256"))
+    # Sequence numbers re-read on every poll: on Postgres an event can commit
+    # after one with a higher seq, and is still delivered if it is this close.
+    NODE_EVENTS_REORDER_WINDOW: int = int(os.getenv("NODE_EVENTS_REORDER_WINDOW", "100"))
+
+    # Node drain jobs (POST /admin/nodes/{id}/drain).
+    DRAIN_BATCH_SIZE: int = int(os.getenv("DRAIN_BATCH_SIZE", "20"))
+    DRAIN_BATCH_INTERVAL: float = float(os.getenv("DRAIN_BATCH_INTERVAL", "1.0"))
+    # A job whose worker has not renewed it for this long is taken over by another worker.
+    DRAIN_LEASE_SECONDS: int = int(os.getenv("DRAIN_LEASE_SECONDS", "60"))
+    # A migrated peer stays on the source router until its client re-provisions
+    # (told by a "reprovision" event) or this long has passed.
+    DRAIN_SOURCE_GRACE_SECONDS: int = int(os.getenv("DRAIN_SOURCE_GRACE_SECONDS", "300"))
+
+    # Gzip for large responses (admin listings). Streams (SSE) are never compressed.
+    GZIP_ENABLED: bool = os.getenv("GZIP_ENABLED", "true").lower() == "true"
+    GZIP_MIN_SIZE: int = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+    GZIP_LEVEL: int = int(os.getenv("GZIP_LEVEL", "6"))
+
+    # Dashboard counters (services/stats.py): how often they are checked against
+    # the source tables, how many past hours are rebuilt, and how long hourly buckets live.
+    STATS_VERIFY_INTERVAL: int = int(os.getenv("STATS_VERIFY_INTERVAL", "600"))
+    STATS_VERIFY_HOURS: int = int(os.getenv("STATS_VERIFY_HOURS", "24"))
+    STATS_RETENTION_HOURS: int = int(os.getenv("STATS_RETENTION_HOURS", str(24 * 30)))
+
+    # Revoked peers are moved out of the hot peer table into wireguardpeerhistory
+    # every PEER_HISTORY_COMPACT_INTERVAL seconds; history older than
+    # PEER_HISTORY_RETENTION_DAYS is deleted (0 keeps it forever).
+    PEER_HISTORY_COMPACT_INTERVAL: int = int(os.getenv("PEER_HISTORY_COMPACT_INTERVAL", "300"))
+    PEER_HISTORY_BATCH_SIZE: int = int(os.getenv("PEER_HISTORY_BATCH_SIZE", "500"))
+    PEER_HISTORY_RETENTION_DAYS: int = int(os.getenv("PEER_HISTORY_RETENTION_DAYS", "365"))
+
+    # In-process scheduler for periodic jobs (core/scheduler.py). Each job runs on
+    # one worker at a time, the holder of its row in ``joblease``; a lease not
+    # renewed for SCHEDULER_LEASE_SECONDS is taken over by another worker.
+    SCHEDULER_ENABLED: bool = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    SCHEDULER_LEASE_SECONDS: int = int(os.getenv("SCHEDULER_LEASE_SECONDS", "30"))
+    SCHEDULER_TICK: float = float(os.getenv("SCHEDULER_TICK", "5"))
+    SCHEDULER_JITTER: float = float(os.getenv("SCHEDULER_JITTER", "0.1"))  # fraction of the interval
+    SCHEDULER_HISTORY: int = int(os.getenv("SCHEDULER_HISTORY", "100"))  # runs kept per job
+
+    # Per-router circuit breaker (services/circuit_breaker.py): opens when at least
+    # BREAKER_MIN_CALLS of the last BREAKER_WINDOW calls ran and BREAKER_FAILURE_RATE
+    # of them failed; while open, calls fail at once for BREAKER_OPEN_SECONDS.
+    BREAKER_WINDOW: int = int(os.getenv("BREAKER_WINDOW", "20"))
+    BREAKER_MIN_CALLS: int = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+    BREAKER_FAILURE_RATE: float = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+    BREAKER_OPEN_SECONDS: float = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+    BREAKER_HALF_OPEN_CALLS: int = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+    # Nodes tried by /me/wireguard-config when the chosen node's router is unavailable.
+    PLACEMENT_MAX_ATTEMPTS: int = int(os.getenv("PLACEMENT_MAX_ATTEMPTS", "3"))
+
+    # RouterOS API client: "thread" (routeros_api in the MikroTik executor) or
+    # "asyncio" (services/routeros_async.py, one multiplexed connection per router).
+    # MIKROTIK_USE_SSL connects to api-ssl (set the nodes' mt_api_port accordingly).
+    MIKROTIK_DRIVER: str = os.getenv("MIKROTIK_DRIVER", "thread")
+    MIKROTIK_USE_SSL: bool = os.getenv("MIKROTIK_USE_SSL", "false").lower() == "true"
+    MIKROTIK_SSL_VERIFY: bool = os.getenv("MIKROTIK_SSL_VERIFY", "true").lower() == "true"
+
+    # Router call limits (services/bulkhead.py, core/deadlines.py): concurrent calls
+    # and queued calls per router, timeout of a single call, socket timeout of a
+    # router connection, and the time budget of a request (overridable by the
+    # client with X-Request-Timeout, up to REQUEST_BUDGET_MAX).
+    ROUTER_MAX_CONCURRENCY: int = int(os.getenv("ROUTER_MAX_CONCURRENCY", "4" if MIKROTIK_DRIVER == "thread" else "64"))
+    ROUTER_MAX_QUEUE: int = int(os.getenv("ROUTER_MAX_QUEUE", "50"))
+    ROUTER_CALL_TIMEOUT: float = float(os.getenv("ROUTER_CALL_TIMEOUT", "10"))
+    ROUTER_SOCKET_TIMEOUT: float = float(os.getenv("ROUTER_SOCKET_TIMEOUT", "10"))
+    REQUEST_BUDGET_DEFAULT: float = float(os.getenv("REQUEST_BUDGET_DEFAULT", "25"))
+    REQUEST_BUDGET_MAX: float = float(os.getenv("REQUEST_BUDGET_MAX", "60"))
+    REQUEST_DISCONNECT_POLL: float = float(os.getenv("REQUEST_DISCONNECT_POLL", "0.5"))
+
+    # Per-router cache of WireGuard peer ids (services/peer_ids.py): seconds a
+    # full peer listing is trusted before the next miss reloads it.
+    PEER_ID_CACHE_TTL: float = float(os.getenv("PEER_ID_CACHE_TTL", "300"))
+
+    # Request tracing (core/tracing.py): requests slower than TRACE_SLOW_MS are
+    # logged and exported as JSON lines to TRACE_EXPORT_PATH and/or as OTLP/JSON
+    # to TRACE_OTLP_ENDPOINT (both off when empty).
+    TRACE_ENABLED: bool = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+    TRACE_SLOW_MS: float = float(os.getenv("TRACE_SLOW_MS", "1000"))
+    TRACE_EXPORT_PATH: str = os.getenv("TRACE_EXPORT_PATH", "")
+    TRACE_OTLP_ENDPOINT: str = os.getenv("TRACE_OTLP_ENDPOINT", "")
+    TRACE_MAX_SPANS: int = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+    # SQL profiling (core/sql_profiler.py): statements slower than SQL_SLOW_MS are
+    # logged with their EXPLAIN plan (once per statement shape per
+    # SQL_EXPLAIN_INTERVAL seconds). SQL_N_PLUS_ONE_THRESHOLD > 0 (dev/test) flags
+    # SELECTs repeated that many times in one request.
+    SQL_PROFILE_ENABLED: bool = os.getenv("SQL_PROFILE_ENABLED", "true").lower() == "true"
+    SQL_SLOW_MS: float = float(os.getenv("SQL_SLOW_MS", "200"))
+    SQL_EXPLAIN_INTERVAL: float = float(os.getenv("SQL_EXPLAIN_INTERVAL", "300"))
+    SQL_N_PLUS_ONE_THRESHOLD: int = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "0"))
+    SQL_PROFILE_MAX_SHAPES: int = int(os.getenv("SQL_PROFILE_MAX_SHAPES", "500"))
+
+    # Read/write split (core/deps.get_read_session): GET endpoints read from
+    # DATABASE_READ_URL (a replica) or, with SQLite, read-only connections to the
+    # same file. Reads go to the primary for READ_PRIMARY_PATHS (comma-separated
+    # path prefixes) and while the replica lags more than READ_MAX_STALENESS seconds.
+    READ_SPLIT_ENABLED: bool = os.getenv("READ_SPLIT_ENABLED", "true").lower() == "true"
+    DATABASE_READ_URL: str = os.getenv("DATABASE_READ_URL", "")
+    READ_MAX_STALENESS: float = float(os.getenv("READ_MAX_STALENESS", "5"))
+    READ_LAG_CHECK_INTERVAL: float = float(os.getenv("READ_LAG_CHECK_INTERVAL", "5"))
+    READ_PRIMARY_PATHS: list = [p.strip() for p in os.getenv("READ_PRIMARY_PATHS", "").split(",") if p.strip()]
+
+    # Live audit tail (WebSocket /admin/audit-logs/stream, services/audit_stream.py).
+    # A consumer more than AUDIT_STREAM_QUEUE_SIZE records behind is disconnected
+    # and resumes from its cursor; a resume replays at most AUDIT_STREAM_BACKLOG
+    # records. With WORKERS > 1 the table is polled every AUDIT_STREAM_POLL_INTERVAL
+    # seconds for the other workers' records, looking back AUDIT_STREAM_POLL_OVERLAP.
+    AUDIT_STREAM_QUEUE_SIZE: int = int(os.getenv("AUDIT_STREAM_QUEUE_SIZE", "500"))
+    AUDIT_STREAM_BACKLOG: int = int(os.getenv("AUDIT_STREAM_BACKLOG", "1000"))
+    AUDIT_STREAM_POLL_INTERVAL: float = float(os.getenv("AUDIT_STREAM_POLL_INTERVAL", "2"))
+    AUDIT_STREAM_POLL_OVERLAP: float = float(os.getenv("AUDIT_STREAM_POLL_OVERLAP", "5"))
+    AUDIT_STREAM_HANDSHAKE_TIMEOUT: float = float(os.getenv("AUDIT_STREAM_HANDSHAKE_TIMEOUT", "10"))
+
 settings = Settings()
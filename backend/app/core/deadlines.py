@@ -0,0 +1,73 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Request
+
+from .config import settings
+
+# Per-request time budget for outbound router calls.
+#
+# ``request_budget`` (a route dependency) starts a Budget from the
+# ``X-Request-Timeout`` header (seconds, capped at REQUEST_BUDGET_MAX) or
+# REQUEST_BUDGET_DEFAULT, and marks it cancelled when the client disconnects.
+# MikroTikService reads it from the context: each call gets what is left of
+# the budget as its deadline, and no new call starts once it is cancelled or
+# spent. Calls already running are never interrupted; a peer added by a call
+# the request stopped waiting for is removed again (MikroTikService.add_peer).
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+class Budget:
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+        self.cancelled = asyncio.Event()
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        if self.cancelled.is_set():
+            raise RequestCancelled("Client disconnected")
+        if self.remaining() == 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+
+
+_budget: ContextVar[Optional[Budget]] = ContextVar("request_budget", default=None)
+
+
+def current_budget() -> Optional[Budget]:
+    return _budget.get()
+
+
+def _requested_seconds(request: Request) -> float:
+    try:
+        seconds = float(request.headers.get("x-request-timeout", ""))
+    except ValueError:
+        return settings.REQUEST_BUDGET_DEFAULT
+    return min(max(seconds, 0.0), settings.REQUEST_BUDGET_MAX)
+
+
+async def _watch_disconnect(request: Request, budget: Budget) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(settings.REQUEST_DISCONNECT_POLL)
+    budget.cancelled.set()
+
+
+async def request_budget(request: Request):
+    budget = Budget(_requested_seconds(request))
+    # Each request runs in its own task (and context), so the value does not leak.
+    _budget.set(budget)
+    watcher = asyncio.get_running_loop().create_task(_watch_disconnect(request, budget))
+    try:
+        yield budget
+    finally:
+        watcher.cancel()
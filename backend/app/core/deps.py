@@ -1,22 +1,159 @@
+import logging
+import time
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 from sqlmodel import Session, create_engine
 from .config import settings
+from .startup import per_worker
+from . import sql_profiler, tracing
+
+_is_sqlite = settings.DATABASE_URL.startswith("sqlite")
+
+
+def _pool_args(url: str) -> dict:
+    """This worker's share of the pool budget, if the URL's pool class takes a size."""
+    parsed = make_url(url)
+    if not issubclass(parsed.get_dialect().get_pool_class(parsed), QueuePool):
+        return {}  # e.g. SingletonThreadPool for in-memory SQLite
+    return {
+        "pool_size": per_worker(settings.DB_POOL_SIZE_TOTAL, minimum=2),
+        "max_overflow": per_worker(settings.DB_POOL_OVERFLOW_TOTAL, minimum=0),
+    }
 
+
+# One engine per worker process; the pool budget is shared by all workers.
 engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False}
-    if settings.DATABASE_URL.startswith("sqlite")
-    else {},
+    connect_args={"check_same_thread": False} if _is_sqlite else {},
+    **_pool_args(settings.DATABASE_URL),
 )
 
+if _is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers in other workers proceed while one worker writes.
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+if settings.TRACE_ENABLED:
+    tracing.instrument_engine(engine)
+if settings.SQL_PROFILE_ENABLED:
+    sql_profiler.instrument_engine(engine)
+
 def get_session():
     with Session(engine) as session:
         yield session
 
+
+# Read/write split. GET endpoints take ``get_read_session``, which reads from
+# DATABASE_READ_URL (a replica) or, for SQLite, from read-only connections to
+# the same file (WAL lets them read while another connection writes). The
+# primary is used instead for non-GET requests, paths in READ_PRIMARY_PATHS,
+# requests sent with ``X-Read-Consistency: strong`` (read-your-writes), and
+# while the replica lags more than READ_MAX_STALENESS seconds or is down.
+
+def _read_url() -> Optional[str]:
+    if not settings.READ_SPLIT_ENABLED:
+        return None
+    if settings.DATABASE_READ_URL:
+        return settings.DATABASE_READ_URL
+    url = make_url(settings.DATABASE_URL)
+    if _is_sqlite and url.database and url.database != ":memory:" and not url.database.startswith("file:"):
+        return f"sqlite:///file:{url.database}?mode=ro&uri=true"
+    return None
+
+
+_read_url_value = _read_url()
+read_engine = engine
+if _read_url_value:
+    read_engine = create_engine(
+        _read_url_value,
+        connect_args={"check_same_thread": False} if _read_url_value.startswith("sqlite") else {},
+        **_pool_args(_read_url_value),
+    )
+    if settings.TRACE_ENABLED:
+        tracing.instrument_engine(read_engine)
+    if settings.SQL_PROFILE_ENABLED:
+        sql_profiler.instrument_engine(read_engine)
+    if _read_url_value.startswith("sqlite"):
+        @event.listens_for(read_engine, "connect")
+        def _sqlite_read_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+
+
+class ReadSession(Session):
+    """A session that refuses to write, whichever engine it reads from."""
+
+
+@event.listens_for(ReadSession, "before_flush")
+def _refuse_flush(session, flush_context, instances):
+    if session.new or session.dirty or session.deleted:
+        raise RuntimeError("Attempted to write through a read-only session")
+
+
+class _ReplicaLag:
+    """Replica lag in seconds, checked at most every READ_LAG_CHECK_INTERVAL per worker."""
+
+    def __init__(self):
+        self._lag = 0.0
+        self._checked_at = 0.0
+
+    def _measure(self) -> float:
+        if read_engine.dialect.name != "postgresql":
+            return 0.0  # SQLite read connections see every commit
+        with read_engine.connect() as conn:
+            lag = conn.execute(text(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+            )).scalar()
+        return float(lag or 0.0)
+
+    def get(self) -> float:
+        now = time.monotonic()
+        if now - self._checked_at >= settings.READ_LAG_CHECK_INTERVAL:
+            self._checked_at = now
+            try:
+                self._lag = self._measure()
+            except Exception as e:
+                logging.getLogger(__name__).warning("Read replica unavailable, reading from primary: %s", e)
+                self._lag = float("inf")
+        return self._lag
+
+
+replica_lag = _ReplicaLag()
+
+
+def read_bind(method: str, path: str, consistency: Optional[str] = None):
+    """The engine a request's reads go to (see the routing rules above)."""
+    if read_engine is engine:
+        return engine
+    if method not in ("GET", "HEAD") or (consistency or "").lower() == "strong":
+        return engine
+    if any(path.startswith(prefix) for prefix in settings.READ_PRIMARY_PATHS):
+        return engine
+    if replica_lag.get() > settings.READ_MAX_STALENESS:
+        return engine
+    return read_engine
+
+
+def get_read_session(request: Request):
+    bind = read_bind(request.method, request.url.path, request.headers.get("x-read-consistency"))
+    with ReadSession(bind) as session:
+        yield session
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
 from ..models.database import User
-from .security import ALGORITHM
+from .security import decode_access_token, InvalidTokenError
 import uuid
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
@@ -26,14 +163,14 @@ def get_current_user(
     token = Depends(reusable_oauth2),
 ) -> User:
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         user_id = payload.get("sub")
         if not user_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Could not validate credentials",
             )
-    except JWTError:
+    except InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
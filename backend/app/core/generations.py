@@ -0,0 +1,64 @@
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+# Cross-process cache invalidation.
+#
+# Every cache is tied to a named counter in the ``cachegeneration`` table.
+# Writers bump the counter in the same transaction as their change; each
+# worker compares its cached generation with the table (at most once per
+# ``check_interval``) and reloads when it moved.
+
+# Node list served to clients (status, capacity, region names).
+NODE_LIST = "nodes"
+
+
+def bump_generation(session: Session, name: str) -> None:
+    """Invalidate ``name`` in every worker. Committed with the caller's transaction."""
+    session.execute(
+        text(
+            "INSERT INTO cachegeneration (name, generation) VALUES (:name, 1) "
+            "ON CONFLICT (name) DO UPDATE SET generation = cachegeneration.generation + 1"
+        ),
+        {"name": name},
+    )
+
+
+def current_generation(session: Session, name: str) -> int:
+    row = session.execute(
+        text("SELECT generation FROM cachegeneration WHERE name = :name"), {"name": name}
+    ).first()
+    return row[0] if row else 0
+
+
+class GenerationCache:
+    """A single cached value, reloaded when its generation counter changes."""
+
+    def __init__(self, name: str, check_interval: float = 1.0):
+        self.name = name
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._value: Any = None
+        self._generation: Optional[int] = None
+        self._checked_at = 0.0
+
+    def get(self, session: Session, loader: Callable[[Session], Any]) -> Any:
+        now = time.monotonic()
+        if self._generation is not None and now - self._checked_at < self.check_interval:
+            return self._value
+
+        with self._lock:
+            generation = current_generation(session, self.name)
+            if generation != self._generation:
+                self._value = loader(session)
+                self._generation = generation
+            self._checked_at = now
+            return self._value
+
+    def invalidate(self) -> None:
+        """Drop the local copy (the next ``get`` reloads)."""
+        with self._lock:
+            self._generation = None
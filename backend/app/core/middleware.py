@@ -0,0 +1,144 @@
+import json
+import logging
+from typing import Dict, Iterable, Optional
+from uuid import UUID
+
+from .audit_logging import set_audit_context, reset_audit_context
+from .config import settings
+from .security import decode_access_token
+from . import sql_profiler, tracing
+
+# Route classes for the client version gate.
+PUBLIC = 0  # outside the API (admin UI, root)
+EXEMPT = 1  # API routes used by the browser Admin UI
+GATED = 2   # API routes that require X-Client-Version
+
+
+class RequestContextMiddleware:
+    """Client version gate + audit context + request trace and query count as a single pure ASGI middleware.
+
+    Replaces two ``@app.middleware("http")`` layers: no per-request task or
+    body stream wrapping, and the route class is a dict lookup on the first
+    path segment after the API prefix instead of a chain of prefix checks.
+    """
+
+    def __init__(
+        self,
+        app,
+        api_prefix: str = settings.API_V1_STR,
+        exempt_segments: Iterable[str] = ("admin", "auth", "openapi.json"),
+        required_version: str = settings.REQUIRED_CLIENT_VERSION,
+    ):
+        self.app = app
+        self.api_prefix = api_prefix.rstrip("/")
+        self.required_version = required_version
+        self._segment_class: Dict[str, int] = {s: EXEMPT for s in exempt_segments}
+
+    def route_class(self, path: str) -> int:
+        prefix = self.api_prefix
+        if not path.startswith(prefix):
+            return PUBLIC
+        rest = path[len(prefix):]
+        if rest and rest[0] != "/":
+            return PUBLIC  # e.g. "/api/v10"
+        segment = rest[1:].split("/", 1)[0]
+        return self._segment_class.get(segment, GATED)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        client_version = None
+        authorization = None
+        x_trace_id = None
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"x-client-version":
+                client_version = value.decode("latin-1")
+            elif name == b"authorization":
+                authorization = value.decode("latin-1")
+            elif name == b"x-trace-id":
+                x_trace_id = value.decode("latin-1")
+            elif name == b"traceparent":
+                traceparent = value.decode("latin-1")
+
+        method = scope["method"]
+        trace = trace_tokens = None
+        if settings.TRACE_ENABLED:
+            trace, trace_tokens = tracing.start_trace(
+                f"{method} {path}", tracing.incoming_trace_id(x_trace_id, traceparent)
+            )
+        queries = query_token = None
+        if settings.SQL_PROFILE_ENABLED:
+            queries, query_token = sql_profiler.start_request(f"{method} {path}")
+        user_id = _user_from_bearer(authorization)
+        audit_tokens = set_audit_context(user_id=user_id, path=path, trace_id=trace.trace_id if trace else None)
+        status_code = None
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                if trace is not None:
+                    headers.append((b"x-trace-id", trace.trace_id.encode()))
+                    if _is_event_stream(headers):
+                        tracing.end_at_response_start(trace)
+                if queries is not None:
+                    # Queries run so far; the response is about to be sent.
+                    headers.append((b"server-timing", queries.server_timing()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            logging.info("HTTP %s %s", method, path)
+            if self.route_class(path) == GATED and client_version != self.required_version:
+                await self._reject(send_wrapper, client_version)
+            else:
+                await self.app(scope, receive, send_wrapper)
+            logging.info("HTTP %s %s -> %s", method, path, status_code or "?")
+        finally:
+            if queries is not None:
+                sql_profiler.finish_request(queries, query_token)
+            reset_audit_context(*audit_tokens)
+            if trace is not None:
+                trace.root.attrs.update(status=status_code, user_id=user_id)
+                if queries is not None:
+                    trace.root.attrs.update(db_queries=queries.count)
+                tracing.finish_trace(trace, trace_tokens)
+
+    async def _reject(self, send, client_version: Optional[str]) -> None:
+        body = json.dumps({
+            "detail": "Client version not supported",
+            "required_version": self.required_version,
+            "provided_version": client_version,
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 426,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-required-client-version", self.required_version.encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _is_event_stream(headers) -> bool:
+    return any(name.lower() == b"content-type" and value.startswith(b"text/event-stream") for name, value in headers)
+
+
+def _user_from_bearer(authorization: Optional[str]) -> Optional[UUID]:
+    # Attach minimal context so audit log records can be attributed.
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        token_str = authorization.split(" ", 1)[1].strip()
+        payload = decode_access_token(token_str)
+        sub = payload.get("sub")
+        return UUID(str(sub)) if sub else None
+    except Exception:
+        return None
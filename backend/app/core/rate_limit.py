@@ -0,0 +1,256 @@
+import math
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    name: str
+    capacity: float  # burst size (tokens)
+    refill_per_second: float
+
+    @property
+    def refill_seconds(self) -> float:
+        # Time an empty bucket needs to become full again.
+        return self.capacity / self.refill_per_second
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> "RateLimitRule":
+        # "10/60" -> 10 requests per 60 seconds, with a burst of 10.
+        count, _, period = spec.partition("/")
+        capacity = float(count)
+        seconds = float(period or 1)
+        if capacity <= 0 or seconds <= 0:
+            raise ValueError(f"Invalid rate limit for '{name}': {spec}")
+        return cls(name=name, capacity=capacity, refill_per_second=capacity / seconds)
+
+
+class MemoryBucketStore:
+    """Sharded in-process token buckets.
+
+    Each active key costs one small list ``[tokens, last_refill]``. Shards keep
+    keys in access order so idle buckets (which would be full again anyway) are
+    evicted from the front in O(1) amortized time.
+    """
+
+    clock = staticmethod(time.monotonic)
+    blocking = False
+
+    def __init__(self, shards: int = 16, idle_ttl: float = 300.0):
+        self._shards: List[Tuple[threading.Lock, "OrderedDict[str, list]"]] = [
+            (threading.Lock(), OrderedDict()) for _ in range(shards)
+        ]
+        self._idle_ttl = idle_ttl
+
+    def _shard(self, key: str):
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    def take(self, rule: RateLimitRule, keys: Iterable[str], now: float) -> float:
+        keys = [f"{rule.name}|{k}" for k in keys]
+        # Phase 1: refill and check every key; only consume if all allow.
+        retry_after = 0.0
+        for key in keys:
+            lock, buckets = self._shard(key)
+            with lock:
+                tokens = self._refill(rule, buckets, key, now)
+            if tokens < 1:
+                retry_after = max(retry_after, (1 - tokens) / rule.refill_per_second)
+
+        if retry_after:
+            return retry_after
+
+        # Phase 2: consume one token per key.
+        for key in keys:
+            lock, buckets = self._shard(key)
+            with lock:
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    bucket[0] -= 1
+        return 0.0
+
+    def _refill(self, rule: RateLimitRule, buckets: "OrderedDict[str, list]", key: str, now: float) -> float:
+        self._evict_idle(buckets, now)
+
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = [rule.capacity, now]
+            buckets[key] = bucket
+        else:
+            elapsed = now - bucket[1]
+            bucket[0] = min(rule.capacity, bucket[0] + elapsed * rule.refill_per_second)
+            bucket[1] = now
+            buckets.move_to_end(key)
+        return bucket[0]
+
+    def _evict_idle(self, buckets: "OrderedDict[str, list]", now: float) -> None:
+        while buckets:
+            _, oldest = next(iter(buckets.items()))
+            if now - oldest[1] < self._idle_ttl:
+                break
+            buckets.popitem(last=False)
+
+    def __len__(self) -> int:
+        return sum(len(buckets) for _, buckets in self._shards)
+
+
+class SQLiteBucketStore:
+    """Token buckets stored in a SQLite file so limits hold across workers."""
+
+    # Wall clock: timestamps are shared between processes.
+    clock = staticmethod(time.time)
+    # May wait up to the busy timeout for another worker's write lock.
+    blocking = True
+
+    def __init__(self, path: str, idle_ttl: float = 300.0):
+        self._path = path
+        self._idle_ttl = idle_ttl
+        self._local = threading.local()
+        self._ops = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_bucket ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, rule: RateLimitRule, keys: Iterable[str], now: float) -> float:
+        keys = [f"{rule.name}|{k}" for k in keys]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state: Dict[str, float] = {}
+            retry_after = 0.0
+            for key in keys:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_bucket WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    tokens = rule.capacity
+                else:
+                    tokens = min(rule.capacity, row[0] + (now - row[1]) * rule.refill_per_second)
+                state[key] = tokens
+                if tokens < 1:
+                    retry_after = max(retry_after, (1 - tokens) / rule.refill_per_second)
+
+            consumed = 0 if retry_after else 1
+            conn.executemany(
+                "INSERT INTO rate_limit_bucket (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                [(key, tokens - consumed, now) for key, tokens in state.items()],
+            )
+
+            self._ops += 1
+            if self._ops % 1000 == 0:
+                conn.execute(
+                    "DELETE FROM rate_limit_bucket WHERE updated_at < ?", (now - self._idle_ttl,)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+class RateLimiter:
+    def __init__(self, rules: Dict[str, RateLimitRule], store):
+        self.rules = rules
+        self.store = store
+
+    def hit(self, route: str, keys: Iterable[str]) -> float:
+        """Consume one token for every key; return seconds to wait (0 if allowed)."""
+        rule = self.rules.get(route)
+        if rule is None:
+            return 0.0
+        return self.store.take(rule, [k for k in keys if k], self.store.clock())
+
+
+def _build_limiter() -> RateLimiter:
+    rules = {
+        route: RateLimitRule.parse(route, spec)
+        for route, spec in settings.RATE_LIMITS.items()
+        if spec
+    }
+    # Drop idle buckets once every rule would have refilled them completely.
+    idle_ttl = max((r.refill_seconds for r in rules.values()), default=60.0)
+
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        store = SQLiteBucketStore(settings.RATE_LIMIT_SQLITE_PATH, idle_ttl=idle_ttl)
+    else:
+        store = MemoryBucketStore(shards=settings.RATE_LIMIT_SHARDS, idle_ttl=idle_ttl)
+    return RateLimiter(rules, store)
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = _build_limiter()
+    return _limiter
+
+
+def client_ip(request: Request) -> Optional[str]:
+    # Behind a reverse proxy this is the address from X-Forwarded-For: uvicorn
+    # (and the gunicorn workers) rewrite it for peers in FORWARDED_ALLOW_IPS.
+    return request.client.host if request.client else None
+
+
+async def _hit(limiter: RateLimiter, route: str, keys: List[str]) -> float:
+    if limiter.store.blocking:
+        return await run_in_threadpool(limiter.hit, route, keys)
+    return limiter.hit(route, keys)
+
+
+async def enforce_rate_limit(
+    route: str,
+    request: Request,
+    user_id: Optional[str] = None,
+    device_id: Optional[str] = None,
+    username: Optional[str] = None,
+) -> None:
+    """Raise 429 if any identity (source IP, user, device) is over its budget for ``route``.
+
+    ``username`` is an unauthenticated login name: it is only counted together
+    with the source IP, under the stricter ``<route>-username`` rule, so nobody
+    can lock a real user out by guessing at it.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+
+    ip = client_ip(request)
+    keys = [f"ip:{ip}"]
+    if user_id:
+        keys.append(f"user:{user_id}")
+    if device_id:
+        keys.append(f"device:{device_id}")
+
+    limiter = get_limiter()
+    retry_after = 0.0
+    if username:
+        retry_after = await _hit(limiter, f"{route}-username", [f"ip-username:{ip}|{username}"])
+    if not retry_after:
+        retry_after = await _hit(limiter, route, keys)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
@@ -0,0 +1,24 @@
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# orjson is optional: it serialises UUIDs and datetimes natively and is several
+# times faster than the stdlib encoder. Without it everything still works.
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:  # pragma: no cover
+    orjson = None
+    DefaultJSONResponse = JSONResponse
+
+
+def json_rows(content: Any) -> JSONResponse:
+    """Send plain dicts/lists as-is, skipping response_model validation.
+
+    Use for large listings already shaped by an explicit read schema
+    (see schemas/admin.py); the route's ``response_model`` still documents it.
+    """
+    if orjson is None:
+        content = jsonable_encoder(content)
+    return DefaultJSONResponse(content)
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, text, update
+from sqlmodel import Session, delete, select
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .deps import engine
+from ..models.database import JobLease, JobRun
+
+logger = logging.getLogger(__name__)
+
+# Periodic background jobs, run by exactly one worker at a time.
+#
+# Every worker registers the same jobs and polls each one's ``joblease`` row
+# every SCHEDULER_TICK seconds. The worker that holds (or takes over an
+# expired) lease is the job's leader: it renews the lease while it is alive
+# and runs the job whenever ``next_run_at`` has passed. If the leader dies its
+# lease expires after SCHEDULER_LEASE_SECONDS and another worker carries on
+# from the same ``next_run_at``. Each run is recorded in ``jobrun``.
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+RUNNING = "RUNNING"
+OK = "OK"
+FAILED = "FAILED"
+TIMEOUT = "TIMEOUT"
+
+
+class Job:
+    def __init__(self, name: str, fn: Callable[[], Any], interval: float, timeout: Optional[float], jitter: float):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.timeout = timeout
+        self.jitter = jitter
+        # The last run's task in this worker; a run that timed out may still be in it.
+        self.in_flight: Optional[asyncio.Task] = None
+
+    def busy(self) -> bool:
+        return self.in_flight is not None and not self.in_flight.done()
+
+    def next_run(self, now: datetime) -> datetime:
+        spread = self.interval * self.jitter
+        return now + timedelta(seconds=self.interval + random.uniform(-spread, spread))
+
+    async def call(self) -> Any:
+        # Blocking jobs go to the thread pool. On timeout the thread cannot be
+        # stopped: the run is recorded as TIMEOUT and the job stays in flight
+        # (no new run starts, see Scheduler._loop) until the thread finishes.
+        if asyncio.iscoroutinefunction(self.fn):
+            return await self.fn()
+        return await run_in_threadpool(self.fn)
+
+
+def _claim(name: str, lease_seconds: int) -> Tuple[bool, Optional[datetime]]:
+    """Take or renew the lease on ``name``. Returns (held, next_run_at)."""
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        session.execute(
+            text("INSERT INTO joblease (name) VALUES (:name) ON CONFLICT (name) DO NOTHING"), {"name": name}
+        )
+        result = session.execute(
+            update(JobLease)
+            .where(JobLease.name == name)
+            .where(or_(JobLease.owner == WORKER_ID, JobLease.owner.is_(None), JobLease.expires_at < now))
+            .values(owner=WORKER_ID, expires_at=now + timedelta(seconds=lease_seconds))
+        )
+        session.commit()
+        if result.rowcount != 1:
+            return False, None
+        return True, session.get(JobLease, name).next_run_at
+
+
+def _release(names: List[str]) -> None:
+    with Session(engine) as session:
+        session.execute(
+            update(JobLease)
+            .where(JobLease.name.in_(names))
+            .where(JobLease.owner == WORKER_ID)
+            .values(owner=None, expires_at=None)
+        )
+        session.commit()
+
+
+def _start_run(job: Job) -> int:
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        # Schedule the next run before this one starts, so a crash mid-run
+        # does not make the next leader repeat it straight away.
+        session.execute(update(JobLease).where(JobLease.name == job.name).values(next_run_at=job.next_run(now)))
+        run = JobRun(job=job.name, owner=WORKER_ID, status=RUNNING, started_at=now)
+        session.add(run)
+        session.commit()
+        session.refresh(run)
+        return run.id
+
+
+def _finish_run(run_id: int, status: str, result: Any, duration: float, history: int) -> None:
+    with Session(engine) as session:
+        run = session.get(JobRun, run_id)
+        run.status = status
+        run.finished_at = datetime.utcnow()
+        run.duration_ms = round(duration * 1000, 1)
+        if result is not None:
+            run.result = json.dumps(result, default=str)[:4000]
+        session.add(run)
+        # Keep the last ``history`` runs of the job.
+        cutoff = session.exec(
+            select(JobRun.id).where(JobRun.job == run.job).order_by(JobRun.id.desc()).offset(history).limit(1)
+        ).first()
+        if cutoff is not None:
+            session.exec(delete(JobRun).where(JobRun.job == run.job).where(JobRun.id <= cutoff))
+        session.commit()
+
+
+def run_now(session: Session, name: str) -> None:
+    """Make ``name`` due; its leader runs it at the next tick."""
+    session.execute(update(JobLease).where(JobLease.name == name).values(next_run_at=datetime.utcnow()))
+    session.commit()
+
+
+def _run_dict(run: JobRun) -> dict:
+    data = run.dict()
+    if run.result is not None:
+        try:
+            data["result"] = json.loads(run.result)
+        except ValueError:
+            pass  # Truncated
+    return data
+
+
+def last_run(session: Session, name: str) -> Optional[dict]:
+    run = session.exec(
+        select(JobRun).where(JobRun.job == name).where(JobRun.status != RUNNING).order_by(JobRun.id.desc())
+    ).first()
+    return _run_dict(run) if run else None
+
+
+def job_runs(session: Session, name: str, limit: int = 20) -> List[dict]:
+    runs = session.exec(select(JobRun).where(JobRun.job == name).order_by(JobRun.id.desc()).limit(limit)).all()
+    return [_run_dict(run) for run in runs]
+
+
+class Scheduler:
+    def __init__(self, lease_seconds: int, tick: float, jitter: float, history: int):
+        self.lease_seconds = lease_seconds
+        self.tick = tick
+        self.jitter = jitter
+        self.history = history
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add(self, name: str, fn: Callable[[], Any], interval: float, timeout: Optional[float] = None,
+            jitter: Optional[float] = None) -> Job:
+        job = Job(name, fn, interval, timeout, self.jitter if jitter is None else jitter)
+        self.jobs[name] = job
+        return job
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._loop(job)) for job in self.jobs.values()]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Hand the jobs over now instead of after the lease expires.
+        if self.jobs:
+            await run_in_threadpool(_release, list(self.jobs))
+
+    def status(self, session: Session) -> List[dict]:
+        leases = {lease.name: lease for lease in session.exec(select(JobLease)).all()}
+        now = datetime.utcnow()
+        jobs = []
+        for name, job in self.jobs.items():
+            lease = leases.get(name)
+            held = lease is not None and lease.owner is not None and lease.expires_at >= now
+            jobs.append({
+                "name": name,
+                "interval": job.interval,
+                "timeout": job.timeout,
+                "leader": lease.owner if held else None,
+                "lease_expires_at": lease.expires_at if held else None,
+                "next_run_at": lease.next_run_at if lease else None,
+                "last_run": last_run(session, name),
+            })
+        return jobs
+
+    def _sleep_time(self, period: float) -> float:
+        return period * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _keep_lease(self, name: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await run_in_threadpool(_claim, name, self.lease_seconds)
+
+    async def _run(self, job: Job) -> None:
+        run_id = await run_in_threadpool(_start_run, job)
+        keeper = asyncio.get_running_loop().create_task(self._keep_lease(job.name))
+        started = time.perf_counter()
+        status, result = OK, None
+        task = job.in_flight = asyncio.get_running_loop().create_task(job.call())
+        try:
+            done, _ = await asyncio.wait({task}, timeout=job.timeout)
+            if done:
+                result = task.result()
+            else:
+                status, result = TIMEOUT, f"Timed out after {job.timeout}s"
+                logger.error("Job %s timed out after %ss", job.name, job.timeout)
+                if asyncio.iscoroutinefunction(job.fn):
+                    task.cancel()  # A thread cannot be stopped: its task stays in flight until it returns
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())  # Retrieve a late error
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        except Exception as e:
+            status, result = FAILED, f"{type(e).__name__}: {e}"
+            logger.exception("Job %s failed", job.name)
+        finally:
+            keeper.cancel()
+        await run_in_threadpool(_finish_run, run_id, status, result, time.perf_counter() - started, self.history)
+
+    async def _loop(self, job: Job) -> None:
+        # Spread the workers' polls so they do not all hit the lease row together.
+        await asyncio.sleep(random.uniform(0, self.tick))
+        while True:
+            try:
+                # Claimed even while a timed-out run is in flight, so the lease
+                # (and with it the job) is not handed to another worker.
+                held, next_run_at = await run_in_threadpool(_claim, job.name, self.lease_seconds)
+                if held and (next_run_at is None or next_run_at <= datetime.utcnow()):
+                    if job.busy():
+                        logger.debug("Job %s: previous run still in flight, skipping", job.name)
+                    else:
+                        await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler loop for %s failed", job.name)
+            await asyncio.sleep(self._sleep_time(self.tick))
+
+
+scheduler = Scheduler(
+    settings.SCHEDULER_LEASE_SECONDS, settings.SCHEDULER_TICK, settings.SCHEDULER_JITTER, settings.SCHEDULER_HISTORY
+)
@@ -1,24 +1,38 @@
 from datetime import datetime, timedelta
 from typing import Any, Union
-from jose import jwt
 from passlib.context import CryptContext
 from .config import settings
+from .tracing import span
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ALGORITHM = "HS256"
 
+class InvalidTokenError(Exception):
+    pass
+
 def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None) -> str:
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = {"exp": expire, "sub": str(subject)}
+    from jose import jwt  # deferred: jose pulls in its crypto backends on import
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> dict:
+    from jose import jwt, JWTError  # deferred, see create_access_token
+    try:
+        with span("jwt.decode"):
+            return jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError as e:
+        raise InvalidTokenError(str(e)) from e
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with span("password.verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    with span("password.hash"):
+        return pwd_context.hash(password)
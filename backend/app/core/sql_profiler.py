@@ -0,0 +1,201 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from typing import Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# SQL profiling through SQLAlchemy engine events, per worker.
+#
+# Every statement is timed and folded into a per-shape summary (literals and
+# IN-lists normalised away) served by GET /admin/sql-profile. Within an HTTP
+# request (RequestContextMiddleware calls ``start_request``/``finish_request``)
+# statements are also counted and reported in a ``Server-Timing`` header.
+# Pollers started from a request (SSE broker, audit tail, drain jobs) run via
+# ``tracing.detached_task``, so their statements are not counted in it.
+#
+# Statements slower than SQL_SLOW_MS are logged with their EXPLAIN plan, at most
+# once per shape every SQL_EXPLAIN_INTERVAL seconds. The log is written from a
+# separate thread: the audit log handler writes to the DB, and must not wait on
+# the transaction the slow statement is part of. With
+# SQL_N_PLUS_ONE_THRESHOLD > 0 (dev/test), a SELECT shape repeated that many
+# times in one request is logged as an N+1 suspect, e.g. a lazy ``peer.node``
+# inside a loop.
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("(?...)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+class RequestQueries:
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes: Counter = Counter()
+
+    def add(self, shape: str, ms: float) -> None:
+        self.count += 1
+        self.total_ms += ms
+        self.shapes[shape] += 1
+
+    def n_plus_one_suspects(self, threshold: int) -> List[tuple]:
+        return [
+            (shape, n) for shape, n in self.shapes.most_common()
+            if n >= threshold and shape.upper().startswith("SELECT")
+        ]
+
+    def server_timing(self) -> bytes:
+        return f'db;dur={self.total_ms:.1f};desc="{self.count} queries"'.encode()
+
+
+class _ShapeStats:
+    __slots__ = ("calls", "total_ms", "max_ms", "slow", "slow_unlogged", "explained_at")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+        self.slow_unlogged = 0
+        self.explained_at = 0.0
+
+
+_request: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+_shapes: Dict[str, _ShapeStats] = {}
+_shapes_lock = threading.Lock()  # statements run in threadpool threads too
+_started_at = time.time()
+_log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-profiler")
+
+
+def start_request(name: str):
+    queries = RequestQueries(name)
+    return queries, _request.set(queries)
+
+
+def finish_request(queries: RequestQueries, token) -> None:
+    _request.reset(token)
+    threshold = settings.SQL_N_PLUS_ONE_THRESHOLD
+    if threshold > 0:
+        for shape, n in queries.n_plus_one_suspects(threshold):
+            logger.warning("N+1 suspect in %s: %d x %s", queries.name, n, shape[:300])
+
+
+def _record(statement: str, parameters, conn, ms: float, executemany: bool) -> None:
+    shape = statement_shape(statement)
+    queries = _request.get()
+    if queries is not None:
+        queries.add(shape, ms)
+
+    skipped = 0
+    with _shapes_lock:
+        stats = _shapes.get(shape)
+        if stats is None:
+            if len(_shapes) >= settings.SQL_PROFILE_MAX_SHAPES:
+                return
+            stats = _shapes[shape] = _ShapeStats()
+        stats.calls += 1
+        stats.total_ms += ms
+        stats.max_ms = max(stats.max_ms, ms)
+        if ms < settings.SQL_SLOW_MS:
+            return
+        stats.slow += 1
+        now = time.monotonic()
+        if stats.explained_at and now - stats.explained_at < settings.SQL_EXPLAIN_INTERVAL:
+            stats.slow_unlogged += 1
+            return
+        stats.explained_at = now
+        skipped, stats.slow_unlogged = stats.slow_unlogged, 0
+
+    plan = None if executemany else _explain(conn, statement, parameters)
+    message = "Slow query (%.0fms)%s: %s%s"
+    args = [ms, f" in {queries.name}" if queries else "", shape[:500], f"\n{plan}" if plan else ""]
+    if skipped:
+        message += " (%d more slow runs not logged)"
+        args.append(skipped)
+    # Keeps the audit context (user, path, trace id) of the request.
+    _log_executor.submit(copy_context().run, logger.warning, message, *args)
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    if verb not in ("SELECT", "UPDATE", "DELETE", "WITH"):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        # A separate DBAPI cursor, so the result of the profiled statement is untouched.
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters or ())
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception as e:
+        return f"(EXPLAIN failed: {e})"
+    if conn.dialect.name == "sqlite":
+        # (id, parent, notused, detail)
+        return "\n".join(f"  {row[-1]}" for row in rows)
+    return "\n".join(f"  {row[0]}" for row in rows)
+
+
+def instrument_engine(engine) -> None:
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profile_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_profile_started", None)
+        if started is None:
+            return
+        ms = (time.perf_counter() - started) * 1000
+        try:
+            _record(statement, parameters, conn, ms, executemany)
+        except Exception:
+            logger.debug("SQL profiling failed", exc_info=True)
+
+
+def report(limit: int = 50, order: str = "total_ms") -> dict:
+    with _shapes_lock:
+        rows = [
+            {
+                "statement": shape,
+                "calls": s.calls,
+                "total_ms": round(s.total_ms, 1),
+                "avg_ms": round(s.total_ms / s.calls, 2),
+                "max_ms": round(s.max_ms, 1),
+                "slow": s.slow,
+            }
+            for shape, s in _shapes.items()
+        ]
+    key = order if order in ("total_ms", "calls", "avg_ms", "max_ms", "slow") else "total_ms"
+    rows.sort(key=lambda r: -r[key])
+    return {
+        "since": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(_started_at)),
+        "shapes": len(rows),
+        "statements": rows[:limit],
+    }
+
+
+def reset() -> None:
+    global _started_at
+    with _shapes_lock:
+        _shapes.clear()
+    _started_at = time.time()
@@ -0,0 +1,108 @@
+import contextlib
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, List, Tuple
+
+from .config import settings
+
+
+class StartupProfiler:
+    """Records how long each import/init phase of the worker takes."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self) -> Dict[str, object]:
+        return {
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases},
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+    def log_report(self) -> None:
+        lines = [f"  {name:<28} {seconds * 1000:8.1f} ms" for name, seconds in self.phases]
+        logging.getLogger(__name__).info(
+            "Startup report (pid %s, %.1f ms since import):\n%s",
+            os.getpid(), (time.perf_counter() - self.started) * 1000, "\n".join(lines),
+        )
+
+
+profiler = StartupProfiler()
+
+
+class Readiness:
+    """Set of warm-up steps that must finish before /ready reports 200."""
+
+    def __init__(self, *steps: str):
+        self._pending = set(steps)
+
+    def mark(self, step: str) -> None:
+        self._pending.discard(step)
+
+    @property
+    def pending(self) -> List[str]:
+        return sorted(self._pending)
+
+    @property
+    def ready(self) -> bool:
+        return not self._pending
+
+
+@contextlib.contextmanager
+def init_lock(path: str = settings.INIT_LOCK_PATH):
+    """Exclusive cross-process file lock for one-time startup work.
+
+    With several workers, each one runs the startup hook; the first to get the
+    lock does the work and the others wait, then find nothing left to do.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        logging.getLogger(__name__).debug("Acquired init lock %s (pid %s)", path, os.getpid())
+        yield
+    finally:
+        if os.name == "nt":
+            import msvcrt
+
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        # flock is released when the descriptor is closed.
+        os.close(fd)
+
+
+def per_worker(total: int, minimum: int = 1) -> int:
+    """Split a host-wide resource budget evenly between worker processes."""
+    return max(minimum, total // max(1, settings.WORKERS))
+
+
+def schema_fingerprint(metadata, engine) -> str:
+    """Hash of the DDL the models would create (tables and indexes)."""
+    from sqlalchemy.schema import CreateIndex, CreateTable
+
+    ddl = []
+    for table in metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=engine.dialect)))
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            ddl.append(str(CreateIndex(index).compile(dialect=engine.dialect)))
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()
@@ -0,0 +1,292 @@
+import asyncio
+import contextvars
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lightweight per-request tracing.
+#
+# RequestContextMiddleware starts a Trace for every HTTP request (trace id from
+# an incoming ``X-Trace-Id`` / ``traceparent`` header, or a new one) and returns
+# it in ``X-Trace-Id``. ``span(name)`` times a block as a child of the current
+# span; DB statements (engine events, see ``instrument_engine``), router calls,
+# JWT decoding and password hashing are wrapped already. Context variables
+# follow the request into run_in_threadpool, so sync code is traced too.
+#
+# Long-lived tasks started while serving a request (pollers, drain jobs) must
+# use ``detached_task``: a task copies the caller's context and would otherwise
+# keep adding spans to that request's trace for as long as it runs.
+#
+# Requests slower than TRACE_SLOW_MS are logged with a per-kind breakdown and
+# exported off the request path: as JSON lines to TRACE_EXPORT_PATH and/or as
+# OTLP/JSON to TRACE_OTLP_ENDPOINT (e.g. http://collector:4318/v1/traces).
+# Streaming responses (SSE) are timed to their first byte, not their lifetime.
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "start_ns", "end_ns", "attrs")
+
+    def __init__(self, name: str, parent_id: Optional[str], attrs: Optional[dict] = None):
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attrs = attrs or {}
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    def __init__(self, trace_id: str, name: str):
+        self.trace_id = trace_id
+        self.root = Span(name, None)
+        self.spans: List[Span] = []
+        self.dropped = 0
+
+    def add(self, span: Span) -> None:
+        # list.append is atomic, so spans may finish in worker threads.
+        if len(self.spans) < settings.TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds per span kind ("db", "router", ...), top-level spans of each kind only."""
+        totals: Dict[str, float] = {}
+        kinds = {s.span_id: s.name.split(".", 1)[0] for s in self.spans}
+        for s in self.spans:
+            kind = kinds[s.span_id]
+            if kinds.get(s.parent_id) != kind:
+                totals[kind] = totals.get(kind, 0.0) + s.duration_ms
+        return {kind: round(ms, 1) for kind, ms in sorted(totals.items(), key=lambda kv: -kv[1])}
+
+    def to_dict(self) -> dict:
+        start = self.root.start_ns
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(start / 1e9)) + f".{start // 1_000_000 % 1000:03d}Z",
+            "duration_ms": round(self.root.duration_ms, 2),
+            "attrs": self.root.attrs,
+            "breakdown_ms": self.breakdown(),
+            "dropped_spans": self.dropped,
+            "spans": [
+                {
+                    "span_id": s.span_id,
+                    "parent_id": s.parent_id,
+                    "name": s.name,
+                    "offset_ms": round((s.start_ns - start) / 1e6, 2),
+                    "duration_ms": round(s.duration_ms, 2),
+                    "attrs": s.attrs,
+                }
+                for s in sorted(self.spans, key=lambda s: s.start_ns)
+            ],
+        }
+
+    def to_otlp(self) -> dict:
+        def attributes(attrs: dict) -> list:
+            return [{"key": k, "value": {"stringValue": str(v)}} for k, v in attrs.items()]
+
+        spans = []
+        for s in [self.root, *self.spans]:
+            span = {
+                "traceId": self.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 2 if s is self.root else 1,  # SERVER / INTERNAL
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns or s.start_ns),
+                "attributes": attributes(s.attrs),
+            }
+            if s.parent_id:
+                span["parentSpanId"] = s.parent_id
+            spans.append(span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": attributes({"service.name": settings.PROJECT_NAME})},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]}
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as a child of the current span. A no-op outside a traced request."""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _span.get()
+    s = Span(name, parent.span_id if parent else trace.root.span_id, attrs)
+    token = _span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _span.reset(token)
+        trace.add(s)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attrs) -> None:
+    """Add an already finished span (for callbacks that cannot wrap the work)."""
+    trace = _trace.get()
+    if trace is None:
+        return
+    parent = _span.get()
+    s = Span(name, parent.span_id if parent else trace.root.span_id, attrs)
+    s.start_ns, s.end_ns = start_ns, end_ns
+    trace.add(s)
+
+
+def detached_task(coro) -> asyncio.Task:
+    """Start ``coro`` as a task in an empty context, outside the current request."""
+    return contextvars.Context().run(asyncio.get_running_loop().create_task, coro)
+
+
+_TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def incoming_trace_id(x_trace_id: Optional[str], traceparent: Optional[str]) -> Optional[str]:
+    if x_trace_id and _TRACE_ID.match(x_trace_id.lower()):
+        return x_trace_id.lower()
+    if traceparent:
+        # W3C: version-traceid-parentid-flags
+        parts = traceparent.split("-")
+        if len(parts) == 4 and _TRACE_ID.match(parts[1].lower()):
+            return parts[1].lower()
+    return None
+
+
+def start_trace(name: str, trace_id: Optional[str] = None):
+    trace = Trace(trace_id or uuid.uuid4().hex, name)
+    return trace, (_trace.set(trace), _span.set(trace.root))
+
+
+def end_at_response_start(trace: Trace) -> None:
+    """End the root span now, for responses that stream until the client leaves."""
+    trace.root.end_ns = time.time_ns()
+
+
+def finish_trace(trace: Trace, tokens) -> None:
+    if trace.root.end_ns is None:
+        trace.root.end_ns = time.time_ns()
+    _trace.reset(tokens[0])
+    _span.reset(tokens[1])
+    if trace.root.duration_ms >= settings.TRACE_SLOW_MS:
+        breakdown = ", ".join(f"{kind} {ms:.0f}ms" for kind, ms in trace.breakdown().items())
+        logger.warning("Slow request %s %.0fms (trace %s): %s", trace.root.name,
+                       trace.root.duration_ms, trace.trace_id, breakdown or "no spans")
+        _exporter.submit(trace)
+
+
+class _Exporter:
+    """Writes slow traces from a daemon thread; drops them if it falls behind."""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=1000)
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def submit(self, trace: Trace) -> None:
+        if not (settings.TRACE_EXPORT_PATH or settings.TRACE_OTLP_ENDPOINT):
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                return
+            try:
+                self._export(trace)
+            except Exception as e:
+                logger.debug("Trace export failed: %s", e)
+
+    def _export(self, trace: Trace) -> None:
+        if settings.TRACE_EXPORT_PATH:
+            # One write per line in append mode, so workers sharing the file do not interleave.
+            with open(settings.TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace.to_dict(), default=str) + "\n")
+        if settings.TRACE_OTLP_ENDPOINT:
+            request = urllib.request.Request(
+                settings.TRACE_OTLP_ENDPOINT,
+                data=json.dumps(trace.to_otlp(), default=str).encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Export what is queued and stop the thread (shutdown)."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+
+_exporter = _Exporter()
+flush = _exporter.flush
+
+
+def instrument_engine(engine) -> None:
+    """Record every DB statement as a ``db.<VERB>`` span."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _trace.get() is not None:
+            conn.info.setdefault("trace_starts", []).append(time.time_ns())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("trace_starts")
+        if _trace.get() is None or not starts:
+            return
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        record_span(f"db.{verb}", starts.pop(), time.time_ns(), sql=statement[:200])
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("trace_starts"):
+            conn.info["trace_starts"].pop()
@@ -1,29 +1,99 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse, JSONResponse
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel
+from starlette.concurrency import run_in_threadpool
 from .core.config import settings
-from .routers import auth, regions, me, admin
-from .core.audit_logging import configure_audit_logging, set_audit_context, reset_audit_context
-import os
+from .core.startup import init_lock, profiler, schema_fingerprint, Readiness
+from .core.responses import DefaultJSONResponse
+profiler.record("import framework", time.perf_counter() - _import_started)
+
+with profiler.phase("import core"):
+    from .core.deps import engine, read_engine
+    from .core.audit_logging import configure_audit_logging
+    from .core.middleware import RequestContextMiddleware
+    from .core import tracing
+    from .models.database import SchemaFingerprint
+with profiler.phase("import routers"):
+    from .routers import auth, regions, me, admin
+    from .core.scheduler import scheduler
+    from .services import drain, peer_history, stats, routeros_async
+import asyncio
 import logging
-from uuid import UUID
-
-# Database setup
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False}
-    if settings.DATABASE_URL.startswith("sqlite")
-    else {},
-)
+import os
+
+# /ready stays 503 until every step has run (see warm_up).
+readiness = Readiness("schema", "db_pool", "node_cache", "lazy_imports")
+# A failed warm-up step is retried with exponential backoff up to this delay,
+# so a worker that started while the DB was unreachable still becomes ready.
+WARM_UP_RETRY_START = 1.0
+WARM_UP_RETRY_MAX = 30.0
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    # Every worker runs the startup hook; only one at a time touches the schema.
+    with init_lock():
+        fingerprint = schema_fingerprint(SQLModel.metadata, engine)
+        try:
+            with Session(engine) as session:
+                stored = session.get(SchemaFingerprint, 1)
+                if stored and stored.fingerprint == fingerprint:
+                    logging.getLogger(__name__).debug("Schema unchanged, skipping create_all")
+                    return
+        except Exception:
+            pass  # First run: the fingerprint table does not exist yet.
+
+        SQLModel.metadata.create_all(engine)
+        # create_all skips tables that already exist, and with them any index added later.
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
+        with Session(engine) as session:
+            session.merge(SchemaFingerprint(id=1, fingerprint=fingerprint))
+            session.commit()
+
+async def warm_up():
+    """Fill pools and caches in the background so the first clients don't pay for it."""
+    def fill_db_pool():
+        # Open (and return to the pool) as many connections as the pool keeps.
+        for pool_engine in {engine, read_engine}:
+            connections = [pool_engine.connect() for _ in range(pool_engine.pool.size())]
+            for conn in connections:
+                conn.execute(text("SELECT 1"))
+                conn.close()
+
+    def fill_node_cache():
+        with Session(engine) as session:
+            regions._nodes_cache.get(session, regions._load_up_nodes)
+
+    def lazy_imports():
+        import jose.jwt  # noqa: F401
+        import routeros_api  # noqa: F401
+
+    for step, fn in (("db_pool", fill_db_pool), ("node_cache", fill_node_cache), ("lazy_imports", lazy_imports)):
+        delay = WARM_UP_RETRY_START
+        while True:
+            try:
+                with profiler.phase(f"warm {step}"):
+                    await run_in_threadpool(fn)
+                readiness.mark(step)
+                break
+            except Exception:
+                logging.getLogger(__name__).exception("Warm-up step '%s' failed, retrying in %.0fs", step, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, WARM_UP_RETRY_MAX)
+
+    profiler.log_report()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=DefaultJSONResponse,
 )
 
 # Set all CORS enabled origins
@@ -35,78 +105,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Gate non-admin API routes by client version.
-# This keeps the browser-based admin UI working while forcing the desktop client to update.
-@app.middleware("http")
-async def enforce_client_version(request: Request, call_next):
-    path = request.url.path
-
-    if path.startswith(settings.API_V1_STR):
-        # Allow admin endpoints (used by the Admin UI in a browser).
-        if path.startswith(f"{settings.API_V1_STR}/admin"):
-            return await call_next(request)
-
-        # Allow auth endpoints (Admin UI login uses /auth/login).
-        if path.startswith(f"{settings.API_V1_STR}/auth"):
-            return await call_next(request)
-
-        # Allow OpenAPI for debugging.
-        if path == f"{settings.API_V1_STR}/openapi.json":
-            return await call_next(request)
-
-        client_version = request.headers.get("X-Client-Version")
-        if client_version != settings.REQUIRED_CLIENT_VERSION:
-            return JSONResponse(
-                status_code=426,
-                headers={"X-Required-Client-Version": settings.REQUIRED_CLIENT_VERSION},
-                content={
-                    "detail": "Client version not supported",
-                    "required_version": settings.REQUIRED_CLIENT_VERSION,
-                    "provided_version": client_version,
-                },
-            )
-
-    return await call_next(request)
-
-
-@app.middleware("http")
-async def audit_request_logs(request: Request, call_next):
-    # Attach minimal context so audit log records can be attributed.
-    token = None
-    token_path = None
-    try:
-        path = request.url.path
-        user_id = None
-
-        auth = request.headers.get("authorization")
-        if auth and auth.lower().startswith("bearer "):
-            try:
-                from jose import jwt
-                from .core.security import ALGORITHM
-
-                token_str = auth.split(" ", 1)[1].strip()
-                payload = jwt.decode(token_str, settings.SECRET_KEY, algorithms=[ALGORITHM])
-                sub = payload.get("sub")
-                if sub:
-                    user_id = UUID(str(sub))
-            except Exception:
-                user_id = None
+if settings.GZIP_ENABLED:
+    app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_SIZE, compresslevel=settings.GZIP_LEVEL)
 
-        token, token_path = set_audit_context(user_id=user_id, path=path)
-
-        logging.info("HTTP %s %s", request.method, path)
-        response = await call_next(request)
-        logging.info("HTTP %s %s -> %s", request.method, path, getattr(response, "status_code", "?"))
-        return response
-    finally:
-        if token is not None and token_path is not None:
-            reset_audit_context(token, token_path)
+# Gate non-admin API routes by client version and attach audit context.
+# This keeps the browser-based admin UI working while forcing the desktop client to update.
+app.add_middleware(RequestContextMiddleware)
 
 
 @app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
-    configure_audit_logging(engine)
+async def on_startup():
+    with profiler.phase("create_db_and_tables"):
+        create_db_and_tables()
+    readiness.mark("schema")
+    with profiler.phase("configure_audit_logging"):
+        configure_audit_logging(engine)
+    # Keep a reference so the task is not garbage collected.
+    app.state.warm_up_task = asyncio.get_running_loop().create_task(warm_up())
+    if settings.SCHEDULER_ENABLED:
+        scheduler.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.warm_up_task.cancel()  # May still be retrying a step
+    await scheduler.stop()
+    await routeros_async.close_all()
+    await run_in_threadpool(tracing.flush)
+
+# Periodic jobs; each runs on one worker at a time (see core/scheduler.py).
+# Continue node drains interrupted by a crash or restart.
+scheduler.add("drain-resume", drain.resume_stale_drains, interval=settings.DRAIN_LEASE_SECONDS, timeout=30)
+# Check the dashboard counters against the source tables (and fix drift).
+scheduler.add(stats.VERIFY_JOB, stats.run_verification, interval=settings.STATS_VERIFY_INTERVAL, timeout=300)
+# Move revoked peers out of the hot peer table.
+scheduler.add("peer-history-compact", peer_history.compact, interval=settings.PEER_HISTORY_COMPACT_INTERVAL, timeout=300)
 
 # Serve Admin UI
 # Ensure the directory exists
@@ -127,3 +159,10 @@ app.include_router(admin.router, prefix=f"{settings.API_V1_STR}/admin", tags=["a
 @app.get("/")
 def root():
     return {"message": "WireGuard Account Manager API is running", "v": "1.0.0"}
+
+@app.get("/ready")
+def ready():
+    # For load balancers / health checks: 200 only once pools and caches are warm.
+    if not readiness.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "pending": readiness.pending})
+    return {"status": "ready", "startup": profiler.report()}
@@ -1,8 +1,13 @@
 from datetime import datetime
 from typing import Optional, List
 from uuid import UUID, uuid4
+from sqlalchemy import Index, text
 from sqlmodel import Field, SQLModel, Relationship
 
+# Predicates of the partial indexes over the hot set of peers.
+_ACTIVE = text("status = 'ACTIVE'")
+_MIGRATED = text("status = 'MIGRATED'")
+
 class Region(SQLModel, table=True):
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     code: str = Field(unique=True, index=True) # US, MX, PT
@@ -32,7 +37,7 @@ class Node(SQLModel, table=True):
     mt_api_port: int = Field(default=8750)
     admin_only: bool = Field(default=False)
     
-    status: str = Field(default="UP") # UP, DOWN, MAINTENANCE
+    status: str = Field(default="UP") # UP, DOWN, MAINTENANCE, DRAINING
     priority: int = Field(default=1)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -54,20 +59,99 @@ class User(SQLModel, table=True):
     peers: List["WireGuardPeer"] = Relationship(back_populates="user")
 
 class WireGuardPeer(SQLModel, table=True):
+    # Hot set: ACTIVE and MIGRATED peers, plus REVOKED rows until
+    # services/peer_history.py moves them to WireGuardPeerHistory.
+    __table_args__ = (
+        # "Active peer of this user (on this node)", see WireGuardService
+        Index("ix_wireguardpeer_active_user", "user_id", "node_id", sqlite_where=_ACTIVE, postgresql_where=_ACTIVE),
+        # "Active peers on this node" (drain, stats)
+        Index("ix_wireguardpeer_active_node", "node_id", sqlite_where=_ACTIVE, postgresql_where=_ACTIVE),
+        # "Peers of this user kept on a drained node", checked on every provision
+        Index("ix_wireguardpeer_migrated_user", "user_id", sqlite_where=_MIGRATED, postgresql_where=_MIGRATED),
+    )
+
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     user_id: UUID = Field(foreign_key="user.id")
     node_id: UUID = Field(foreign_key="node.id")
     client_public_key: str
     assigned_ip: str
-    status: str = Field(default="ACTIVE") # ACTIVE, REVOKED
+    status: str = Field(default="ACTIVE") # ACTIVE, MIGRATED (moved, source cleanup pending), REVOKED
     provisioned_at: datetime = Field(default_factory=datetime.utcnow)
     
     user: User = Relationship(back_populates="peers")
     node: Node = Relationship(back_populates="peers")
 
+class WireGuardPeerHistory(SQLModel, table=True):
+    # Append-only archive of revoked peers, see services/peer_history.py
+    id: UUID = Field(primary_key=True)  # Same id the row had in wireguardpeer
+    user_id: UUID = Field(index=True)  # No FKs: history outlives users and nodes
+    node_id: UUID = Field(index=True)
+    client_public_key: str
+    assigned_ip: str
+    provisioned_at: datetime
+    archived_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
 class AuditLog(SQLModel, table=True):
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     user_id: Optional[UUID] = Field(default=None, foreign_key="user.id")
     action: str
     details: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CacheGeneration(SQLModel, table=True):
+    # Cross-worker invalidation counter, see core/generations.py
+    name: str = Field(primary_key=True)
+    generation: int = Field(default=0)
+
+class StatCounter(SQLModel, table=True):
+    # Incrementally maintained dashboard counter, see services/stats.py
+    key: str = Field(primary_key=True)  # e.g. "peers:node:<id>", "logins:2024-01-31T09"
+    value: int = Field(default=0)
+
+class SchemaFingerprint(SQLModel, table=True):
+    # Hash of the model DDL at the last create_all (see main.create_db_and_tables)
+    id: int = Field(default=1, primary_key=True)
+    fingerprint: str
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
+
+class NodeEvent(SQLModel, table=True):
+    # Node availability change log streamed to clients (see services/node_events.py)
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    node_id: UUID = Field(index=True)  # No FK: "removed" events outlive the node
+    kind: str  # added, updated, removed, full, available, reprovision (per user)
+    payload: str  # JSON snapshot of the node after the change (plus user_id for per-user events)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class NodeDrain(SQLModel, table=True):
+    # Node drain / peer migration job, see services/drain.py
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    node_id: UUID = Field(index=True)  # No FK: the job history outlives the node
+    status: str = Field(default="RUNNING")  # RUNNING, COMPLETED, FAILED, CANCELLED
+    batch_size: int = Field(default=20)
+    batch_interval: float = Field(default=1.0)  # seconds between batches
+    total_peers: int = Field(default=0)
+    migrated: int = Field(default=0)
+    failed: int = Field(default=0)
+    last_error: Optional[str] = Field(default=None)
+    owner: Optional[str] = Field(default=None)  # worker running the job (host:pid)
+    heartbeat_at: Optional[datetime] = Field(default=None)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = Field(default=None)
+
+class JobLease(SQLModel, table=True):
+    # Which worker runs a scheduled job, and when it is due next (see core/scheduler.py)
+    name: str = Field(primary_key=True)
+    owner: Optional[str] = Field(default=None)  # worker holding the lease (host:pid)
+    expires_at: Optional[datetime] = Field(default=None)
+    next_run_at: Optional[datetime] = Field(default=None)
+
+class JobRun(SQLModel, table=True):
+    # Run history of scheduled jobs
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job: str = Field(index=True)
+    owner: str
+    status: str  # RUNNING, OK, FAILED, TIMEOUT
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = Field(default=None)
+    duration_ms: Optional[float] = Field(default=None)
+    result: Optional[str] = Field(default=None)  # JSON of the job's return value, or the error
@@ -1,11 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, WebSocket
+from sqlmodel import Session, select, func
 from typing import List
-from ..core.deps import get_session
-from ..models.database import User, Region, Node, AuditLog, WireGuardPeer
+from ..core.deps import get_read_session, get_session
+from ..models.database import User, Region, Node, AuditLog, WireGuardPeer, NodeDrain
 from ..core.security import get_password_hash
+from ..core.generations import bump_generation, NODE_LIST
+from ..services.node_events import publish_node_event, ADDED, UPDATED, REMOVED
+from ..services import audit_stream, drain, stats
+from ..services.circuit_breaker import all_breakers
+from ..services.bulkhead import all_bulkheads
+from ..core.config import settings
+from ..core import sql_profiler
+from ..core.scheduler import scheduler, run_now, job_runs
+from ..core.responses import json_rows
+from ..schemas.admin import UserRead, NodeRead, AuditLogRead, column_list, rows_as_dicts
+from ..schemas.region import RegionRead
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 import uuid
+from datetime import datetime
 
 router = APIRouter()
 
@@ -41,35 +54,47 @@ async def create_user(user_in: UserCreate, session: Session = Depends(get_sessio
         role=user_in.role
     )
     session.add(user)
+    stats.incr(session, stats.USERS_TOTAL)
     session.commit()
     return {"message": "User created"}
 
-@router.post("/regions")
+@router.post("/regions", response_model=RegionRead)
 async def create_region(region_in: RegionCreate, session: Session = Depends(get_session)):
     region = Region(**region_in.dict())
     session.add(region)
+    bump_generation(session, NODE_LIST)
     session.commit()
+    session.refresh(region)
     return region
 
-@router.post("/nodes")
+@router.post("/nodes", response_model=NodeRead)
 async def create_node(node_in: NodeCreate, session: Session = Depends(get_session)):
     node = Node(**node_in.dict())
     session.add(node)
+    publish_node_event(session, ADDED, node)
     session.commit()
+    session.refresh(node)
     return node
 
-@router.patch("/nodes/{node_id}")
+@router.patch("/nodes/{node_id}", response_model=NodeRead)
 async def update_node(node_id: uuid.UUID, node_in: dict, session: Session = Depends(get_session)):
     node = session.get(Node, node_id)
     if not node:
         raise HTTPException(status_code=404, detail="Node not found")
     
+    old_region_id = node.region_id
     for key, value in node_in.items():
+        # Listings never send mt_pass back, so an empty value means "unchanged".
+        if key == "mt_pass" and not value:
+            continue
         if key == "region_id" and isinstance(value, str):
             value = uuid.UUID(value)
         setattr(node, key, value)
         
     session.add(node)
+    if node.region_id != old_region_id:
+        stats.node_moved(session, node, old_region_id)
+    publish_node_event(session, UPDATED, node)
     session.commit()
     session.refresh(node)
     return node
@@ -84,13 +109,70 @@ async def delete_node(node_id: uuid.UUID, session: Session = Depends(get_session
     peers = session.exec(select(WireGuardPeer).where(WireGuardPeer.node_id == node_id)).all()
     for peer in peers:
         session.delete(peer)
+    stats.node_deleted(session, node, sum(1 for peer in peers if peer.status == "ACTIVE"))
     
+    publish_node_event(session, REMOVED, node)
     session.delete(node)
     session.commit()
     return {"message": "Node deleted and associated peers cleared"}
 
 from ..services.wireguard import WireGuardService
 
+class DrainRequest(BaseModel):
+    batch_size: int = settings.DRAIN_BATCH_SIZE
+    batch_interval: float = settings.DRAIN_BATCH_INTERVAL
+
+def _drain_status(job: NodeDrain, session: Session) -> dict:
+    node = session.get(Node, job.node_id)
+    remaining = session.exec(
+        select(func.count(WireGuardPeer.id))
+        .where(WireGuardPeer.node_id == job.node_id)
+        .where(WireGuardPeer.status == "ACTIVE")
+    ).one()
+    return {**job.dict(), "node_name": node.name if node else None, "remaining": remaining}
+
+@router.post("/nodes/{node_id}/drain")
+async def drain_node(node_id: uuid.UUID, drain_in: DrainRequest = DrainRequest(), session: Session = Depends(get_session)):
+    node = session.get(Node, node_id)
+    if not node:
+        raise HTTPException(status_code=404, detail="Node not found")
+    if drain_in.batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be at least 1")
+    # Well inside the job lease, so a pause between batches never looks like a dead worker.
+    max_interval = settings.DRAIN_LEASE_SECONDS / 4
+    if not 0 <= drain_in.batch_interval <= max_interval:
+        raise HTTPException(status_code=400, detail=f"batch_interval must be between 0 and {max_interval:g} seconds")
+
+    job = drain.start_drain(session, node, drain_in.batch_size, drain_in.batch_interval)
+    drain.launch(job.id)
+    return _drain_status(job, session)
+
+@router.get("/drains")
+async def list_drains(session: Session = Depends(get_read_session)):
+    jobs = session.exec(select(NodeDrain).order_by(NodeDrain.created_at.desc()).limit(50)).all()
+    return [_drain_status(job, session) for job in jobs]
+
+@router.get("/drains/{drain_id}")
+async def get_drain(drain_id: uuid.UUID, session: Session = Depends(get_read_session)):
+    job = session.get(NodeDrain, drain_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Drain not found")
+    return _drain_status(job, session)
+
+@router.post("/drains/{drain_id}/cancel")
+async def cancel_drain(drain_id: uuid.UUID, session: Session = Depends(get_session)):
+    job = session.get(NodeDrain, drain_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Drain not found")
+    if job.status != drain.RUNNING:
+        raise HTTPException(status_code=400, detail=f"Drain is already {job.status}")
+    # The running worker notices at its next lease renewal; the node stays DRAINING.
+    job.status = drain.CANCELLED
+    job.finished_at = datetime.utcnow()
+    session.add(job)
+    session.commit()
+    return {"message": "Drain cancelled"}
+
 @router.post("/users/{user_id}/reset-device")
 async def reset_device(user_id: uuid.UUID, session: Session = Depends(get_session)):
     user = session.get(User, user_id)
@@ -134,20 +216,21 @@ async def delete_user(user_id: uuid.UUID, session: Session = Depends(get_session
         session.delete(peer)
         
     session.delete(user)
+    stats.incr(session, stats.USERS_TOTAL, -1)
     session.commit()
     return {"message": "User and associated peers deleted from DB and MikroTik"}
 
-@router.get("/users")
-async def list_users(session: Session = Depends(get_session)):
-    return session.exec(select(User)).all()
+@router.get("/users", response_model=List[UserRead])
+async def list_users(session: Session = Depends(get_read_session)):
+    return json_rows(rows_as_dicts(session.exec(select(*column_list(User, UserRead))).all()))
 
-@router.get("/nodes")
-async def list_nodes(session: Session = Depends(get_session)):
-    return session.exec(select(Node)).all()
+@router.get("/nodes", response_model=List[NodeRead])
+async def list_nodes(session: Session = Depends(get_read_session)):
+    return json_rows(rows_as_dicts(session.exec(select(*column_list(Node, NodeRead))).all()))
 
-@router.get("/regions")
-async def admin_list_regions(session: Session = Depends(get_session)):
-    return session.exec(select(Region)).all()
+@router.get("/regions", response_model=List[RegionRead])
+async def admin_list_regions(session: Session = Depends(get_read_session)):
+    return json_rows(rows_as_dicts(session.exec(select(*column_list(Region, RegionRead))).all()))
 
 @router.delete("/regions/{region_id}")
 async def delete_region(region_id: uuid.UUID, session: Session = Depends(get_session)):
@@ -162,9 +245,63 @@ async def delete_region(region_id: uuid.UUID, session: Session = Depends(get_ses
         raise HTTPException(status_code=400, detail="Cannot delete region with associated nodes")
         
     session.delete(region)
+    bump_generation(session, NODE_LIST)
     session.commit()
     return {"message": "Region deleted"}
 
-@router.get("/audit-logs")
-async def get_logs(session: Session = Depends(get_session)):
-    return session.exec(select(AuditLog).order_by(AuditLog.created_at.desc())).all()
+@router.get("/stats")
+async def get_stats(session: Session = Depends(get_read_session)):
+    return stats.read_stats(session)
+
+@router.post("/stats/verify")
+async def verify_stats():
+    # Recount from the source tables now instead of waiting for the next periodic check.
+    return await run_in_threadpool(stats.run_verification)
+
+@router.get("/breakers")
+async def list_breakers():
+    # State of the router circuit breakers in the worker serving this request.
+    return all_breakers()
+
+@router.get("/bulkheads")
+async def list_bulkheads():
+    # Concurrency and queue depth of router calls in the worker serving this request.
+    return all_bulkheads()
+
+@router.get("/sql-profile")
+async def get_sql_profile(limit: int = 50, order: str = "total_ms"):
+    # Statement timings in the worker serving this request, grouped by statement shape.
+    return sql_profiler.report(limit, order)
+
+@router.post("/sql-profile/reset")
+async def reset_sql_profile():
+    sql_profiler.reset()
+    return {"message": "SQL profile reset"}
+
+@router.get("/jobs")
+async def list_jobs(session: Session = Depends(get_read_session)):
+    return scheduler.status(session)
+
+@router.get("/jobs/{name}/runs")
+async def list_job_runs(name: str, limit: int = 20, session: Session = Depends(get_read_session)):
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_runs(session, name, min(limit, settings.SCHEDULER_HISTORY))
+
+@router.post("/jobs/{name}/run")
+async def trigger_job(name: str, session: Session = Depends(get_session)):
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Runs on the job's leader at its next tick, not necessarily in this worker.
+    run_now(session, name)
+    return {"message": f"Job {name} scheduled"}
+
+@router.get("/audit-logs", response_model=List[AuditLogRead])
+async def get_logs(session: Session = Depends(get_read_session)):
+    statement = select(*column_list(AuditLog, AuditLogRead)).order_by(AuditLog.created_at.desc())
+    return json_rows(rows_as_dicts(session.exec(statement).all()))
+
+@router.websocket("/audit-logs/stream")
+async def stream_logs(websocket: WebSocket):
+    # Authenticated by the handshake message: browsers cannot set headers on a WebSocket.
+    await audit_stream.stream_audit(websocket)
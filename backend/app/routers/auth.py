@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import Session, select
 from ..core import security
 from ..core.deps import get_session
+from ..core.rate_limit import enforce_rate_limit
 from ..models.database import User, AuditLog
+from ..services import stats
 from ..schemas.token import Token
 from datetime import datetime
 
@@ -11,9 +13,13 @@ router = APIRouter()
 
 @router.post("/login", response_model=Token)
 async def login(
+    request: Request,
     session: Session = Depends(get_session),
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
+    # Throttle before touching the DB or bcrypt.
+    await enforce_rate_limit("login", request, username=form_data.username)
+
     statement = select(User).where(User.username == form_data.username)
     user = session.exec(statement).first()
     
@@ -35,6 +41,7 @@ async def login(
             created_at=datetime.utcnow(),
         )
     )
+    stats.count_event(session, stats.LOGINS)
     session.commit()
 
     access_token = security.create_access_token(subject=user.id)
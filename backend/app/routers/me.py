@@ -1,17 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from sqlmodel import Session, select
 from typing import Optional
 from ..core.deps import get_session
 from ..models.database import User, Region, Node, WireGuardPeer
-from ..services.wireguard import WireGuardService
-from ..core.security import ALGORITHM
+from ..services.wireguard import WireGuardService, RouterUnavailable
+from ..core.deadlines import Budget, DeadlineExceeded, RequestCancelled, request_budget
+from ..core.security import decode_access_token, InvalidTokenError
 from ..core.config import settings
-from jose import jwt, JWTError
+from ..core.rate_limit import enforce_rate_limit
 from fastapi.security import OAuth2PasswordBearer
+import logging
 import uuid
 from datetime import datetime
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
 async def get_current_user(
@@ -19,11 +22,11 @@ async def get_current_user(
     token: str = Depends(reusable_oauth2)
 ) -> User:
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=403, detail="Could not validate credentials")
-    except JWTError:
+    except InvalidTokenError:
         raise HTTPException(status_code=403, detail="Could not validate credentials")
     
     user = session.get(User, uuid.UUID(user_id))
@@ -49,12 +52,16 @@ async def set_preferred_region(
 
 @router.post("/wireguard-config")
 async def get_wg_config(
+    request: Request,
     public_key: str = Body(..., embed=True),
     device_id: str = Body(..., embed=True),
     region: Optional[str] = Body(None, embed=True),
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    budget: Budget = Depends(request_budget)
 ):
+    await enforce_rate_limit("wireguard-config", request, user_id=str(current_user.id), device_id=device_id)
+
     # Enforce 1 device rule globally
     if current_user.device_id and current_user.device_id != device_id:
         raise HTTPException(status_code=403, detail="Device lock active. Contact admin to reset.")
@@ -109,7 +116,26 @@ async def get_wg_config(
     if not selected_node:
         raise HTTPException(status_code=503, detail="No available nodes.")
         
-    peer = await wg_service.provision_peer(current_user, selected_node, public_key)
+    # If the node's router is down (or its breaker is open), place the user on
+    # the next best node of the same region instead of failing.
+    tried = []
+    while True:
+        try:
+            peer = await wg_service.provision_peer(current_user, selected_node, public_key)
+            break
+        except RequestCancelled:
+            raise HTTPException(status_code=499, detail="Client closed request")
+        except DeadlineExceeded:
+            raise HTTPException(status_code=504, detail="Request deadline exceeded")
+        except RouterUnavailable as e:
+            tried.append(selected_node.id)
+            fallback = None
+            if len(tried) < settings.PLACEMENT_MAX_ATTEMPTS:
+                fallback = wg_service.get_best_node(selected_node.region.code, current_user.role, exclude=tried)
+            if not fallback:
+                raise
+            logger.warning("Placement: %s unavailable (%s), trying %s", selected_node.name, e.detail, fallback.name)
+            selected_node = fallback
     
     # Generate .conf content (Client-side PrivateKey NOT included!)
     conf = f"""[Interface]
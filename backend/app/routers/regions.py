@@ -1,41 +1,61 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
-from typing import List
-from ..core.deps import get_session, get_current_user
-from ..models.database import Region, User
+from starlette.concurrency import run_in_threadpool
+from typing import List, Tuple
+from ..core.deps import engine, get_read_session, get_current_user, reusable_oauth2
+from ..core.generations import GenerationCache, NODE_LIST
+from ..models.database import Node, Region, User
+from ..services.node_events import client_node, is_available, node_snapshot, stream_node_events
 from ..schemas.region import RegionRead
 
 router = APIRouter()
 
+# Shared by every request in this worker; reloaded when NODE_LIST is bumped.
+_nodes_cache = GenerationCache(NODE_LIST)
+
+
+def _load_up_nodes(session: Session) -> List[dict]:
+    rows = session.exec(
+        select(Node, Region).join(Region).where(Node.status == "UP")
+    ).all()
+    return [node_snapshot(node, region) for node, region in rows]
+
 @router.get("/", response_model=List[dict])
 async def list_available_nodes_for_client(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: User = Depends(get_current_user) 
 ):
-    from ..models.database import Node
-    
-    # 1. Base query: Active nodes with capacity
-    query = (
-        select(Node)
-        .where(Node.status == "UP")
-        .where(Node.current_peers < Node.max_capacity)
-    )
-    
-    # 2. Filter admin_only if user is not ADMIN
-    if current_user.role != "ADMIN":
-        query = query.where(Node.admin_only == False)
-
-    nodes = session.exec(query).all()
-    
-    # 3. Return simplified structure for client dropdown
+    # Active nodes with capacity, admin_only hidden from non-admins.
+    # Return simplified structure for client dropdown
     # We return region_code inside the object for backward compatibility or potential UI grouping
-    results = []
-    for node in nodes:
-        results.append({
-            "id": str(node.id),
-            "name": f"{node.name} ({node.region.code})", # Display Name: "Miami-01 (US)"
-            "region_code": node.region.code,
-            "country_name": node.region.name
-        })
-        
-    return results
+    return [
+        client_node(n) for n in _nodes_cache.get(session, _load_up_nodes)
+        if is_available(n, current_user.role)
+    ]
+
+@router.get("/events")
+async def node_availability_events(
+    request: Request,
+    token: str = Depends(reusable_oauth2),
+):
+    """Server-Sent Events: node added/updated/removed/full/available, plus
+    ``reprovision`` when a drain moved the caller's peer to another node.
+
+    The first message is a ``snapshot`` of the visible nodes unless the client
+    resumes with ``Last-Event-ID`` (then only the missed events are sent).
+    """
+    # Own short-lived session: the stream stays open for hours and must not hold a pooled connection.
+    def current_user() -> Tuple[str, str]:
+        with Session(engine) as session:
+            user = get_current_user(session, token)
+            return user.role, str(user.id)
+
+    role, user_id = await run_in_threadpool(current_user)
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    last_seq = int(last_event_id) if last_event_id.isdigit() else None
+    return StreamingResponse(
+        stream_node_events(role, last_seq, _load_up_nodes, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
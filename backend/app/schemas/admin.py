@@ -0,0 +1,69 @@
+from datetime import datetime
+from typing import List, Optional, Type
+from uuid import UUID
+
+from pydantic import BaseModel
+
+# Read schemas for the admin listings. Each one names exactly the columns the
+# admin panel shows; column_list() turns it into the SELECT list so secrets
+# (password_hash, mt_pass) are never loaded, let alone sent.
+
+
+class UserRead(BaseModel):
+    id: UUID
+    username: str
+    role: str
+    device_id: Optional[str]
+    preferred_region_id: Optional[UUID]
+    is_active: bool
+    assigned_ip: Optional[str]
+    last_connection: Optional[datetime]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class NodeRead(BaseModel):
+    id: UUID
+    region_id: UUID
+    name: str
+    endpoint_host: str
+    endpoint_port: int
+    server_public_key: str
+    interface_name: str
+    ipv4_pool_cidr: str
+    allowed_ips: str
+    max_capacity: int
+    current_peers: int
+    mt_host: str
+    mt_user: str
+    mt_api_port: int
+    admin_only: bool
+    status: str
+    priority: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class AuditLogRead(BaseModel):
+    id: UUID
+    user_id: Optional[UUID]
+    action: str
+    details: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+def column_list(model, schema: Type[BaseModel]) -> List:
+    """The table columns backing ``schema``'s fields, in field order."""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+def rows_as_dicts(rows) -> List[dict]:
+    """Column-select rows to plain dicts (serialised directly, no ORM objects)."""
+    return [row._asdict() for row in rows]
@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from ..core.config import settings
+from ..core.deps import ReadSession, read_bind
+from ..core.security import decode_access_token, InvalidTokenError
+from ..core.tracing import detached_task
+from ..models.database import AuditLog, Node, User
+
+logger = logging.getLogger(__name__)
+
+# Live audit tail for the Admin UI (WebSocket /admin/audit-logs/stream).
+#
+# Every AuditLog row committed through an ORM session in this worker (the
+# provisioning/admin events and the DB log handler alike) is handed to the
+# worker's broker right after the commit and fanned out to the open streams.
+# With several workers, the broker also tails the table for rows written by the
+# others (AUDIT_STREAM_POLL_INTERVAL), skipping rows it has already seen.
+#
+# Each stream has a bounded queue: a consumer that falls AUDIT_STREAM_QUEUE_SIZE
+# records behind is sent ``lagged`` and disconnected, and reconnects with its
+# cursor. The cursor of a record is ``<created_at>|<id>``; a stream opened with
+# a cursor first replays the rows after it (at most AUDIT_STREAM_BACKLOG). Like
+# the table tail, the replay looks back AUDIT_STREAM_POLL_OVERLAP seconds
+# before the cursor for rows that committed late, so it may repeat records the
+# client already has: clients dedupe by record id.
+
+# Close codes
+CLOSE_BAD_HANDSHAKE = 4000
+CLOSE_FORBIDDEN = 4003
+CLOSE_LAGGED = 4009
+
+
+def record_of(log: AuditLog) -> dict:
+    return {
+        "id": str(log.id),
+        "user_id": str(log.user_id) if log.user_id else None,
+        "action": log.action,
+        "details": log.details,
+        "created_at": log.created_at.isoformat(),
+    }
+
+
+def cursor_of(record: dict) -> str:
+    return f"{record['created_at']}|{record['id']}"
+
+
+def parse_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    created_at, _, log_id = cursor.partition("|")
+    return datetime.fromisoformat(created_at), UUID(log_id)
+
+
+class Filters:
+    """``action`` entries ending in ``*`` or ``/`` match a prefix (e.g. ``LOG/``)."""
+
+    def __init__(self, actions: Iterable[str] = (), user_id: Optional[str] = None, node_name: Optional[str] = None):
+        self.actions = [a for a in actions if a]
+        self.user_id = user_id
+        self.node_name = node_name
+        # The whole name only: "Miami-01" must not match "Miami-010".
+        self._node = re.compile(rf"(?<![\w-]){re.escape(node_name)}(?![\w-])") if node_name else None
+
+    def match(self, record: dict) -> bool:
+        if self.actions and not any(
+            record["action"].startswith(a.rstrip("*")) if a.endswith(("*", "/")) else record["action"] == a
+            for a in self.actions
+        ):
+            return False
+        if self.user_id and record["user_id"] != self.user_id:
+            return False
+        # Audit records name the node in their details ("Provisioned on node Miami-01 ...").
+        if self._node and not self._node.search(record["details"]):
+            return False
+        return True
+
+    def where(self) -> list:
+        """The same filters as SQL conditions on AuditLog.
+
+        The node condition is a substring match: re-check rows with ``match``.
+        """
+        conditions = []
+        if self.actions:
+            conditions.append(or_(*(
+                AuditLog.action.startswith(a.rstrip("*"), autoescape=True) if a.endswith(("*", "/"))
+                else AuditLog.action == a
+                for a in self.actions
+            )))
+        if self.user_id:
+            conditions.append(AuditLog.user_id == UUID(self.user_id))
+        if self.node_name:
+            conditions.append(AuditLog.details.contains(self.node_name, autoescape=True))
+        return conditions
+
+
+class Subscription:
+    def __init__(self, filters: Filters, queue_size: int):
+        self.filters = filters
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=queue_size)
+        self.lagged = False
+
+
+class AuditBroker:
+    """Per-worker fan-out of committed audit records to open streams."""
+
+    SEEN = 10000  # ids remembered to skip records delivered twice (local feed + table tail)
+
+    def __init__(self, queue_size: int, poll_interval: float):
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self._subscribers: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._watermark: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, filters: Filters) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(filters, self.queue_size)
+        self._subscribers.add(subscription)
+        if settings.WORKERS > 1 and (self._task is None or self._task.done()):
+            # Shared by every subscriber: run it outside the subscribing request's context.
+            self._task = detached_task(self._tail(datetime.utcnow()))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def publish(self, records: List[dict]) -> None:
+        """Called after a commit, from any thread."""
+        loop = self._loop
+        if not self._subscribers or loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._dispatch, records)
+
+    def _dispatch(self, records: List[dict]) -> None:
+        for record in records:
+            if record["id"] in self._seen:
+                continue
+            self._seen[record["id"]] = None
+            if len(self._seen) > self.SEEN:
+                self._seen.popitem(last=False)
+            for subscription in list(self._subscribers):
+                if not subscription.filters.match(record):
+                    continue
+                try:
+                    subscription.queue.put_nowait(record)
+                except asyncio.QueueFull:
+                    # Slow consumer: stop feeding it, its stream ends and it resumes from its cursor.
+                    subscription.lagged = True
+                    self._subscribers.discard(subscription)
+
+    async def _tail(self, started: datetime) -> None:
+        self._watermark = started
+        while self._subscribers:
+            await asyncio.sleep(self.poll_interval)
+            # Rows are stamped before they commit, so look back a little (but not
+            # past the start: streams without a cursor begin with new records).
+            since = max(started, self._watermark - timedelta(seconds=settings.AUDIT_STREAM_POLL_OVERLAP))
+            try:
+                records = await run_in_threadpool(_records_since, since)
+            except Exception:
+                logger.exception("Audit tail poll failed")
+                continue
+            if records:
+                self._watermark = max(self._watermark, datetime.fromisoformat(records[-1]["created_at"]))
+                self._dispatch(records)
+
+
+broker = AuditBroker(settings.AUDIT_STREAM_QUEUE_SIZE, settings.AUDIT_STREAM_POLL_INTERVAL)
+
+
+# Feed: AuditLog rows flushed by any session, published once the session commits.
+
+@event.listens_for(OrmSession, "after_flush")
+def _collect(session, flush_context):
+    logs = [record_of(obj) for obj in session.new if isinstance(obj, AuditLog)]
+    if logs:
+        session.info.setdefault("audit_stream", []).extend(logs)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _publish(session):
+    records = session.info.pop("audit_stream", None)
+    if records:
+        broker.publish(records)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard(session):
+    session.info.pop("audit_stream", None)
+
+
+def _read_session() -> ReadSession:
+    return ReadSession(read_bind("GET", f"{settings.API_V1_STR}/admin/audit-logs/stream"))
+
+
+def _records_since(since: datetime) -> List[dict]:
+    with _read_session() as session:
+        logs = session.exec(
+            select(AuditLog).where(AuditLog.created_at >= since).order_by(AuditLog.created_at, AuditLog.id)
+        ).all()
+        return [record_of(log) for log in logs]
+
+
+def backlog(cursor: str, filters: Filters, limit: int) -> Tuple[List[dict], bool]:
+    """Records after ``cursor`` matching ``filters`` (oldest first), and whether some were skipped.
+
+    Starts AUDIT_STREAM_POLL_OVERLAP seconds before the cursor, see the module comment.
+    """
+    created_at, log_id = parse_cursor(cursor)
+    since = created_at - timedelta(seconds=settings.AUDIT_STREAM_POLL_OVERLAP)
+    records = []
+    with _read_session() as session:
+        logs = session.exec(
+            select(AuditLog)
+            .where(AuditLog.created_at >= since)
+            .where(AuditLog.id != log_id)
+            .where(*filters.where())
+            .order_by(AuditLog.created_at.desc(), AuditLog.id.desc())
+            .execution_options(yield_per=500)
+        )
+        for log in logs:
+            record = record_of(log)
+            if filters.match(record):
+                records.append(record)
+                if len(records) > limit:
+                    break
+    # Newest ``limit`` records; older ones are reported as a gap.
+    gap = len(records) > limit
+    records = records[:limit]
+    records.reverse()
+    return records, gap
+
+
+def node_name(node: str) -> Optional[str]:
+    """A node filter given as id or name, as the name found in audit details."""
+    try:
+        node_id = UUID(node)
+    except ValueError:
+        return node
+    with _read_session() as session:
+        found = session.get(Node, node_id)
+        return found.name if found else node
+
+
+def _is_admin(token: str) -> bool:
+    try:
+        user_id = UUID(decode_access_token(token).get("sub") or "")
+    except (InvalidTokenError, ValueError):
+        return False
+    with _read_session() as session:
+        user = session.get(User, user_id)
+        return bool(user and user.is_active and user.role == "ADMIN")
+
+
+def filters_of(raw: dict) -> Filters:
+    """Handshake filters: ``action`` (list or comma-separated), ``user`` (id), ``node`` (id or name)."""
+    actions = raw.get("action") or []
+    if isinstance(actions, str):
+        actions = actions.split(",")
+    user_id = raw.get("user") or None
+    if user_id:
+        user_id = str(UUID(user_id))
+    node = raw.get("node") or None
+    return Filters([a.strip() for a in actions], user_id, node_name(node) if node else None)
+
+
+async def _until_closed(websocket: WebSocket) -> None:
+    # Clients send nothing after the handshake; this only notices the disconnect.
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+async def stream_audit(websocket: WebSocket) -> None:
+    """Handshake ``{token, cursor?, filters?}``, the backlog after ``cursor``, then live records."""
+    await websocket.accept()
+    try:
+        hello = await asyncio.wait_for(websocket.receive_json(), settings.AUDIT_STREAM_HANDSHAKE_TIMEOUT)
+        if not await run_in_threadpool(_is_admin, str(hello.get("token") or "")):
+            await websocket.close(CLOSE_FORBIDDEN)
+            return
+        cursor = hello.get("cursor") or None
+        if cursor:
+            parse_cursor(cursor)
+        filters = await run_in_threadpool(filters_of, hello.get("filters") or {})
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, ValueError, TypeError, AttributeError):
+        await websocket.close(CLOSE_BAD_HANDSHAKE)
+        return
+
+    # Subscribe before reading the backlog so nothing committed in between is missed.
+    subscription = broker.subscribe(filters)
+    closed = asyncio.ensure_future(_until_closed(websocket))
+    try:
+        replayed = set()
+        if cursor:
+            records, gap = await run_in_threadpool(backlog, cursor, filters, settings.AUDIT_STREAM_BACKLOG)
+            if gap:
+                await websocket.send_json({"type": "gap"})
+            for record in records:
+                cursor = cursor_of(record)
+                replayed.add(record["id"])
+                await websocket.send_json({"type": "record", "cursor": cursor, "record": record})
+        await websocket.send_json({"type": "ready", "cursor": cursor})
+
+        while not (subscription.lagged and subscription.queue.empty()):
+            get = asyncio.ensure_future(subscription.queue.get())
+            await asyncio.wait({get, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if not get.done():
+                get.cancel()
+                return
+            record = get.result()
+            if record["id"] in replayed:
+                continue  # Already sent with the backlog
+            cursor = cursor_of(record)
+            await websocket.send_json({"type": "record", "cursor": cursor, "record": record})
+        await websocket.send_json({"type": "lagged", "cursor": cursor})
+        await websocket.close(CLOSE_LAGGED)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broker.unsubscribe(subscription)
+        closed.cancel()
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from ..core.config import settings
+from ..core.deadlines import Budget, DeadlineExceeded, RequestCancelled
+
+# Bulkheads around router calls, one per router (host:port), per worker.
+#
+# At most ROUTER_MAX_CONCURRENCY calls to a router run at once (each holding a
+# thread of the shared MikroTik executor with the thread driver); up to
+# ROUTER_MAX_QUEUE more wait in line and any further call is rejected at once.
+# A slot is freed when the call finishes, not when the caller stops waiting,
+# so a hung router can only ever pin its own ROUTER_MAX_CONCURRENCY slots.
+
+
+class BulkheadFull(Exception):
+    pass
+
+
+class RouterTimeout(Exception):
+    def __init__(self, message: str, abandoned: Optional[asyncio.Future] = None):
+        super().__init__(message)
+        # The call we stopped waiting for, if it had started: it may still
+        # complete on the router (see MikroTikService.add_peer).
+        self.abandoned = abandoned
+
+
+class Bulkhead:
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: deque = deque()
+        # Metrics
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.peak_queued = 0
+        self._wait_total = 0.0
+
+    async def acquire(self, timeout: float, budget: Optional[Budget] = None) -> float:
+        """Take a slot, waiting at most ``timeout`` seconds. Returns the time waited."""
+        self.calls += 1
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return 0.0
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise BulkheadFull(f"Router {self.name} busy ({self.active} running, {len(self._waiters)} queued)")
+
+        started = time.monotonic()
+        slot = asyncio.get_running_loop().create_future()
+        self._waiters.append(slot)
+        self.peak_queued = max(self.peak_queued, len(self._waiters))
+        waits = [slot]
+        if budget is not None:
+            cancelled = asyncio.ensure_future(budget.cancelled.wait())
+            waits.append(cancelled)
+        try:
+            await asyncio.wait(waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            if slot.done() and not slot.cancelled():
+                self.release()  # Handed to us just as we were cancelled: pass it on
+            raise
+        finally:
+            if budget is not None:
+                cancelled.cancel()
+            if not slot.done():
+                slot.cancel()
+                self._waiters.remove(slot)
+        waited = time.monotonic() - started
+        self._wait_total += waited
+        if slot.cancelled():
+            if budget is not None and budget.cancelled.is_set():
+                raise RequestCancelled("Client disconnected")
+            if budget is not None and budget.remaining() == 0:
+                raise DeadlineExceeded(f"Waited {waited:.1f}s for router {self.name}")
+            # Only the per-call timeout ran out: the router is congested, and
+            # the request still has time to be placed on another node.
+            raise RouterTimeout(f"Waited {waited:.1f}s for a free slot on router {self.name}")
+        return waited
+
+    def release(self) -> None:
+        # Hand the slot straight to the next waiter, if any.
+        while self._waiters:
+            slot = self._waiters.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.active -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "router": self.name,
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "peak_queued": self.peak_queued,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self._wait_total / self.calls * 1000, 1) if self.calls else 0.0,
+        }
+
+
+_bulkheads: Dict[str, Bulkhead] = {}
+
+
+def bulkhead_for(host: str, port: int) -> Bulkhead:
+    # Only touched from the event loop thread, so no lock.
+    name = f"{host}:{port}"
+    bulkhead = _bulkheads.get(name)
+    if bulkhead is None:
+        bulkhead = _bulkheads[name] = Bulkhead(name, settings.ROUTER_MAX_CONCURRENCY, settings.ROUTER_MAX_QUEUE)
+    return bulkhead
+
+
+def all_bulkheads() -> List[dict]:
+    return [bulkhead.snapshot() for bulkhead in _bulkheads.values()]
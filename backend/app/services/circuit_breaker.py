@@ -0,0 +1,132 @@
+import logging
+import time
+from collections import deque
+from typing import Dict, List
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Circuit breakers around router calls, one per router (host:port), per worker.
+#
+# CLOSED: calls go through; the outcome of the last BREAKER_WINDOW calls is
+# kept and the breaker opens when at least BREAKER_MIN_CALLS of them ran and
+# the failure rate reaches BREAKER_FAILURE_RATE.
+# OPEN: calls fail at once with CircuitOpenError for BREAKER_OPEN_SECONDS.
+# HALF_OPEN: up to BREAKER_HALF_OPEN_CALLS probe calls go through; a success
+# closes the breaker, a failure opens it again.
+#
+# Only unreachable/broken routers count as failures: an error reply from a
+# router that answered (e.g. "already have such peer") does not.
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, router: str, retry_in: float):
+        super().__init__(f"Router {router} unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.router = router
+        self.retry_in = retry_in
+
+
+def is_router_trap(exc: BaseException) -> bool:
+    """An error reply from a router that answered, for either driver."""
+    from routeros_api.exceptions import RouterOsApiCommunicationError
+    from .routeros_async import RouterOsTrap
+    return isinstance(exc, (RouterOsApiCommunicationError, RouterOsTrap))
+
+
+def is_router_failure(exc: BaseException) -> bool:
+    return not is_router_trap(exc)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int, min_calls: int, failure_rate: float,
+                 open_seconds: float, half_open_calls: int):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self._results: deque = deque(maxlen=window)  # True = success
+        self._opened_at = 0.0
+        self._probes = 0
+
+    def _retry_in(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def allows(self) -> bool:
+        """Whether a call would be let through right now (no side effects)."""
+        if self.state == OPEN:
+            return self._retry_in() == 0
+        if self.state == HALF_OPEN:
+            return self._probes < self.half_open_calls
+        return True
+
+    def before_call(self) -> None:
+        if self.state == OPEN:
+            if self._retry_in() > 0:
+                raise CircuitOpenError(self.name, self._retry_in())
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                raise CircuitOpenError(self.name, 0)
+            self._probes += 1
+
+    def record(self, success: bool) -> None:
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            self._transition(CLOSED if success else OPEN)
+            return
+        if self.state == OPEN:
+            return  # A call started before the breaker opened
+        self._results.append(success)
+        failures = self._results.count(False)
+        if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_rate:
+            self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning("Circuit breaker %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        self._probes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state == CLOSED:
+            self._results.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            "router": self.name,
+            "state": self.state,
+            "calls": len(self._results),
+            "failures": self._results.count(False),
+            "retry_in": round(self._retry_in(), 1) if self.state == OPEN else None,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(host: str, port: int) -> CircuitBreaker:
+    # Only touched from the event loop thread, so no lock.
+    name = f"{host}:{port}"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(
+            name,
+            window=settings.BREAKER_WINDOW,
+            min_calls=settings.BREAKER_MIN_CALLS,
+            failure_rate=settings.BREAKER_FAILURE_RATE,
+            open_seconds=settings.BREAKER_OPEN_SECONDS,
+            half_open_calls=settings.BREAKER_HALF_OPEN_CALLS,
+        )
+    return breaker
+
+
+def all_breakers() -> List[dict]:
+    return [breaker.snapshot() for breaker in _breakers.values()]
@@ -0,0 +1,378 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import exists, or_, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, func, select
+from starlette.concurrency import run_in_threadpool
+
+from ..core.config import settings
+from ..core.scheduler import WORKER_ID
+from ..core.tracing import detached_task
+from ..core.deps import engine
+from ..models.database import AuditLog, Node, NodeDrain, User, WireGuardPeer
+from .mikrotik import MikroTikService
+from .node_events import publish_capacity_change, publish_node_event, publish_reprovision, UPDATED
+from . import stats
+from .wireguard import router_available
+
+logger = logging.getLogger(__name__)
+
+# Node drain: move every active peer off a node before maintenance.
+#
+# The node is set to DRAINING (no new placements) and its peers are migrated
+# in batches to other UP nodes of the same region. For each peer the target
+# router gets the peer first, then the database switches it over (old row
+# MIGRATED, new row ACTIVE on the target) and the user's client gets a
+# ``reprovision`` event. The source router keeps the peer until the client
+# re-provisions (see WireGuardService.revoke_all_user_peers) or
+# DRAIN_SOURCE_GRACE_SECONDS have passed; then it drops it and the old row
+# becomes REVOKED. Every step can be repeated safely, so a job interrupted by
+# a crash resumes where it stopped. Jobs are leased to one worker at a time
+# through ``owner``/``heartbeat_at``.
+
+RUNNING = "RUNNING"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED"
+
+DRAINING = "DRAINING"
+
+# Jobs running in this worker: drain id -> task.
+_running: Dict[UUID, asyncio.Task] = {}
+
+
+def _is_simulation(node: Node) -> bool:
+    # Same convention as WireGuardService.provision_peer
+    return "example.com" in node.mt_host
+
+
+def start_drain(session: Session, node: Node, batch_size: int, batch_interval: float) -> NodeDrain:
+    active = session.exec(
+        select(NodeDrain).where(NodeDrain.node_id == node.id).where(NodeDrain.status == RUNNING)
+    ).first()
+    if active:
+        raise HTTPException(status_code=409, detail="Node is already draining")
+
+    node.status = DRAINING
+    session.add(node)
+    publish_node_event(session, UPDATED, node)
+
+    total = session.exec(
+        select(func.count(WireGuardPeer.id))
+        .where(WireGuardPeer.node_id == node.id)
+        .where(WireGuardPeer.status == "ACTIVE")
+    ).one()
+    drain = NodeDrain(
+        node_id=node.id,
+        batch_size=batch_size,
+        batch_interval=batch_interval,
+        total_peers=total,
+        owner=WORKER_ID,
+        heartbeat_at=datetime.utcnow(),
+    )
+    session.add(drain)
+    session.add(AuditLog(action="DRAIN_START", details=f"Draining node {node.name}: {total} active peers"))
+    session.commit()
+    session.refresh(drain)
+    return drain
+
+
+def launch(drain_id: UUID) -> None:
+    """Run the job in this worker's event loop (no-op if it already runs here)."""
+    task = _running.get(drain_id)
+    if task and not task.done():
+        return
+    task = detached_task(run_drain(drain_id))  # Not part of the admin request that started it
+    _running[drain_id] = task
+    task.add_done_callback(lambda _: _running.pop(drain_id, None))
+
+
+def _claim(drain_id: UUID) -> bool:
+    """Take or renew the job's lease. False if another worker holds it or it is no longer RUNNING."""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=settings.DRAIN_LEASE_SECONDS)
+    with Session(engine) as session:
+        result = session.execute(
+            update(NodeDrain)
+            .where(NodeDrain.id == drain_id)
+            .where(NodeDrain.status == RUNNING)
+            .where(or_(NodeDrain.owner == WORKER_ID, NodeDrain.owner.is_(None), NodeDrain.heartbeat_at < stale))
+            .values(owner=WORKER_ID, heartbeat_at=now)
+        )
+        session.commit()
+        return result.rowcount == 1
+
+
+def _plan_batch(drain_id: UUID, skip: Set[UUID]):
+    """Pick the next peers to move and a target node for each.
+
+    Returns (batch, pending_cleanup, done) where batch is a list of
+    (peer_id, target_id or None).
+    """
+    with Session(engine) as session:
+        drain = session.get(NodeDrain, drain_id)
+        source = session.get(Node, drain.node_id)
+        if source is None:
+            return None, [], True
+
+        # Peers switched over whose source peer can go: the user's client had
+        # the grace period to move (or already moved elsewhere).
+        migrated = (
+            select(WireGuardPeer.id)
+            .where(WireGuardPeer.node_id == source.id)
+            .where(WireGuardPeer.status == "MIGRATED")
+        )
+        moved_recently = aliased(WireGuardPeer)
+        grace_start = datetime.utcnow() - timedelta(seconds=settings.DRAIN_SOURCE_GRACE_SECONDS)
+        pending = session.exec(migrated.where(~exists().where(
+            moved_recently.user_id == WireGuardPeer.user_id,
+            moved_recently.status == "ACTIVE",
+            moved_recently.provisioned_at > grace_start,
+        ))).all()
+        waiting = session.exec(migrated.limit(1)).first() is not None
+
+        query = (
+            select(WireGuardPeer, User)
+            .join(User)
+            .where(WireGuardPeer.node_id == source.id)
+            .where(WireGuardPeer.status == "ACTIVE")
+        )
+        if skip:
+            query = query.where(WireGuardPeer.id.not_in(skip))
+        peers = session.exec(query.limit(drain.batch_size)).all()
+
+        candidates = session.exec(
+            select(Node)
+            .where(Node.region_id == source.region_id)
+            .where(Node.id != source.id)
+            .where(Node.status == "UP")
+            .order_by(Node.priority.desc(), Node.current_peers.asc())
+        ).all()
+        # Track load locally so one batch does not overfill a target.
+        load = {node.id: node.current_peers for node in candidates}
+
+        batch: List[Tuple[UUID, Optional[UUID]]] = []
+        for peer, user in peers:
+            eligible = [
+                node for node in candidates
+                if load[node.id] < node.max_capacity and (user.role == "ADMIN" or not node.admin_only)
+                and router_available(node)
+            ]
+            if not eligible:
+                batch.append((peer.id, None))
+                continue
+            target = min(eligible, key=lambda n: (-n.priority, load[n.id]))
+            load[target.id] += 1
+            batch.append((peer.id, target.id))
+
+        return batch, pending, not peers and not waiting
+
+
+async def _remove_from_router(node: Node, key: str) -> None:
+    try:
+        async with MikroTikService(node.mt_host, node.mt_user, node.mt_pass, port=node.mt_api_port) as mt:
+            await mt.remove_peer(key)
+    except Exception as e:
+        # Same policy as revoke_all_user_peers: log and continue.
+        logger.warning("Drain: could not remove peer %s from %s: %s", key, node.name, e)
+
+
+async def _remove_from_source(peer_id: UUID) -> None:
+    with Session(engine) as session:
+        peer = session.get(WireGuardPeer, peer_id)
+        if peer.status != "MIGRATED":
+            return  # Released when the client re-provisioned
+        source = session.get(Node, peer.node_id)
+        key = peer.client_public_key
+
+    await _remove_from_router(source, key)
+
+    with Session(engine) as session:
+        peer = session.get(WireGuardPeer, peer_id)
+        peer.status = "REVOKED"
+        session.add(peer)
+        session.commit()
+
+
+async def _migrate_peer(peer_id: UUID, target_id: Optional[UUID]) -> Tuple[bool, Optional[str]]:
+    """Move one peer; returns (moved by this call, error message or None)."""
+    if target_id is None:
+        return False, "No node with free capacity in the region"
+
+    with Session(engine) as session:
+        peer = session.get(WireGuardPeer, peer_id)
+        if peer.status != "ACTIVE":
+            return False, None  # Already moved by an earlier run
+        target = session.get(Node, target_id)
+        user = session.get(User, peer.user_id)
+        key, ip, username = peer.client_public_key, peer.assigned_ip, user.username
+
+    # 1. Target router first: the user must never be left without a peer.
+    try:
+        async with MikroTikService(target.mt_host, target.mt_user, target.mt_pass, port=target.mt_api_port) as mt:
+            await mt.ensure_peer(
+                interface=target.interface_name,
+                public_key=key,
+                allowed_address=ip,
+                comment=f"User: {username} | {peer.user_id} (Migrated)",
+            )
+    except Exception as e:
+        if not _is_simulation(target):
+            return False, f"{target.name}: {e}"
+        logger.warning("WS-SIMULATION-WARNING: MikroTik at %s unreachable. Error: %s", target.mt_host, e)
+
+    # 2. Switch over in the database. Conditional on the row still being ACTIVE
+    # so two runners of the same drain cannot both move (and count) the peer.
+    with Session(engine) as session:
+        result = session.execute(
+            update(WireGuardPeer)
+            .where(WireGuardPeer.id == peer_id)
+            .where(WireGuardPeer.status == "ACTIVE")
+            .values(status="MIGRATED")
+        )
+        if result.rowcount != 1:
+            session.rollback()
+            # Another runner moved the peer first, maybe to another target:
+            # drop what step 1 added here unless the peer now lives on this node.
+            lives_here = session.exec(
+                select(WireGuardPeer.id)
+                .where(WireGuardPeer.node_id == target_id)
+                .where(WireGuardPeer.client_public_key == key)
+                .where(WireGuardPeer.status == "ACTIVE")
+            ).first()
+            if lives_here is None:
+                await _remove_from_router(target, key)
+            return False, None
+        peer = session.get(WireGuardPeer, peer_id)
+        source = session.get(Node, peer.node_id)
+        target = session.get(Node, target_id)
+        session.add(WireGuardPeer(
+            user_id=peer.user_id,
+            node_id=target.id,
+            client_public_key=peer.client_public_key,
+            assigned_ip=peer.assigned_ip,
+            status="ACTIVE",
+        ))
+        source.current_peers = max(0, source.current_peers - 1)
+        previous_peers = target.current_peers
+        target.current_peers += 1
+        session.add_all([source, target])
+        stats.peers_changed(session, source, -1)
+        stats.peers_changed(session, target, +1)
+        session.add(AuditLog(
+            user_id=peer.user_id,
+            action="MIGRATE",
+            details=f"Migrated from node {source.name} to {target.name} with persistent IP {peer.assigned_ip}",
+        ))
+        publish_capacity_change(session, target, previous_peers)
+        # The client still uses the source peer until it re-provisions.
+        publish_reprovision(session, peer.user_id, target)
+        session.commit()
+
+    # 3. Source router last, see _plan_batch.
+    return True, None
+
+
+def _record_batch(drain_id: UUID, migrated: int, errors: List[str]) -> NodeDrain:
+    with Session(engine) as session:
+        drain = session.get(NodeDrain, drain_id)
+        drain.migrated += migrated
+        drain.failed += len(errors)
+        if errors:
+            drain.last_error = errors[-1]
+        drain.heartbeat_at = datetime.utcnow()
+        session.add(drain)
+        session.commit()
+        session.refresh(drain)
+        return drain
+
+
+def _finish(drain_id: UUID, error: Optional[str] = None) -> None:
+    with Session(engine) as session:
+        drain = session.get(NodeDrain, drain_id)
+        node = session.get(Node, drain.node_id)
+        drain.finished_at = datetime.utcnow()
+        if node is None:
+            drain.status = FAILED
+            drain.last_error = "Node was deleted"
+        elif drain.failed or error:
+            # Peers that could not move stay ACTIVE on the node, which stays DRAINING.
+            drain.status = FAILED
+            drain.last_error = error or drain.last_error
+        else:
+            drain.status = COMPLETED
+            node.status = "MAINTENANCE"
+            session.add(node)
+            publish_node_event(session, UPDATED, node)
+        session.add(drain)
+        session.add(AuditLog(
+            action="DRAIN_END",
+            details=f"Drain {drain.status.lower()}: {drain.migrated}/{drain.total_peers} peers migrated, {drain.failed} failed",
+        ))
+        session.commit()
+
+
+async def _keep_lease(drain_id: UUID) -> None:
+    """Renew the lease while a slow batch, or the pause after it, is in progress."""
+    while True:
+        await asyncio.sleep(settings.DRAIN_LEASE_SECONDS / 3)
+        if not await run_in_threadpool(_claim, drain_id):
+            logger.warning("Drain %s: lease lost", drain_id)
+            return
+
+
+async def run_drain(drain_id: UUID) -> None:
+    skip: Set[UUID] = set()  # Peers that failed in this run; retried by the next drain
+    try:
+        while await run_in_threadpool(_claim, drain_id):
+            heartbeat = asyncio.get_running_loop().create_task(_keep_lease(drain_id))
+            try:
+                batch, pending, done = await run_in_threadpool(_plan_batch, drain_id, skip)
+                if done:
+                    await run_in_threadpool(_finish, drain_id)
+                    return
+
+                await asyncio.gather(*(_remove_from_source(peer_id) for peer_id in pending))
+                results = await asyncio.gather(*(_migrate_peer(peer_id, target_id) for peer_id, target_id in batch))
+                migrated, errors = 0, []
+                for (peer_id, _), (moved, error) in zip(batch, results):
+                    migrated += moved
+                    if error:
+                        skip.add(peer_id)
+                        errors.append(error)
+                drain = await run_in_threadpool(_record_batch, drain_id, migrated, errors)
+                logger.info("Drain %s: %s/%s migrated, %s failed", drain_id, drain.migrated, drain.total_peers, drain.failed)
+                await asyncio.sleep(drain.batch_interval)
+            finally:
+                heartbeat.cancel()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.exception("Drain %s crashed", drain_id)
+        await run_in_threadpool(_finish, drain_id, str(e))
+
+
+def _resumable() -> List[UUID]:
+    stale = datetime.utcnow() - timedelta(seconds=settings.DRAIN_LEASE_SECONDS)
+    with Session(engine) as session:
+        return session.exec(
+            select(NodeDrain.id)
+            .where(NodeDrain.status == RUNNING)
+            .where(or_(NodeDrain.owner == WORKER_ID, NodeDrain.owner.is_(None), NodeDrain.heartbeat_at < stale))
+        ).all()
+
+
+async def resume_stale_drains() -> List[UUID]:
+    """Scheduled job: pick up jobs left behind by a crashed or stopped worker."""
+    resumed = []
+    for drain_id in await run_in_threadpool(_resumable):
+        if drain_id not in _running:
+            logger.info("Resuming drain %s", drain_id)
+            launch(drain_id)
+            resumed.append(drain_id)
+    return resumed
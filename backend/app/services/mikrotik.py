@@ -1,10 +1,25 @@
-import routeros_api
 import asyncio
+import logging
 from typing import Dict, Any, Optional
 from concurrent.futures import ThreadPoolExecutor
+from ..core.config import settings
+from ..core.startup import per_worker
+from ..core.deadlines import current_budget
+from ..core.tracing import detached_task, span
+from .bulkhead import RouterTimeout, bulkhead_for
+from .circuit_breaker import breaker_for, is_router_failure, is_router_trap
+from .peer_ids import peer_ids_for
+from . import routeros_async
+
+logger = logging.getLogger(__name__)
+
+PEERS = "/interface/wireguard/peers"
+# Clean-ups of adds that completed after their call timed out (see add_peer).
+_late_adds: set = set()
 
 class MikroTikService:
-    _executor = ThreadPoolExecutor(max_workers=10)
+    # Per worker process: the host-wide thread budget is split between workers.
+    _executor = ThreadPoolExecutor(max_workers=per_worker(settings.MIKROTIK_THREADS_TOTAL, minimum=2))
 
     def __init__(self, host: str, user: str, password: str, port: int = 8750):
         self.host = host
@@ -13,8 +28,70 @@ class MikroTikService:
         self.port = port
         self.connection = None
         self.api = None
+        self.async_connection: Optional[routeros_async.RouterOsConnection] = None  # asyncio driver
+        self.breaker = breaker_for(host, port)
+        self.bulkhead = bulkhead_for(host, port)
+        self.peer_ids = peer_ids_for(host, port)
+        # "thread": blocking routeros_api in the executor; "asyncio": routeros_async,
+        # one multiplexed connection per router and no thread per call.
+        self.driver = settings.MIKROTIK_DRIVER
+
+    async def _op(self, name: str, *args):
+        impl = getattr(self, f"_async_{name}" if self.driver == "asyncio" else f"_sync_{name}")
+        with span(f"router.{name}", router=self.bulkhead.name, driver=self.driver):
+            return await self._call(impl, *args)
+
+    async def _call(self, fn, *args):
+        """Run a router call: blocking ``fn`` in the executor, or a coroutine function as a task.
+
+        The call waits for a slot in the router's bulkhead, goes through its
+        circuit breaker and is bounded by ROUTER_CALL_TIMEOUT and whatever is
+        left of the request's budget (core/deadlines.py).
+        """
+        budget = current_budget()
+        timeout = settings.ROUTER_CALL_TIMEOUT
+        if budget is not None:
+            budget.check()
+            timeout = min(timeout, budget.remaining())
+        waited = await self.bulkhead.acquire(timeout, budget)
+        try:
+            self.breaker.before_call()
+        except Exception:
+            self.bulkhead.release()
+            raise
+
+        if asyncio.iscoroutinefunction(fn):
+            # Bounded like a blocking call is by its socket timeout; cancelling sends /cancel.
+            hard_limit = max(settings.ROUTER_CALL_TIMEOUT, settings.ROUTER_SOCKET_TIMEOUT)
+            future = asyncio.ensure_future(asyncio.wait_for(fn(*args), hard_limit))
+        else:
+            future = asyncio.get_event_loop().run_in_executor(self._executor, fn, *args)
+        # The slot is freed when the call is done, even if we stop waiting for it.
+        future.add_done_callback(lambda _: self.bulkhead.release())
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), max(0.0, timeout - waited))
+        except asyncio.TimeoutError:
+            self.bulkhead.timeouts += 1
+            self.breaker.record(False)
+            self.peer_ids.clear()
+            future.add_done_callback(lambda call: call.cancelled() or call.exception())  # Nobody awaits it now
+            if self.async_connection is not None:
+                # Shared with other calls: do not let them queue behind a hung command.
+                await routeros_async.discard(self.async_connection)
+            raise RouterTimeout(f"Router {self.bulkhead.name} did not answer within {timeout:.1f}s", future)
+        except Exception as e:
+            failed = is_router_failure(e)
+            self.breaker.record(not failed)
+            if failed:
+                # It may be rebooting, and peer ids may not survive that.
+                self.peer_ids.clear()
+            raise
+        self.breaker.record(True)
+        return result
 
     def _connect(self):
+        import routeros_api  # deferred until the first router call (see main.warm_up)
+
         # Using plaintext_login=True for broader compatibility with newer/older ROS versions
         # but using the API protocol on the specified port
         self.connection = routeros_api.RouterOsApiPool(
@@ -22,65 +99,220 @@ class MikroTikService:
             username=self.user, 
             password=self.password, 
             port=self.port,
-            plaintext_login=True
+            plaintext_login=True,
+            use_ssl=settings.MIKROTIK_USE_SSL,
+            ssl_verify=settings.MIKROTIK_SSL_VERIFY,
+            ssl_verify_hostname=settings.MIKROTIK_SSL_VERIFY,
         )
+        # Bounds how long a thread can stay blocked on a hung router.
+        self.connection.socket_timeout = settings.ROUTER_SOCKET_TIMEOUT
         self.api = self.connection.get_api()
 
-    async def add_peer(self, interface: str, public_key: str, allowed_address: str, comment: str) -> Dict[str, Any]:
-        return await asyncio.get_event_loop().run_in_executor(
-            self._executor,
-            self._sync_add_peer,
-            interface, public_key, allowed_address, comment
-        )
+    # Peers. The cache logic lives here; each driver only provides the
+    # print/add/set/delete primitives below.
 
-    def _sync_add_peer(self, interface: str, public_key: str, allowed_address: str, comment: str):
-        if not self.api: self._connect()
-        peers = self.api.get_resource('/interface/wireguard/peers')
-        return peers.add(
-            interface=interface,
-            **{"public-key": public_key},
-            **{"allowed-address": allowed_address},
-            comment=comment
-        )
+    async def _peer_id(self, public_key: str) -> Optional[str]:
+        peer_id = self.peer_ids.get(public_key)
+        if peer_id is not None:
+            return peer_id
+        if not self.peer_ids.fresh():
+            # One listing of every peer serves the next lookups too (e.g. a drain).
+            self.peer_ids.load(await self._op("print_peers", {}))
+        else:
+            self.peer_ids.update(await self._op("print_peers", {"public-key": public_key}))
+        return self.peer_ids.get(public_key)
+
+    async def _key_of(self, peer_id: str) -> Optional[str]:
+        """Public key of the router's peer ``peer_id``, None if there is none."""
+        return next(iter(await self._op("print_peers", {".id": peer_id})), None)
+
+    async def _on_peer(self, public_key: str, name: str, *args) -> bool:
+        """Run primitive ``name`` on the peer's ``.id``. False if the router has no such peer.
+
+        A cached id is checked first: the primitives are destructive.
+        """
+        for retry in (False, True):
+            peer_id = self.peer_ids.get(public_key)
+            if peer_id is not None:
+                key = await self._key_of(peer_id)
+                if key is None:
+                    self.peer_ids.drop(public_key)  # Removed behind our back
+                    peer_id = None
+                elif key != public_key:
+                    # Ids are reused after a reboot: this one is another peer's now.
+                    self.peer_ids.clear()
+                    peer_id = None
+            if peer_id is None:
+                peer_id = await self._peer_id(public_key)
+            if peer_id is None:
+                return False
+            try:
+                await self._op(name, peer_id, *args)
+                return True
+            except Exception as e:
+                # The peer was removed after the id was checked or looked up.
+                if retry or not is_router_trap(e) or "no such item" not in str(e):
+                    raise
+                self.peer_ids.drop(public_key)
+        return False
+
+    async def add_peer(self, interface: str, public_key: str, allowed_address: str, comment: str) -> Optional[str]:
+        """Add the peer. Returns its ``.id``."""
+        try:
+            peer_id = await self._op("add_peer", interface, public_key, allowed_address, comment)
+        except RouterTimeout as e:
+            # The add goes on without us while the caller gives up (or fails
+            # over to another router): undo it if it lands here after all.
+            if e.abandoned is not None:
+                e.abandoned.add_done_callback(lambda call: self._undo_late_add(call, public_key))
+            raise
+        if peer_id:
+            self.peer_ids.put(public_key, peer_id)
+        return peer_id
+
+    def _undo_late_add(self, call: asyncio.Future, public_key: str) -> None:
+        error = None if call.cancelled() else call.exception()
+        if error is not None and is_router_trap(error):
+            return  # Refused by the router: nothing was added
+        # Without the new .id (the outcome is unknown) the peer goes by its key.
+        peer_id = None if call.cancelled() or error is not None else call.result()
+        task = detached_task(self._remove_late_add(public_key, peer_id))  # Not bound by the request's budget
+        _late_adds.add(task)
+        task.add_done_callback(_late_adds.discard)
+
+    async def _remove_late_add(self, public_key: str, peer_id: Optional[str]) -> None:
+        try:
+            async with MikroTikService(self.host, self.user, self.password, port=self.port) as mt:
+                if peer_id:
+                    await mt._op("delete_peer", peer_id)
+                else:
+                    await mt.remove_peer(public_key)
+            logger.warning("Removed peer %s added to %s after its call timed out", public_key, self.bulkhead.name)
+        except Exception as e:
+            logger.error("Could not remove peer %s added late to %s: %s", public_key, self.bulkhead.name, e)
+
+    async def ensure_peer(self, interface: str, public_key: str, allowed_address: str, comment: str) -> bool:
+        """Add the peer unless it is already on the interface. Returns True if it was added."""
+        found = await self._op("print_peers", {"interface": interface, "public-key": public_key})
+        if found:
+            self.peer_ids.update(found)
+            return False
+        await self.add_peer(interface, public_key, allowed_address, comment)
+        return True
 
     async def remove_peer(self, public_key: str) -> bool:
-        return await asyncio.get_event_loop().run_in_executor(
-            self._executor,
-            self._sync_remove_peer,
-            public_key
-        )
+        removed = await self._on_peer(public_key, "delete_peer")
+        self.peer_ids.drop(public_key)
+        return removed
 
-    def _sync_remove_peer(self, public_key: str):
-        if not self.api: self._connect()
-        peers_resource = self.api.get_resource('/interface/wireguard/peers')
-        peers = peers_resource.get(**{"public-key": public_key})
-        
-        if not peers:
+    async def rotate_peer_key(self, interface: str, old_key: str, new_key: str,
+                              allowed_address: str, comment: str) -> bool:
+        """Replace a peer's public key in place with a single ``set``.
+
+        Returns True if the existing peer was updated; if the router has no
+        peer with ``old_key`` a new one is added and False is returned.
+        """
+        try:
+            updated = await self._on_peer(old_key, "set_peer", {"public-key": new_key, "comment": comment})
+        except Exception as e:
+            # The new key is already on the router (e.g. a duplicate left by an
+            # earlier key sync): keep that peer and drop the old one.
+            if not is_router_trap(e) or await self._peer_id(new_key) is None:
+                raise
+            await self.remove_peer(old_key)
+            return True
+        if not updated:
+            await self.add_peer(interface, new_key, allowed_address, comment)
             return False
-            
-        peer_id = peers[0]['id']
-        peers_resource.remove(id=peer_id)
+        peer_id = self.peer_ids.get(old_key)
+        self.peer_ids.drop(old_key)
+        if peer_id:
+            self.peer_ids.put(new_key, peer_id)
         return True
 
     async def get_health(self) -> bool:
         try:
-            return await asyncio.get_event_loop().run_in_executor(
-                self._executor,
-                self._sync_get_health
-            )
+            return await self._op("get_health")
         except Exception:
             return False
 
+    # thread driver
+
+    def _sync_print_peers(self, queries: Dict[str, str]) -> Dict[str, str]:
+        if not self.api: self._connect()
+        peers = self.api.get_resource(PEERS)
+        # routeros_api strips the dot from ".id"
+        rows = peers.call('print', {'.proplist': '.id,public-key'}, queries)
+        return {row['public-key']: row['id'] for row in rows}
+
+    def _sync_add_peer(self, interface: str, public_key: str, allowed_address: str, comment: str):
+        if not self.api: self._connect()
+        peers = self.api.get_resource(PEERS)
+        response = peers.add(
+            interface=interface,
+            **{"public-key": public_key},
+            **{"allowed-address": allowed_address},
+            comment=comment
+        )
+        return response.done_message.get('ret')
+
+    def _sync_set_peer(self, peer_id: str, attrs: Dict[str, str]):
+        if not self.api: self._connect()
+        self.api.get_resource(PEERS).set(id=peer_id, **attrs)
+
+    def _sync_delete_peer(self, peer_id: str):
+        if not self.api: self._connect()
+        self.api.get_resource(PEERS).remove(id=peer_id)
+
     def _sync_get_health(self):
         if not self.api: self._connect()
         resource = self.api.get_resource('/system/resource')
         return len(resource.get()) > 0
 
+    # asyncio driver
+
+    async def _api(self) -> routeros_async.RouterOsConnection:
+        self.async_connection = await routeros_async.connect(
+            self.host, self.port, self.user, self.password,
+            use_ssl=settings.MIKROTIK_USE_SSL,
+            ssl_verify=settings.MIKROTIK_SSL_VERIFY,
+            timeout=settings.ROUTER_SOCKET_TIMEOUT,
+        )
+        return self.async_connection
+
+    async def _async_print_peers(self, queries: Dict[str, str]) -> Dict[str, str]:
+        api = await self._api()
+        rows = await api.call(f"{PEERS}/print", queries=queries, proplist=[".id", "public-key"])
+        return {row["public-key"]: row[".id"] for row in rows}
+
+    async def _async_add_peer(self, interface: str, public_key: str, allowed_address: str, comment: str):
+        api = await self._api()
+        done = await api.call(f"{PEERS}/add", {
+            "interface": interface,
+            "public-key": public_key,
+            "allowed-address": allowed_address,
+            "comment": comment,
+        }, done=True)
+        return done.get("ret")
+
+    async def _async_set_peer(self, peer_id: str, attrs: Dict[str, str]):
+        api = await self._api()
+        await api.call(f"{PEERS}/set", {".id": peer_id, **attrs})
+
+    async def _async_delete_peer(self, peer_id: str):
+        api = await self._api()
+        await api.call(f"{PEERS}/remove", {".id": peer_id})
+
+    async def _async_get_health(self):
+        api = await self._api()
+        return len(await api.call("/system/resource/print")) > 0
+
     async def __aenter__(self):
         # Connection is deferred to the first call or we can do it here
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # asyncio driver connections are shared and stay open.
         if self.connection:
             await asyncio.get_event_loop().run_in_executor(
                 self._executor,
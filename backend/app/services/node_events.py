@@ -0,0 +1,293 @@
+import asyncio
+import json
+import logging
+from typing import Callable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlmodel import Session, delete, select
+from starlette.concurrency import run_in_threadpool
+
+from ..core.config import settings
+from ..core.deps import engine
+from ..core.generations import bump_generation, NODE_LIST
+from ..core.tracing import detached_task
+from ..models.database import Node, NodeEvent, Region
+
+logger = logging.getLogger(__name__)
+
+# Node availability events.
+#
+# Writers record a NodeEvent row in the same transaction as the change, so the
+# sequence number (the row's autoincrement ``seq``) is shared by every worker
+# and a client can resume on any of them with ``Last-Event-ID``. Each worker
+# runs one poller that reads new rows and fans them out to its open streams.
+#
+# Sequence numbers are allocated at insert but become visible at commit, so on
+# Postgres a lower seq can show up after a higher one was read. The poller
+# re-reads the last NODE_EVENTS_REORDER_WINDOW seqs and dedupes by seq; an
+# event committed later than that is still missed (on SQLite writers are
+# serialized and seqs always appear in order).
+
+ADDED = "added"
+UPDATED = "updated"
+REMOVED = "removed"
+FULL = "full"
+AVAILABLE = "available"
+# Per-user: the peer was moved to the event's node by a drain (services/drain.py)
+# and the client should re-provision there. Only that user's streams get it.
+REPROVISION = "reprovision"
+
+
+def node_snapshot(node: Node, region: Region) -> dict:
+    """Node state as cached for /regions/ and carried by events."""
+    return {
+        "id": str(node.id),
+        "name": node.name,
+        "region_code": region.code,
+        "country_name": region.name,
+        "endpoint_host": node.endpoint_host,
+        "endpoint_port": node.endpoint_port,
+        "server_public_key": node.server_public_key,
+        "admin_only": node.admin_only,
+        "status": node.status,
+        "current_peers": node.current_peers,
+        "max_capacity": node.max_capacity,
+    }
+
+
+def is_available(snapshot: dict, role: str) -> bool:
+    """Whether a client with ``role`` may pick this node right now."""
+    return (
+        snapshot["status"] == "UP"
+        and snapshot["current_peers"] < snapshot["max_capacity"]
+        and (role == "ADMIN" or not snapshot["admin_only"])
+    )
+
+
+def client_node(snapshot: dict) -> dict:
+    """The subset of a node sent to the desktop client (dropdown entry)."""
+    return {
+        "id": snapshot["id"],
+        "name": f"{snapshot['name']} ({snapshot['region_code']})",  # Display Name: "Miami-01 (US)"
+        "region_code": snapshot["region_code"],
+        "country_name": snapshot["country_name"],
+        # Lets the client measure latency to each node before choosing
+        "endpoint_host": snapshot["endpoint_host"],
+        "endpoint_port": snapshot["endpoint_port"],
+        # Lets the client tell a cached config for this node is stale after a key rotation
+        "server_public_key": snapshot.get("server_public_key"),
+    }
+
+
+def publish_node_event(session: Session, kind: str, node: Node) -> None:
+    """Record ``kind`` for ``node`` and invalidate the node list. Committed with the caller."""
+    region = session.get(Region, node.region_id)
+    session.add(NodeEvent(node_id=node.id, kind=kind, payload=json.dumps(node_snapshot(node, region))))
+    bump_generation(session, NODE_LIST)
+
+
+def publish_reprovision(session: Session, user_id: UUID, node: Node) -> None:
+    """Ask ``user_id``'s client to re-provision on ``node``. Committed with the caller."""
+    region = session.get(Region, node.region_id)
+    payload = {**node_snapshot(node, region), "user_id": str(user_id)}
+    session.add(NodeEvent(node_id=node.id, kind=REPROVISION, payload=json.dumps(payload)))
+
+
+def _recipient(event: NodeEvent) -> Optional[str]:
+    """The only user an event is for, or None if it is for everyone."""
+    if event.kind != REPROVISION:
+        return None
+    return json.loads(event.payload)["user_id"]
+
+
+def publish_capacity_change(session: Session, node: Node, previous_peers: int) -> bool:
+    """Publish FULL or AVAILABLE if ``node`` crossed its capacity; returns whether it did.
+
+    A crossing rather than equality: nodes picked by id skip the capacity
+    filter, so ``current_peers`` can overshoot ``max_capacity``.
+    """
+    capacity = node.max_capacity
+    if previous_peers < capacity <= node.current_peers:
+        publish_node_event(session, FULL, node)
+    elif node.current_peers < capacity <= previous_peers:
+        publish_node_event(session, AVAILABLE, node)
+    else:
+        return False
+    return True
+
+
+def format_sse(event: str, data, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _max_seq(session: Session) -> int:
+    return session.exec(select(func.max(NodeEvent.seq))).one() or 0
+
+
+def _events_after(seq: int, limit: int = 500) -> List[NodeEvent]:
+    with Session(engine) as session:
+        return session.exec(
+            select(NodeEvent).where(NodeEvent.seq > seq).order_by(NodeEvent.seq).limit(limit)
+        ).all()
+
+
+def _recent_seqs(session: Session, tail: int) -> Set[int]:
+    """Seqs already visible in the reorder window ending at ``tail``."""
+    floor = tail - settings.NODE_EVENTS_REORDER_WINDOW
+    return set(session.exec(select(NodeEvent.seq).where(NodeEvent.seq > floor)).all())
+
+
+def _tail() -> Tuple[int, Set[int]]:
+    with Session(engine) as session:
+        tail = _max_seq(session)
+        return tail, _recent_seqs(session, tail)
+
+
+def _prune() -> None:
+    with Session(engine) as session:
+        keep_after = _max_seq(session) - settings.NODE_EVENTS_RETENTION
+        if keep_after > 0:
+            session.exec(delete(NodeEvent).where(NodeEvent.seq <= keep_after))
+            session.commit()
+
+
+class Subscription:
+    def __init__(self, queue_size: int, user_id: Optional[str] = None):
+        self.queue: "asyncio.Queue[NodeEvent]" = asyncio.Queue(maxsize=queue_size)
+        self.user_id = user_id  # Receives per-user events addressed to this user
+        self.lagged = False  # Set when the queue overflowed; the stream ends and the client resumes
+
+
+class NodeEventBroker:
+    """Per-worker fan-out of new NodeEvent rows to open streams."""
+
+    PRUNE_EVERY = 300  # polls
+
+    def __init__(self, poll_interval: float, queue_size: int):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._subscribers: set = set()
+        self._last_seq = 0
+        self._seen: Set[int] = set()  # Seqs delivered within the reorder window
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def subscribe(self, user_id: Optional[str] = None) -> Subscription:
+        async with self._lock:
+            if self._task is None or self._task.done():
+                # Start from the current tail so callers can read their backlog after this returns.
+                self._last_seq, self._seen = await run_in_threadpool(_tail)
+                # Started by the first stream's request, but shared by every stream.
+                self._task = detached_task(self._run())
+            subscription = Subscription(self.queue_size, user_id)
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    async def _run(self) -> None:
+        polls = 0
+        while self._subscribers:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                window = settings.NODE_EVENTS_REORDER_WINDOW
+                events = await run_in_threadpool(_events_after, self._last_seq - window, 500 + window)
+                polls += 1
+                if polls % self.PRUNE_EVERY == 0:
+                    await run_in_threadpool(_prune)
+            except Exception:
+                logger.exception("Node event poll failed")
+                continue
+            for event in events:
+                if event.seq in self._seen:
+                    continue
+                self._seen.add(event.seq)
+                self._last_seq = max(self._last_seq, event.seq)
+                recipient = _recipient(event)
+                for subscription in list(self._subscribers):
+                    if recipient is not None and recipient != subscription.user_id:
+                        continue
+                    try:
+                        subscription.queue.put_nowait(event)
+                    except asyncio.QueueFull:
+                        subscription.lagged = True
+                        self._subscribers.discard(subscription)
+            floor = self._last_seq - window
+            self._seen = {seq for seq in self._seen if seq > floor}
+
+
+broker = NodeEventBroker(settings.NODE_EVENTS_POLL_INTERVAL, settings.NODE_EVENTS_QUEUE_SIZE)
+
+
+def _backlog(last_seq: Optional[int]) -> Optional[List[NodeEvent]]:
+    """Events after ``last_seq``, or None if the client must start from a snapshot."""
+    if last_seq is None:
+        return None
+    with Session(engine) as session:
+        oldest = session.exec(select(func.min(NodeEvent.seq))).one()
+        if oldest is not None and last_seq < oldest - 1:
+            return None  # Pruned past the client's cursor
+    return _events_after(last_seq, limit=settings.NODE_EVENTS_RETENTION)
+
+
+def _snapshot(load_nodes: Callable[[Session], List[dict]]) -> Tuple[Set[int], List[dict]]:
+    """Visible nodes and the seqs (within the reorder window) they already reflect."""
+    with Session(engine) as session:
+        return _recent_seqs(session, _max_seq(session)), load_nodes(session)
+
+
+def _event_message(event: NodeEvent, role: str) -> str:
+    snapshot = json.loads(event.payload)
+    available = event.kind != REMOVED and is_available(snapshot, role)
+    return format_sse(event.kind, {"node": client_node(snapshot), "available": available}, event.seq)
+
+
+async def stream_node_events(
+    role: str,
+    last_seq: Optional[int],
+    load_nodes: Callable[[Session], List[dict]],
+    user_id: Optional[str] = None,
+):
+    """SSE body: a snapshot (or the backlog since ``last_seq``), then live events.
+
+    ``user_id`` also receives the per-user events addressed to it.
+    """
+    subscription = await broker.subscribe(user_id)
+    try:
+        yield "retry: 3000\n\n"
+        # Seqs already covered by the backlog or snapshot; live events are deduped
+        # by seq rather than by position because they may arrive out of order.
+        covered: Set[int] = set()
+        backlog = await run_in_threadpool(_backlog, last_seq)
+        if backlog is None:
+            covered, nodes = await run_in_threadpool(_snapshot, load_nodes)
+            visible = [client_node(n) for n in nodes if is_available(n, role)]
+            yield format_sse("snapshot", visible, max(covered, default=0))
+        else:
+            for event in backlog:
+                covered.add(event.seq)
+                if _recipient(event) in (None, user_id):
+                    yield _event_message(event, role)
+
+        while not subscription.lagged:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), settings.NODE_EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event.seq in covered or (last_seq is not None and event.seq <= last_seq):
+                continue  # Already delivered with the backlog or snapshot, or before the resume
+            covered.add(event.seq)
+            if len(covered) > 2 * settings.NODE_EVENTS_REORDER_WINDOW:
+                floor = event.seq - settings.NODE_EVENTS_REORDER_WINDOW
+                covered = {seq for seq in covered if seq > floor}
+            yield _event_message(event, role)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,73 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, exists, insert, literal
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from ..core.config import settings
+from ..core.deps import engine
+from ..models.database import WireGuardPeer, WireGuardPeerHistory
+
+logger = logging.getLogger(__name__)
+
+# Peer history compaction.
+#
+# Every node switch revokes the user's previous peer, so without compaction the
+# peer table would be mostly REVOKED rows. This moves them, in batches, to the
+# append-only wireguardpeerhistory table (same id, so a batch copied twice is
+# skipped) and deletes history past PEER_HISTORY_RETENTION_DAYS. Lookups of
+# active peers go through the partial indexes on WireGuardPeer.
+
+_COLUMNS = ("id", "user_id", "node_id", "client_public_key", "assigned_ip", "provisioned_at")
+
+
+def _archive_batch(session: Session, batch_size: int) -> int:
+    now = datetime.utcnow()
+    revoked = (
+        select(*(getattr(WireGuardPeer, c) for c in _COLUMNS), literal(now))
+        .where(WireGuardPeer.status == "REVOKED")
+        .where(~exists().where(WireGuardPeerHistory.id == WireGuardPeer.id))
+        .limit(batch_size)
+    )
+    copied = session.execute(
+        insert(WireGuardPeerHistory).from_select([*_COLUMNS, "archived_at"], revoked)
+    ).rowcount
+    # Also drops rows a concurrent run archived but did not delete yet.
+    session.execute(
+        delete(WireGuardPeer)
+        .where(WireGuardPeer.status == "REVOKED")
+        .where(exists().where(WireGuardPeerHistory.id == WireGuardPeer.id))
+    )
+    session.commit()
+    return copied
+
+
+def compact(batch_size: int = None) -> dict:
+    """Move REVOKED peers to the history table and prune old history."""
+    batch_size = batch_size or settings.PEER_HISTORY_BATCH_SIZE
+    archived = 0
+    with Session(engine) as session:
+        while True:
+            try:
+                copied = _archive_batch(session, batch_size)
+            except IntegrityError:
+                # Another worker archived the same rows first; the next run picks up the rest.
+                session.rollback()
+                break
+            archived += copied
+            if copied < batch_size:
+                break
+
+        pruned = 0
+        if settings.PEER_HISTORY_RETENTION_DAYS > 0:
+            cutoff = datetime.utcnow() - timedelta(days=settings.PEER_HISTORY_RETENTION_DAYS)
+            pruned = session.execute(
+                delete(WireGuardPeerHistory).where(WireGuardPeerHistory.archived_at < cutoff)
+            ).rowcount
+            session.commit()
+
+    if archived or pruned:
+        logger.info("Peer history: archived %d revoked peers, pruned %d old entries", archived, pruned)
+    return {"archived": archived, "pruned": pruned}
+
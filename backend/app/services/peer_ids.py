@@ -0,0 +1,65 @@
+import time
+from typing import Dict, Optional
+
+from ..core.config import settings
+
+# Public key -> RouterOS ``.id`` of WireGuard peers, one map per router
+# (host:port), per worker.
+#
+# Removing or re-keying a peer needs its ``.id``. The map is filled by one
+# listing of the router's peers and kept up to date on add/set/remove, so most
+# operations read one peer by ``.id`` instead of filtering every peer by key.
+# It is only a hint: other workers (or someone on the router) may remove
+# peers, so MikroTikService retries once with a fresh lookup when the router
+# answers "no such item". Ids are reused after a reboot, so before a set or
+# remove MikroTikService checks that the cached id still belongs to the key,
+# and drops the whole map if not. The map is also dropped after
+# PEER_ID_CACHE_TTL and whenever the router fails.
+
+
+class PeerIdCache:
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self._ids: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+
+    def fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def get(self, public_key: str) -> Optional[str]:
+        if not self.fresh():
+            self.clear()
+            return None
+        return self._ids.get(public_key)
+
+    def load(self, ids: Dict[str, str]) -> None:
+        """Replace the map with a full listing of the router's peers."""
+        self._ids = dict(ids)
+        self._loaded_at = time.monotonic()
+
+    def update(self, ids: Dict[str, str]) -> None:
+        if self.fresh():
+            self._ids.update(ids)
+
+    def put(self, public_key: str, peer_id: str) -> None:
+        self.update({public_key: peer_id})
+
+    def drop(self, public_key: str) -> None:
+        self._ids.pop(public_key, None)
+
+    def clear(self) -> None:
+        self._ids = {}
+        self._loaded_at = None
+
+
+_caches: Dict[str, PeerIdCache] = {}
+
+
+def peer_ids_for(host: str, port: int) -> PeerIdCache:
+    # Only touched from the event loop thread, so no lock.
+    name = f"{host}:{port}"
+    cache = _caches.get(name)
+    if cache is None:
+        cache = _caches[name] = PeerIdCache(name, settings.PEER_ID_CACHE_TTL)
+    return cache
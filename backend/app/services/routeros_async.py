@@ -0,0 +1,300 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import socket
+import ssl
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Asyncio RouterOS API client (the binary API on 8728, or api-ssl on 8729).
+#
+# A sentence is a list of length-prefixed words ended by an empty word. Every
+# command carries a ``.tag`` and the router echoes it on each reply, so one
+# connection per router serves any number of concurrent commands: a single
+# reader task routes replies to the waiting command by tag. ``print`` results
+# are streamed one ``!re`` at a time.
+#
+# Used by MikroTikService when MIKROTIK_DRIVER=asyncio; the default thread
+# driver keeps using the blocking ``routeros_api`` library.
+
+# TCP keepalive on the shared connections, so one to a router that went away
+# (reboot, NAT timeout) fails instead of hanging the next command.
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+
+class RouterOsTrap(Exception):
+    """The router answered with ``!trap`` (bad command, duplicate peer, login failure...)."""
+
+    def __init__(self, message: str, category: Optional[str] = None):
+        super().__init__(message)
+        self.category = category
+
+
+class RouterOsConnectionError(Exception):
+    """The connection failed or was closed (``!fatal``, EOF, protocol error)."""
+
+
+# Wire format
+
+def encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, "big")
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, "big")
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, "big")
+    return b"\xF0" + length.to_bytes(4, "big")
+
+
+def encode_sentence(words: Iterable[str]) -> bytes:
+    out = bytearray()
+    for word in words:
+        data = word.encode("utf-8")
+        out += encode_length(len(data)) + data
+    out += b"\x00"
+    return bytes(out)
+
+
+async def _read_length(reader: asyncio.StreamReader) -> int:
+    first = (await reader.readexactly(1))[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return ((first & 0x3F) << 8) | (await reader.readexactly(1))[0]
+    if first < 0xE0:
+        return ((first & 0x1F) << 16) | int.from_bytes(await reader.readexactly(2), "big")
+    if first < 0xF0:
+        return ((first & 0x0F) << 24) | int.from_bytes(await reader.readexactly(3), "big")
+    if first == 0xF0:
+        return int.from_bytes(await reader.readexactly(4), "big")
+    raise RouterOsConnectionError(f"Invalid word length prefix 0x{first:02x}")
+
+
+async def read_sentence(reader: asyncio.StreamReader) -> List[str]:
+    words = []
+    while True:
+        length = await _read_length(reader)
+        if length == 0:
+            return words
+        words.append((await reader.readexactly(length)).decode("utf-8", errors="replace"))
+
+
+def parse_reply(words: List[str]) -> Tuple[str, Optional[str], Dict[str, str]]:
+    """Split a reply into (type, tag, attributes)."""
+    kind, tag, attrs = words[0], None, {}
+    for word in words[1:]:
+        if word.startswith(".tag="):
+            tag = word[5:]
+        elif word.startswith("="):
+            key, _, value = word[1:].partition("=")
+            attrs[key] = value
+    return kind, tag, attrs
+
+
+def command_words(command: str, attrs: Optional[Dict[str, str]] = None,
+                  queries: Optional[Dict[str, str]] = None, proplist: Optional[Iterable[str]] = None) -> List[str]:
+    words = [command]
+    words += [f"={key}={value}" for key, value in (attrs or {}).items()]
+    if proplist:
+        words.append(f"=.proplist={','.join(proplist)}")
+    words += [f"?{key}={value}" for key, value in (queries or {}).items()]
+    return words
+
+
+def _set_keepalive(sock) -> None:
+    if sock is None:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Linux names; elsewhere the system defaults apply.
+    for option, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE), ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                          ("TCP_KEEPCNT", KEEPALIVE_COUNT)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+class RouterOsConnection:
+    def __init__(self, host: str, port: int, user: str, password: str, use_ssl: bool = False,
+                 ssl_verify: bool = True, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.ssl_verify = ssl_verify
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[str, asyncio.Queue] = {}
+        self._tags = itertools.count(1)
+        self.closed = True
+
+    def _ssl_context(self) -> Optional[ssl.SSLContext]:
+        if not self.use_ssl:
+            return None
+        context = ssl.create_default_context()
+        if not self.ssl_verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    async def open(self) -> None:
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self._ssl_context()), self.timeout
+            )
+        except asyncio.TimeoutError:
+            raise RouterOsConnectionError(f"Timed out connecting to {self.host}:{self.port}")
+        _set_keepalive(self._writer.get_extra_info("socket"))
+        self.closed = False
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+        try:
+            await asyncio.wait_for(self._login(), self.timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _login(self) -> None:
+        done = await self.call("/login", {"name": self.user, "password": self.password}, done=True)
+        if "ret" in done:
+            # RouterOS < 6.43: MD5 challenge/response.
+            challenge = bytes.fromhex(done["ret"])
+            response = hashlib.md5(b"\x00" + self.password.encode("utf-8") + challenge).hexdigest()
+            await self.call("/login", {"name": self.user, "response": "00" + response})
+
+    async def _read_loop(self) -> None:
+        error: Exception = RouterOsConnectionError("Connection closed")
+        try:
+            while True:
+                words = await read_sentence(self._reader)
+                if not words:
+                    continue
+                kind, tag, attrs = parse_reply(words)
+                if kind == "!fatal":
+                    error = RouterOsConnectionError(f"Router closed the connection: {words[1:]}")
+                    break
+                queue = self._pending.get(tag)
+                if queue is not None:
+                    queue.put_nowait((kind, attrs))
+                # Replies for unknown tags belong to cancelled commands.
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            error = RouterOsConnectionError(str(e) or "Connection closed")
+        except RouterOsConnectionError as e:
+            error = e
+        finally:
+            self.closed = True
+            for queue in self._pending.values():
+                queue.put_nowait(("!error", error))
+            if self._writer is not None:
+                self._writer.close()
+
+    async def _send(self, words: List[str]) -> None:
+        if self.closed:
+            raise RouterOsConnectionError(f"Connection to {self.host}:{self.port} is closed")
+        # One write per sentence, so concurrent commands never interleave words.
+        self._writer.write(encode_sentence(words))
+        await self._writer.drain()
+
+    async def stream(self, command: str, attrs: Optional[Dict[str, str]] = None,
+                     queries: Optional[Dict[str, str]] = None, proplist: Optional[Iterable[str]] = None,
+                     done_attrs: Optional[Dict[str, str]] = None) -> AsyncIterator[Dict[str, str]]:
+        """Run ``command`` and yield each ``!re`` row as it arrives.
+
+        Raises RouterOsTrap on ``!trap``. ``done_attrs`` receives the ``!done``
+        attributes (e.g. ``ret``, the id of an added item).
+        """
+        tag = str(next(self._tags))
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[tag] = queue
+        finished = False
+        trap = None
+        try:
+            await self._send(command_words(command, attrs, queries, proplist) + [f".tag={tag}"])
+            while True:
+                kind, data = await queue.get()
+                if kind == "!re":
+                    yield data
+                elif kind == "!trap":
+                    trap = trap or RouterOsTrap(data.get("message", "trap"), data.get("category"))
+                elif kind == "!done":
+                    finished = True
+                    if trap:
+                        raise trap
+                    if done_attrs is not None:
+                        done_attrs.update(data)
+                    return
+                elif kind == "!error":
+                    finished = True
+                    raise data
+                # "!empty" (RouterOS 7.18+): no rows, "!done" follows.
+        finally:
+            self._pending.pop(tag, None)
+            if not finished and not self.closed:
+                # Stopped early (consumer broke out or was cancelled): stop the router's side too.
+                try:
+                    self._writer.write(encode_sentence(["/cancel", f"=tag={tag}"]))
+                except Exception:
+                    pass
+
+    async def call(self, command: str, attrs: Optional[Dict[str, str]] = None,
+                   queries: Optional[Dict[str, str]] = None, proplist: Optional[Iterable[str]] = None,
+                   done: bool = False):
+        """Run ``command`` to completion. Returns the rows, or the ``!done`` attributes if ``done``."""
+        done_attrs: Dict[str, str] = {}
+        rows = [row async for row in self.stream(command, attrs, queries, proplist, done_attrs)]
+        return done_attrs if done else rows
+
+    async def close(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        elif self._writer is not None:
+            self._writer.close()
+        self.closed = True
+
+
+# One shared connection per router and credentials, per worker.
+_connections: Dict[Tuple[str, int, str], RouterOsConnection] = {}
+_connect_locks: Dict[Tuple[str, int, str], asyncio.Lock] = {}
+
+
+async def connect(host: str, port: int, user: str, password: str, use_ssl: bool = False,
+                  ssl_verify: bool = True, timeout: float = 10.0) -> RouterOsConnection:
+    key = (host, port, user)
+    lock = _connect_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        connection = _connections.get(key)
+        if connection is not None and not connection.closed and connection.password == password:
+            return connection
+        if connection is not None:
+            await connection.close()
+        connection = RouterOsConnection(host, port, user, password, use_ssl, ssl_verify, timeout)
+        await connection.open()
+        _connections[key] = connection
+        logger.info("RouterOS API connected to %s:%s (%s)", host, port, "ssl" if use_ssl else "plain")
+        return connection
+
+
+async def discard(connection: RouterOsConnection) -> None:
+    """Close ``connection`` and stop handing it out: a command on it timed out,
+    so the router or the path to it may be hung. The next connect() opens a new one.
+    """
+    key = (connection.host, connection.port, connection.user)
+    if _connections.get(key) is connection:
+        del _connections[key]
+    await connection.close()
+
+
+async def close_all() -> None:
+    connections = list(_connections.values())
+    _connections.clear()
+    await asyncio.gather(*(c.close() for c in connections), return_exceptions=True)
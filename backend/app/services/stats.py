@@ -0,0 +1,210 @@
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlmodel import Session, func, select
+
+from ..core import scheduler
+from ..core.config import settings
+from ..core.deps import engine
+from ..core.generations import bump_generation, NODE_LIST
+from ..models.database import AuditLog, Node, Region, StatCounter, User, WireGuardPeer
+
+logger = logging.getLogger(__name__)
+
+# Dashboard counters.
+#
+# Writers adjust the ``statcounter`` rows in the same transaction as their
+# change (like ``bump_generation``), so /admin/stats reads a handful of rows
+# instead of scanning peers and audit logs. ``verify`` recomputes everything
+# from the source tables and fixes any drift, including ``Node.current_peers``.
+
+PEERS_TOTAL = "peers:total"
+USERS_TOTAL = "users:total"
+LOGINS = "logins"
+PROVISIONS = "provisions"
+HOURLY_KINDS = (LOGINS, PROVISIONS)
+# Audit action behind each hourly counter, used by verify.
+_HOURLY_ACTIONS = {"LOGIN": LOGINS, "PROVISION": PROVISIONS}
+
+# Scheduled job running ``run_verification`` (see main.py).
+VERIFY_JOB = "stats-verify"
+
+
+def node_key(node_id: UUID) -> str:
+    return f"peers:node:{node_id}"
+
+
+def region_key(region_id: UUID) -> str:
+    return f"peers:region:{region_id}"
+
+
+def hour_key(kind: str, when: datetime) -> str:
+    return f"{kind}:{when:%Y-%m-%dT%H}"
+
+
+def incr(session: Session, key: str, delta: int = 1) -> None:
+    """Add ``delta`` to a counter. Committed with the caller's transaction."""
+    session.execute(
+        text(
+            "INSERT INTO statcounter (key, value) VALUES (:key, :delta) "
+            "ON CONFLICT (key) DO UPDATE SET value = statcounter.value + :delta"
+        ),
+        {"key": key, "delta": delta},
+    )
+
+
+def _set(session: Session, key: str, value: int) -> None:
+    session.execute(
+        text(
+            "INSERT INTO statcounter (key, value) VALUES (:key, :value) "
+            "ON CONFLICT (key) DO UPDATE SET value = :value"
+        ),
+        {"key": key, "value": value},
+    )
+
+
+def peers_changed(session: Session, node: Node, delta: int) -> None:
+    """Active peers on ``node`` went up or down by ``delta``."""
+    incr(session, node_key(node.id), delta)
+    incr(session, region_key(node.region_id), delta)
+    incr(session, PEERS_TOTAL, delta)
+
+
+def node_deleted(session: Session, node: Node, active_peers: int) -> None:
+    incr(session, region_key(node.region_id), -active_peers)
+    incr(session, PEERS_TOTAL, -active_peers)
+    session.execute(text("DELETE FROM statcounter WHERE key = :key"), {"key": node_key(node.id)})
+
+
+def node_moved(session: Session, node: Node, old_region_id: UUID) -> None:
+    """``node`` changed region: its active peers now count for the new one."""
+    active = session.exec(
+        select(func.count(WireGuardPeer.id))
+        .where(WireGuardPeer.node_id == node.id)
+        .where(WireGuardPeer.status == "ACTIVE")
+    ).one()
+    incr(session, region_key(old_region_id), -active)
+    incr(session, region_key(node.region_id), active)
+
+
+def count_event(session: Session, kind: str, when: Optional[datetime] = None) -> None:
+    incr(session, hour_key(kind, when or datetime.utcnow()))
+
+
+def read_stats(session: Session, hours: int = 24) -> dict:
+    """Dashboard numbers from the counters (reads O(nodes + regions + hours) rows)."""
+    now = datetime.utcnow()
+    hour_marks = [now - timedelta(hours=h) for h in range(hours - 1, -1, -1)]
+    wanted = [PEERS_TOTAL, USERS_TOTAL] + [hour_key(kind, mark) for mark in hour_marks for kind in HOURLY_KINDS]
+    values = dict(session.exec(select(StatCounter.key, StatCounter.value).where(StatCounter.key.in_(wanted))).all())
+
+    nodes = session.exec(select(Node.id, Node.name, Node.region_id, Node.max_capacity)).all()
+    regions = session.exec(select(Region.id, Region.code, Region.name)).all()
+    per_entity = dict(session.exec(
+        select(StatCounter.key, StatCounter.value).where(
+            StatCounter.key.in_([node_key(n.id) for n in nodes] + [region_key(r.id) for r in regions])
+        )
+    ).all())
+
+    return {
+        "active_peers": values.get(PEERS_TOTAL, 0),
+        "users": values.get(USERS_TOTAL, 0),
+        "nodes": [
+            {"id": n.id, "name": n.name, "region_id": n.region_id,
+             "active_peers": per_entity.get(node_key(n.id), 0), "max_capacity": n.max_capacity}
+            for n in nodes
+        ],
+        "regions": [
+            {"id": r.id, "code": r.code, "name": r.name, "active_peers": per_entity.get(region_key(r.id), 0)}
+            for r in regions
+        ],
+        "hourly": [
+            {"hour": f"{mark:%Y-%m-%dT%H}:00", **{kind: values.get(hour_key(kind, mark), 0) for kind in HOURLY_KINDS}}
+            for mark in hour_marks
+        ],
+        "last_verification": scheduler.last_run(session, VERIFY_JOB),
+    }
+
+
+def verify(session: Session) -> List[dict]:
+    """Recompute every counter from the source tables and fix drift.
+
+    Returns the corrected entries. Safe to run concurrently with writers: a
+    counter changed while this runs may be off until the next verification.
+    """
+    drift = []
+
+    def check(key: str, expected: int, current: Optional[int]) -> None:
+        if (current or 0) != expected:
+            drift.append({"key": key, "was": current or 0, "now": expected})
+            _set(session, key, expected)
+
+    stored = dict(session.exec(select(StatCounter.key, StatCounter.value)).all())
+
+    active = dict(session.exec(
+        select(WireGuardPeer.node_id, func.count(WireGuardPeer.id))
+        .where(WireGuardPeer.status == "ACTIVE")
+        .group_by(WireGuardPeer.node_id)
+    ).all())
+    per_region: Counter = Counter()
+    node_list_changed = False
+    for node in session.exec(select(Node)).all():
+        count = active.get(node.id, 0)
+        per_region[node.region_id] += count
+        check(node_key(node.id), count, stored.get(node_key(node.id)))
+        if node.current_peers != count:
+            # The capacity counter placement relies on; keep it honest too.
+            drift.append({"key": f"node.current_peers:{node.name}", "was": node.current_peers, "now": count})
+            node.current_peers = count
+            session.add(node)
+            node_list_changed = True
+    if node_list_changed:
+        bump_generation(session, NODE_LIST)
+
+    for region_id in session.exec(select(Region.id)).all():
+        check(region_key(region_id), per_region[region_id], stored.get(region_key(region_id)))
+    check(PEERS_TOTAL, sum(active.values()), stored.get(PEERS_TOTAL))
+    check(USERS_TOTAL, session.exec(select(func.count(User.id))).one(), stored.get(USERS_TOTAL))
+
+    # Hourly buckets inside the verification window, rebuilt from the audit log.
+    since = (datetime.utcnow() - timedelta(hours=settings.STATS_VERIFY_HOURS)).replace(minute=0, second=0, microsecond=0)
+    hourly: Counter = Counter()
+    for action, created_at in session.exec(
+        select(AuditLog.action, AuditLog.created_at)
+        .where(AuditLog.action.in_(list(_HOURLY_ACTIONS)))
+        .where(AuditLog.created_at >= since)
+    ).all():
+        hourly[hour_key(_HOURLY_ACTIONS[action], created_at)] += 1
+    mark = since
+    while mark <= datetime.utcnow():
+        for kind in HOURLY_KINDS:
+            key = hour_key(kind, mark)
+            if key in hourly or key in stored:
+                check(key, hourly[key], stored.get(key))
+        mark += timedelta(hours=1)
+
+    # Counters of deleted nodes/regions and hours past retention.
+    live = {node_key(n) for n in session.exec(select(Node.id)).all()}
+    live |= {region_key(r) for r in session.exec(select(Region.id)).all()}
+    oldest_hour = f"{datetime.utcnow() - timedelta(hours=settings.STATS_RETENTION_HOURS):%Y-%m-%dT%H}"
+    for key in stored:
+        if key.startswith(("peers:node:", "peers:region:")) and key not in live:
+            session.execute(text("DELETE FROM statcounter WHERE key = :key"), {"key": key})
+        elif key.startswith(tuple(f"{kind}:" for kind in HOURLY_KINDS)) and key.split(":", 1)[1] < oldest_hour:
+            session.execute(text("DELETE FROM statcounter WHERE key = :key"), {"key": key})
+
+    session.commit()
+    return drift
+
+
+def run_verification() -> dict:
+    started = datetime.utcnow()
+    with Session(engine) as session:
+        drift = verify(session)
+    if drift:
+        logger.warning("Stats verification fixed %d counters: %s", len(drift), drift)
+    return {"at": started.isoformat(), "drift": drift}
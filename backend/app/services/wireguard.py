@@ -1,15 +1,55 @@
 from fastapi import HTTPException
-from typing import Optional
+from typing import Iterable, Optional
+from uuid import UUID
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select, func
 from ..models.database import Node, Region, WireGuardPeer, User, AuditLog
 from .mikrotik import MikroTikService
+from .circuit_breaker import CircuitOpenError, breaker_for
+from .bulkhead import BulkheadFull, RouterTimeout
+from ..core.deadlines import DeadlineExceeded, RequestCancelled
+from ..core.tracing import span
+from .node_events import publish_capacity_change
+from . import stats
 import ipaddress
 
+class RouterUnavailable(HTTPException):
+    """The node's router failed, is busy or its circuit breaker is open; placement may try another node."""
+
+    def __init__(self, node: Node, detail: str, status_code: int = 502):
+        super().__init__(status_code=status_code, detail=detail)
+        self.node = node
+
+    @classmethod
+    def from_error(cls, node: Node, prefix: str, e: Exception) -> "RouterUnavailable":
+        if isinstance(e, (CircuitOpenError, BulkheadFull)):
+            status_code = 503
+        elif isinstance(e, RouterTimeout):
+            status_code = 504
+        else:
+            status_code = 502
+        return cls(node, f"{prefix}: {str(e)}", status_code)
+
+
+# Raised when the request itself is over (client gone, budget spent): never
+# retried on another node, and never swallowed like router errors.
+REQUEST_ABORTED = (DeadlineExceeded, RequestCancelled)
+
+
+def is_simulation(node: Node) -> bool:
+    return "example.com" in node.mt_host
+
+
+def router_available(node: Node) -> bool:
+    # Simulated nodes have no router; their failures are expected and tolerated.
+    return is_simulation(node) or breaker_for(node.mt_host, node.mt_api_port).allows()
+
+
 class WireGuardService:
     def __init__(self, session: Session):
         self.session = session
 
-    def get_best_node(self, region_code: str, user_role: str = "USER") -> Optional[Node]:
+    def get_best_node(self, region_code: str, user_role: str = "USER", exclude: Iterable[UUID] = ()) -> Optional[Node]:
         # Select active nodes in region, ordered by health and capacity
         params = [
             Node.status == "UP",
@@ -26,7 +66,12 @@ class WireGuardService:
             .where(*params)
             .order_by(Node.priority.desc(), Node.current_peers.asc())
         )
-        return self.session.exec(statement).first()
+        # Skip nodes already tried and nodes whose router breaker is open.
+        exclude = set(exclude)
+        for node in self.session.exec(statement):
+            if node.id not in exclude and router_available(node):
+                return node
+        return None
 
     def get_next_ip(self, node: Node) -> str:
         # Get all IPs currently assigned to active or inactive users to avoid conflicts
@@ -55,37 +100,48 @@ class WireGuardService:
         )
         existing_peer = self.session.exec(statement).first()
         
-        is_simulation = "example.com" in node.mt_host
+        simulated = is_simulation(node)
+        if not router_available(node):
+            # Fail fast, before revoking the user's current peer.
+            raise RouterUnavailable(node, f"Node {node.name} router unavailable", status_code=503)
 
         if existing_peer:
-            # CHECK: If the public key has changed, update it on MikroTik
+            # CHECK: If the public key has changed, rotate it in place on MikroTik
             if existing_peer.client_public_key != public_key:
                 try:
-                    if not is_simulation:
+                    if not simulated:
                         async with MikroTikService(node.mt_host, node.mt_user, node.mt_pass, port=node.mt_api_port) as mt:
-                            await mt.add_peer(
+                            await mt.rotate_peer_key(
                                 interface=node.interface_name,
-                                public_key=public_key,
+                                old_key=existing_peer.client_public_key,
+                                new_key=public_key,
                                 allowed_address=existing_peer.assigned_ip,
-                                comment=f"User: {user.username} (Key Sync)"
+                                comment=f"User: {user.username} | {user.id}"
                             )
                     existing_peer.client_public_key = public_key
                     self.session.add(existing_peer)
                     self.session.commit()
+                except REQUEST_ABORTED:
+                    raise
                 except Exception as e:
-                    if not is_simulation:
-                        raise HTTPException(status_code=502, detail=f"MikroTik Key Sync Error: {str(e)}")
+                    if not simulated:
+                        raise RouterUnavailable.from_error(node, "MikroTik Key Sync Error", e)
+            # Re-provisioning where a drain moved the peer: the old one can go.
+            if await self.release_migrated_peers(user):
+                self.session.commit()
             return existing_peer
 
         # 2. Revoke existing active peers on other nodes (1-device rule)
-        await self.revoke_all_user_peers(user)
+        with span("peers.revoke"):
+            await self.revoke_all_user_peers(user)
         
         # 3. Handle Static IP Assignment
         if user.assigned_ip:
             assigned_ip = user.assigned_ip
         else:
             # First time connecting: Assign a new IP by scanning for available ones
-            assigned_ip = self.get_next_ip(node)
+            with span("ip.allocate", node=node.name):
+                assigned_ip = self.get_next_ip(node)
             user.assigned_ip = assigned_ip
             self.session.add(user)
             # No longer need to update next_ip_cursor as get_next_ip scans the pool
@@ -100,11 +156,13 @@ class WireGuardService:
                     allowed_address=assigned_ip,
                     comment=comment
                 )
+        except REQUEST_ABORTED:
+            raise
         except Exception as e:
-            if is_simulation:
+            if simulated:
                 print(f"WS-SIMULATION-WARNING: MikroTik at {node.mt_host} unreachable. Error: {e}")
             else:
-                raise HTTPException(status_code=502, detail=f"MikroTik Error: {str(e)}")
+                raise RouterUnavailable.from_error(node, "MikroTik Error", e)
         
         # 5. Save Peer to DB
         peer = WireGuardPeer(
@@ -117,8 +175,11 @@ class WireGuardService:
         self.session.add(peer)
         
         # Update node count
+        previous_peers = node.current_peers
         node.current_peers += 1
         self.session.add(node)
+        stats.peers_changed(self.session, node, +1)
+        stats.count_event(self.session, stats.PROVISIONS)
         
         # Audit Log
         log = AuditLog(
@@ -128,12 +189,21 @@ class WireGuardService:
         )
         self.session.add(log)
         
+        # The client node list only changes when the node fills up; that
+        # event also invalidates it in every worker. Other provisions leave the
+        # shared cachegeneration row alone, so they do not contend on it.
+        publish_capacity_change(self.session, node, previous_peers)
         self.session.commit()
         self.session.refresh(peer)
         return peer
 
     async def revoke_all_user_peers(self, user: User):
-        statement = select(WireGuardPeer).where(WireGuardPeer.user_id == user.id).where(WireGuardPeer.status == "ACTIVE")
+        statement = (
+            select(WireGuardPeer)
+            .where(WireGuardPeer.user_id == user.id)
+            .where(WireGuardPeer.status == "ACTIVE")
+            .options(selectinload(WireGuardPeer.node))  # one query for all nodes, not one per peer
+        )
         active_peers = self.session.exec(statement).all()
         
         for peer in active_peers:
@@ -141,13 +211,45 @@ class WireGuardService:
             try:
                 async with MikroTikService(node.mt_host, node.mt_user, node.mt_pass, port=node.mt_api_port) as mt:
                     await mt.remove_peer(peer.client_public_key)
+            except REQUEST_ABORTED:
+                raise  # Nothing committed yet: the peer stays ACTIVE
             except Exception as e:
                 # Log error but continue to update DB
                 print(f"Error revoking peer on MikroTik: {e}")
             
             peer.status = "REVOKED"
-            node.current_peers -= 1
+            # Never below zero; stats.verify reconciles the count with the peer table.
+            previous_peers = node.current_peers
+            node.current_peers = max(0, node.current_peers - 1)
             self.session.add(peer)
             self.session.add(node)
-            
+            stats.peers_changed(self.session, node, -1)
+            publish_capacity_change(self.session, node, previous_peers)
+
+        await self.release_migrated_peers(user)
         self.session.commit()
+
+    async def release_migrated_peers(self, user: User) -> bool:
+        """Remove the source-router peers a drain kept for ``user`` until its
+        client moved (see services/drain.py). Committed by the caller.
+
+        Already out of the node counts, so only the rows change.
+        """
+        migrated = self.session.exec(
+            select(WireGuardPeer)
+            .where(WireGuardPeer.user_id == user.id)
+            .where(WireGuardPeer.status == "MIGRATED")
+            .options(selectinload(WireGuardPeer.node))
+        ).all()
+        for peer in migrated:
+            node = peer.node
+            try:
+                async with MikroTikService(node.mt_host, node.mt_user, node.mt_pass, port=node.mt_api_port) as mt:
+                    await mt.remove_peer(peer.client_public_key)
+            except REQUEST_ABORTED:
+                raise
+            except Exception as e:
+                print(f"Error revoking peer on MikroTik: {e}")
+            peer.status = "REVOKED"
+            self.session.add(peer)
+        return bool(migrated)
@@ -0,0 +1,137 @@
+"""Per-request overhead of the request middleware stack.
+
+Compares the previous two ``@app.middleware("http")`` layers (version gate +
+audit context) against ``RequestContextMiddleware`` on a trivial endpoint, so
+the difference is the middleware cost alone.
+
+Usage (from ``backend/``):
+    python benchmarks/bench_middleware.py [requests]
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from uuid import UUID
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.core.audit_logging import set_audit_context, reset_audit_context
+from app.core.config import settings
+from app.core.middleware import RequestContextMiddleware
+
+
+def _endpoint_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get(f"{settings.API_V1_STR}/regions/")
+    async def regions():
+        return []
+
+    return app
+
+
+def legacy_app() -> FastAPI:
+    app = _endpoint_app()
+
+    @app.middleware("http")
+    async def enforce_client_version(request: Request, call_next):
+        path = request.url.path
+        if path.startswith(settings.API_V1_STR):
+            if path.startswith(f"{settings.API_V1_STR}/admin"):
+                return await call_next(request)
+            if path.startswith(f"{settings.API_V1_STR}/auth"):
+                return await call_next(request)
+            if path == f"{settings.API_V1_STR}/openapi.json":
+                return await call_next(request)
+            client_version = request.headers.get("X-Client-Version")
+            if client_version != settings.REQUIRED_CLIENT_VERSION:
+                return JSONResponse(status_code=426, content={"detail": "Client version not supported"})
+        return await call_next(request)
+
+    @app.middleware("http")
+    async def audit_request_logs(request: Request, call_next):
+        token = None
+        token_path = None
+        try:
+            path = request.url.path
+            user_id = None
+            auth = request.headers.get("authorization")
+            if auth and auth.lower().startswith("bearer "):
+                try:
+                    from jose import jwt
+                    from app.core.security import ALGORITHM
+
+                    payload = jwt.decode(auth.split(" ", 1)[1].strip(), settings.SECRET_KEY, algorithms=[ALGORITHM])
+                    user_id = UUID(str(payload.get("sub")))
+                except Exception:
+                    user_id = None
+            token, token_path = set_audit_context(user_id=user_id, path=path)
+            logging.info("HTTP %s %s", request.method, path)
+            response = await call_next(request)
+            logging.info("HTTP %s %s -> %s", request.method, path, response.status_code)
+            return response
+        finally:
+            if token is not None and token_path is not None:
+                reset_audit_context(token, token_path)
+
+    return app
+
+
+def asgi_app() -> FastAPI:
+    app = _endpoint_app()
+    app.add_middleware(RequestContextMiddleware)
+    return app
+
+
+async def _drive(app, n: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": f"{settings.API_V1_STR}/regions/",
+        "raw_path": f"{settings.API_V1_STR}/regions/".encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"x-client-version", settings.REQUIRED_CLIENT_VERSION.encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+        "state": {},
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(200):  # warm up (route compilation, lazy imports)
+        await app(dict(scope), receive, send)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    logging.basicConfig(level=logging.WARNING)
+
+    bare = asyncio.run(_drive(_endpoint_app(), n))
+    legacy = asyncio.run(_drive(legacy_app(), n))
+    pure = asyncio.run(_drive(asgi_app(), n))
+
+    print(f"{n} requests")
+    for label, elapsed in (("no middleware", bare), ("2x BaseHTTPMiddleware", legacy), ("RequestContextMiddleware", pure)):
+        overhead = (elapsed - bare) / n * 1e6
+        print(f"{label:<26} {elapsed / n * 1e6:8.1f} us/req   overhead {overhead:7.1f} us/req")
+
+
+if __name__ == "__main__":
+    main()
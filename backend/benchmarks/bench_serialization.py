@@ -0,0 +1,93 @@
+"""Cost of serialising the admin user listing (``GET /admin/users``).
+
+Fills a throw-away SQLite database with N users and compares the previous
+path (load full ``User`` rows, ``jsonable_encoder`` + stdlib ``json``, what
+FastAPI does for a route returning table objects) with the current one
+(column select from ``UserRead`` + orjson). Reports query and encode time
+separately, payload size, gzipped size and gzip time.
+
+Usage (from ``backend/``):
+    python benchmarks/bench_serialization.py [users]
+"""
+import base64
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.core.config import settings
+from app.core.responses import orjson
+from app.models.database import User
+from app.schemas.admin import UserRead, column_list, rows_as_dicts
+
+
+def _fill(engine, n: int) -> None:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.bulk_insert_mappings(User, [
+            {
+                "id": uuid.uuid4(),
+                "username": f"user{i:06d}",
+                # bcrypt-shaped (random, incompressible) without paying for bcrypt
+                "password_hash": "$2b$12$" + base64.b64encode(os.urandom(40)).decode()[:53],
+                "role": "USER",
+                "device_id": uuid.uuid4().hex[:12] if i % 2 else None,
+                "is_active": True,
+                "assigned_ip": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            }
+            for i in range(n)
+        ])
+        session.commit()
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def legacy(engine):
+    with Session(engine) as session:
+        rows, query = _timed(lambda: session.exec(select(User)).all())
+        body, encode = _timed(lambda: json.dumps(jsonable_encoder(rows), separators=(",", ":")).encode())
+    return query, encode, body
+
+
+def current(engine):
+    with Session(engine) as session:
+        rows, query = _timed(lambda: rows_as_dicts(session.exec(select(*column_list(User, UserRead))).all()))
+        if orjson is not None:
+            body, encode = _timed(lambda: orjson.dumps(rows))
+        else:
+            body, encode = _timed(lambda: json.dumps(jsonable_encoder(rows), separators=(",", ":")).encode())
+    return query, encode, body
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    tmp = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{tmp}/bench.db")
+    _fill(engine, n)
+
+    print(f"{n} users, orjson {'available' if orjson is not None else 'NOT installed'}")
+    print(f"{'path':<34}{'query':>10}{'encode':>10}{'total':>10}{'bytes':>12}{'gzip':>12}{'gzip time':>11}")
+    for label, fn in (("select(User) + jsonable_encoder", legacy), ("select(UserRead cols) + orjson", current)):
+        fn(engine)  # warm up
+        query, encode, body = fn(engine)
+        compressed, gzip_time = _timed(lambda: gzip.compress(body, compresslevel=settings.GZIP_LEVEL))
+        print(
+            f"{label:<34}{query * 1000:>8.0f}ms{encode * 1000:>8.0f}ms{(query + encode) * 1000:>8.0f}ms"
+            f"{len(body):>12,}{len(compressed):>12,}{gzip_time * 1000:>9.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Throughput of the API versus the number of worker processes.
+
+Starts gunicorn against a throw-away SQLite database for each worker count,
+logs in once and hammers ``GET /regions/`` (JWT decode + user lookup + cached
+node list) from concurrent keep-alive connections.
+
+With ``--provision`` each connection instead logs in as its own user and
+moves it back and forth between the seeded nodes with
+``POST /me/wireguard-config`` (revoke + provision, routers simulated): the
+write path, where shared rows serialize the workers.
+
+Usage (from ``backend/``):
+    python benchmarks/bench_workers.py [workers ...] [--seconds 10] [--concurrency 64] [--provision]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PORT = 8765
+
+
+def _seed(env):
+    subprocess.run([sys.executable, "seed.py"], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+
+
+async def _wait_ready(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def _provision_load(client: httpx.AsyncClient, seconds: float, concurrency: int) -> int:
+    version = os.environ.get("REQUIRED_CLIENT_VERSION", "3.0")
+    nodes = (await client.get("/api/v1/admin/nodes")).json()
+    for node in nodes:
+        # Simulated routers: provisioning skips the MikroTik API
+        await client.patch(f"/api/v1/admin/nodes/{node['id']}", json={"mt_host": f"{node['id']}.example.com"})
+
+    async def login(i):
+        await client.post("/api/v1/admin/users", json={"username": f"bench-{i}", "password": "bench"})
+        resp = await client.post("/api/v1/auth/login", data={"username": f"bench-{i}", "password": "bench"})
+        return {"Authorization": f"Bearer {resp.json()['access_token']}", "X-Client-Version": version}
+
+    users = await asyncio.gather(*(login(i) for i in range(concurrency)))
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(i, headers):
+        nonlocal done
+        payload = {"public_key": f"bench-key-{i}", "device_id": f"bench-{i}"}
+        while time.perf_counter() < deadline:
+            payload["region"] = nodes[done % len(nodes)]["id"]
+            r = await client.post("/api/v1/me/wireguard-config", json=payload, headers=headers)
+            r.raise_for_status()
+            done += 1
+
+    await asyncio.gather(*(worker(i, headers) for i, headers in enumerate(users)))
+    return done
+
+
+async def _load(seconds: float, concurrency: int, provision: bool = False) -> float:
+    base = f"http://127.0.0.1:{PORT}"
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=120) as client:
+        await _wait_ready(client)
+        if provision:
+            start = time.perf_counter()
+            done = await _provision_load(client, seconds, concurrency)
+            return done / (time.perf_counter() - start)
+        resp = await client.post("/api/v1/auth/login", data={"username": "admin", "password": "admin123"})
+        headers = {
+            "Authorization": f"Bearer {resp.json()['access_token']}",
+            "X-Client-Version": os.environ.get("REQUIRED_CLIENT_VERSION", "3.0"),
+        }
+        done = 0
+        deadline = time.perf_counter() + seconds
+
+        async def worker():
+            nonlocal done
+            while time.perf_counter() < deadline:
+                r = await client.get("/api/v1/regions/", headers=headers)
+                r.raise_for_status()
+                done += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return done / (time.perf_counter() - start)
+
+
+def run(workers: int, seconds: float, concurrency: int, provision: bool = False) -> float:
+    tmp = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp}/bench.db",
+        WEB_CONCURRENCY=str(workers),
+        BIND=f"127.0.0.1:{PORT}",
+        INIT_LOCK_PATH=f"{tmp}/.init.lock",
+        RATE_LIMIT_SQLITE_PATH=f"{tmp}/rate_limits.db",
+        RATE_LIMIT_ENABLED="false",
+    )
+    _seed(env)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning", "app.main:app"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    try:
+        return asyncio.run(_load(seconds, concurrency, provision))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("workers", nargs="*", type=int, default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--provision", action="store_true", help="measure POST /me/wireguard-config instead")
+    args = parser.parse_args()
+
+    print(f"cpus={os.cpu_count()} concurrency={args.concurrency} seconds={args.seconds} provision={args.provision}")
+    baseline = None
+    for n in args.workers:
+        rps = run(n, args.seconds, args.concurrency, args.provision)
+        baseline = baseline or rps
+        print(f"workers={n:<3} {rps:8.0f} req/s   x{rps / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
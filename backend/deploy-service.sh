@@ -7,9 +7,11 @@ APP_NAME="wg-premium-backend"
 USER_NAME=$(whoami)
 CUR_DIR=$(pwd)
 VENV_BIN="$CUR_DIR/venv/bin/python"
-UVICORN_BIN="$CUR_DIR/venv/bin/uvicorn"
+GUNICORN_BIN="$CUR_DIR/venv/bin/gunicorn"
+# Número de workers (por defecto, uno por núcleo)
+WORKERS=${WEB_CONCURRENCY:-$(nproc)}
 
-echo "🛠️ Creando servicio de sistema para $APP_NAME..."
+echo "🛠️ Creando servicio de sistema para $APP_NAME ($WORKERS workers)..."
 
 SERVICE_FILE="[Unit]
 Description=Gunicorn instance to serve WG Premium Backend
@@ -20,7 +22,9 @@ User=$USER_NAME
 Group=www-data
 WorkingDirectory=$CUR_DIR
 Environment=\"PATH=$CUR_DIR/venv/bin\"
-ExecStart=$UVICORN_BIN app.main:app --host 0.0.0.0 --port 8000
+Environment=\"WEB_CONCURRENCY=$WORKERS\"
+ExecStart=$GUNICORN_BIN -c gunicorn.conf.py app.main:app
+ExecReload=/bin/kill -HUP \$MAINPID
 
 [Install]
 WantedBy=multi-user.target"
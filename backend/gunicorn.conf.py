@@ -0,0 +1,21 @@
+# Configuración de gunicorn para el modo multi-worker.
+# Uso: gunicorn -c gunicorn.conf.py app.main:app
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+# Proxies whose X-Forwarded-For/-Proto are trusted: the client address seen by
+# the app (rate limiting, audit) is then the real client, not the proxy.
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1,::1")
+graceful_timeout = 30
+
+# Workers read WEB_CONCURRENCY (Settings.WORKERS) to size their DB pool and
+# MikroTik thread pool as a share of the host-wide budget.
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# No preload_app: each worker imports the app itself, so engines and thread
+# pools are never shared across fork(). Schema creation is serialized by the
+# init lock in app.main.create_db_and_tables.
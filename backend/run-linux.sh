@@ -5,6 +5,15 @@
 
 source venv/bin/activate
 
-echo "🔥 Iniciando servidor en puerto 8000..."
-# Ejecutamos con uvicorn apuntando a la IP 0.0.0.0 para acceso externo
-uvicorn app.main:app --host 0.0.0.0 --port 8000
+# WEB_CONCURRENCY=N arranca N workers con gunicorn (por defecto 1 worker uvicorn)
+WORKERS=${WEB_CONCURRENCY:-1}
+
+if [ "$WORKERS" -gt 1 ]; then
+    echo "🔥 Iniciando servidor en puerto 8000 con $WORKERS workers..."
+    WEB_CONCURRENCY=$WORKERS gunicorn -c gunicorn.conf.py app.main:app
+else
+    echo "🔥 Iniciando servidor en puerto 8000..."
+    # Ejecutamos con uvicorn apuntando a la IP 0.0.0.0 para acceso externo
+    # Detrás de un proxy inverso, X-Forwarded-For solo se acepta de FORWARDED_ALLOW_IPS
+    uvicorn app.main:app --host 0.0.0.0 --port 8000 --proxy-headers --forwarded-allow-ips "${FORWARDED_ALLOW_IPS:-127.0.0.1,::1}"
+fi
@@ -2,6 +2,7 @@ from sqlmodel import Session, create_engine, select, SQLModel
 from app.models.database import User, Region, Node
 from app.core.security import get_password_hash
 from app.core.config import settings
+from app.core.generations import bump_generation, NODE_LIST
 
 engine = create_engine(
     settings.DATABASE_URL,
@@ -57,6 +58,8 @@ def seed():
                 mt_api_port=8750
             )
             session.add_all([n1, n2])
+            # Running API workers cache the node list.
+            bump_generation(session, NODE_LIST)
         
         # 3. Create Admin & Test User (check if they exist)
         existing_users = session.exec(select(User)).all()
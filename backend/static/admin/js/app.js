@@ -7,6 +7,15 @@ class AdminApp {
         this.nodes = [];
         this.regions = [];
         this.auditLogs = [];
+        this.drains = [];
+        this.stats = null;
+        this.drainPoll = null;
+        this.liveSocket = null;
+        this.liveCursor = null;
+        this.liveRetry = 0;
+        this.liveTimer = null;
+        this.livePending = [];
+        this.liveFlush = null;
         this.init();
     }
 
@@ -15,7 +24,7 @@ class AdminApp {
             document.getElementById('login-overlay').classList.remove('hidden');
         } else {
             document.getElementById('login-overlay').classList.add('hidden');
-            this.refreshAll();
+            this.refreshAll().then(() => this.startLiveLogs());
         }
     }
 
@@ -24,10 +33,18 @@ class AdminApp {
             this.fetchRegions(),
             this.fetchUsers(),
             this.fetchNodes(),
-            this.fetchAuditLogs()
+            this.fetchAuditLogs(),
+            this.fetchDrains(),
+            this.fetchStats()
         ]);
         this.updateOverviewStats();
         this.renderAll();
+
+        // Mientras haya un drenado en curso, refrescar el progreso
+        clearTimeout(this.drainPoll);
+        if (this.drains.some(d => d.status === 'RUNNING')) {
+            this.drainPoll = setTimeout(() => this.refreshAll(), 3000);
+        }
     }
 
     // AUTH
@@ -48,7 +65,7 @@ class AdminApp {
                 this.token = data.access_token;
                 localStorage.setItem('admin_token', this.token);
                 document.getElementById('login-overlay').classList.add('hidden');
-                this.refreshAll();
+                this.refreshAll().then(() => this.startLiveLogs());
             } else {
                 alert('Error: ' + data.detail);
             }
@@ -58,6 +75,7 @@ class AdminApp {
     }
 
     logout() {
+        this.stopLiveLogs();
         localStorage.removeItem('admin_token');
         window.location.reload();
     }
@@ -80,6 +98,8 @@ class AdminApp {
     async fetchNodes() { this.nodes = await this.apiCall('/admin/nodes') || []; }
     async fetchRegions() { this.regions = await this.apiCall('/admin/regions') || []; }
     async fetchAuditLogs() { this.auditLogs = await this.apiCall('/admin/audit-logs') || []; }
+    async fetchDrains() { this.drains = await this.apiCall('/admin/drains') || []; }
+    async fetchStats() { this.stats = await this.apiCall('/admin/stats'); }
 
     // RENDER
     renderAll() {
@@ -92,7 +112,13 @@ class AdminApp {
     }
 
     updateOverviewStats() {
-        document.getElementById('stat-users').innerText = this.users.length;
+        // Contadores mantenidos por el backend (no dependen del tamaño de los listados)
+        const stats = this.stats;
+        const lastHour = stats && stats.hourly.length ? stats.hourly[stats.hourly.length - 1] : null;
+        document.getElementById('stat-users').innerText = stats ? stats.users : this.users.length;
+        document.getElementById('stat-logins-hour').innerText = lastHour ? `${lastHour.logins} logins/h` : '';
+        document.getElementById('stat-peers').innerText = stats ? stats.active_peers : '-';
+        document.getElementById('stat-provisions-hour').innerText = lastHour ? `+${lastHour.provisions}/h` : '';
         document.getElementById('stat-nodes').innerText = this.nodes.length;
         document.getElementById('stat-regions').innerText = this.regions.length;
 
@@ -138,7 +164,9 @@ class AdminApp {
         let html = '';
         this.nodes.forEach(n => {
             const region = this.regions.find(r => r.id === n.region_id);
-            html += `<div class="glass p-6 rounded-2xl border-t-4 ${n.status === 'UP' ? 'border-emerald-500' : 'border-red-500'}">
+            const drain = this.drains.find(d => d.node_id === n.id && d.status === 'RUNNING');
+            const borderColor = n.status === 'UP' ? 'border-emerald-500' : (n.status === 'DRAINING' ? 'border-amber-500' : 'border-red-500');
+            html += `<div class="glass p-6 rounded-2xl border-t-4 ${borderColor}">
                 <div class="flex justify-between items-start mb-4">
                     <div>
                         <h4 class="font-bold text-xl flex items-center gap-2">
@@ -164,9 +192,15 @@ class AdminApp {
                         <div class="flex items-center gap-2 bg-slate-800/50 p-2 rounded-lg"><i data-lucide="globe" size="12" class="text-amber-400"></i> ${n.allowed_ips.slice(0, 15)}...</div>
                         <div class="flex items-center gap-2 bg-slate-800/50 p-2 rounded-lg"><i data-lucide="map-pin" size="12" class="text-emerald-400"></i> ${n.ipv4_pool_cidr}</div>
                     </div>
+                    ${drain ? `<div class="text-xs text-amber-400">Drenando: ${drain.migrated} / ${drain.total_peers} migrados${drain.failed ? `, ${drain.failed} fallidos` : ''}</div>` : ''}
                 </div>
                 <div class="flex justify-end gap-2 border-t border-slate-800 pt-4">
                     <button onclick="adminApp.openEditNodeModal('${n.id}')" class="flex-1 flex justify-center items-center gap-2 text-blue-400 hover:bg-blue-400/10 p-2 rounded-xl transition"><i data-lucide="edit-3" size="14"></i> Editar</button>
+                    ${drain
+                        ? `<button onclick="adminApp.cancelDrain('${drain.id}')" title="Cancelar drenado" class="flex justify-center items-center text-amber-400 hover:bg-amber-400/10 p-2 rounded-xl transition"><i data-lucide="circle-stop" size="14"></i></button>`
+                        : (n.status === 'UP'
+                            ? `<button onclick="adminApp.drainNode('${n.id}')" title="Drenar nodo (migrar peers)" class="flex justify-center items-center text-amber-400 hover:bg-amber-400/10 p-2 rounded-xl transition"><i data-lucide="log-out" size="14"></i></button>`
+                            : `<button onclick="adminApp.setNodeStatus('${n.id}', 'UP')" title="Volver a UP (${n.status})" class="flex justify-center items-center text-emerald-400 hover:bg-emerald-400/10 p-2 rounded-xl transition"><i data-lucide="play" size="14"></i></button>`)}
                     <button onclick="adminApp.deleteNode('${n.id}')" class="flex justify-center items-center text-red-400 hover:bg-red-400/10 p-2 rounded-xl transition"><i data-lucide="trash-2" size="14"></i></button>
                 </div>
             </div>`;
@@ -206,6 +240,26 @@ class AdminApp {
         }
     }
 
+    async drainNode(nodeId) {
+        if (confirm('¿Drenar este nodo? Deja de aceptar conexiones nuevas y sus usuarios se migran a otros nodos de la región.')) {
+            const res = await this.apiCall(`/admin/nodes/${nodeId}/drain`, 'POST');
+            if (!res) alert('No se pudo iniciar el drenado (¿ya está en curso?)');
+            this.refreshAll();
+        }
+    }
+
+    async cancelDrain(drainId) {
+        if (confirm('¿Cancelar el drenado? El nodo seguirá en DRAINING hasta que lo vuelvas a UP.')) {
+            await this.apiCall(`/admin/drains/${drainId}/cancel`, 'POST');
+            this.refreshAll();
+        }
+    }
+
+    async setNodeStatus(nodeId, status) {
+        await this.apiCall(`/admin/nodes/${nodeId}`, 'PATCH', { status });
+        this.refreshAll();
+    }
+
     // EDIT NODE
     async openEditNodeModal(nodeId) {
         const node = this.nodes.find(n => n.id === nodeId);
@@ -223,7 +277,8 @@ class AdminApp {
         document.getElementById('edit-node-allowedips').value = node.allowed_ips;
         document.getElementById('edit-node-mthost').value = node.mt_host;
         document.getElementById('edit-node-mtuser').value = node.mt_user;
-        document.getElementById('edit-node-mtpass').value = node.mt_pass;
+        // La API no devuelve mt_pass: vacío = mantener la contraseña actual
+        document.getElementById('edit-node-mtpass').value = '';
         document.getElementById('edit-node-mtport').value = node.mt_api_port;
         document.getElementById('edit-node-adminonly').checked = node.admin_only || false;
 
@@ -268,11 +323,68 @@ class AdminApp {
         document.getElementById('full-audit-table').innerHTML = html;
     }
 
-    // LIVE LOGS disabled: the polling loop was slowing down initial load.
-    startLiveLogs() {}
-    stopLiveLogs() {}
-    clearLiveLogs() {}
-    appendLiveLogs(_) {}
+    // AUDITORÍA EN VIVO: el backend empuja los registros nuevos por WebSocket.
+    // Al reconectar se envía el cursor del último registro recibido y el backend
+    // reenvía lo que falte; si faltan demasiados ("gap") se recarga el listado.
+    startLiveLogs() {
+        this.stopLiveLogs();
+        const proto = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const ws = new WebSocket(`${proto}//${location.host}${API_URL}/admin/audit-logs/stream`);
+        this.liveSocket = ws;
+
+        ws.onopen = () => {
+            const last = this.auditLogs[0];
+            ws.send(JSON.stringify({
+                token: this.token,
+                cursor: this.liveCursor || (last ? `${last.created_at}|${last.id}` : null),
+                filters: { action: ['LOGIN', 'PROVISION'] }
+            }));
+        };
+        ws.onmessage = (e) => {
+            const msg = JSON.parse(e.data);
+            if (msg.cursor) this.liveCursor = msg.cursor;
+            if (msg.type === 'record') {
+                // Agrupar los registros (p. ej. el backlog) en un solo render
+                this.livePending.push(msg.record);
+                if (!this.liveFlush) {
+                    this.liveFlush = setTimeout(() => {
+                        this.liveFlush = null;
+                        this.appendLiveLogs(this.livePending.splice(0));
+                    }, 250);
+                }
+            } else if (msg.type === 'gap') {
+                this.fetchAuditLogs().then(() => this.appendLiveLogs([]));
+            } else if (msg.type === 'ready') {
+                this.liveRetry = 0;
+            }
+        };
+        ws.onclose = (e) => {
+            if (this.liveSocket !== ws) return;  // Cerrado por stopLiveLogs
+            this.liveSocket = null;
+            if (e.code === 4003) return this.logout();
+            // "lagged" (4009), reinicio del backend, red caída...: reconectar con backoff
+            const delay = Math.min(30000, 1000 * 2 ** this.liveRetry++);
+            console.warn(`Live audit stream closed (${e.code}), reconnecting in ${delay}ms`);
+            this.liveTimer = setTimeout(() => this.startLiveLogs(), delay);
+        };
+    }
+
+    stopLiveLogs() {
+        clearTimeout(this.liveTimer);
+        const ws = this.liveSocket;
+        this.liveSocket = null;
+        if (ws) ws.close();
+    }
+
+    appendLiveLogs(records) {
+        const known = new Set(this.auditLogs.map(l => l.id));
+        const fresh = records.filter(r => !known.has(r.id)).reverse();
+        // Los más nuevos primero, como devuelve /admin/audit-logs; sin crecer sin límite
+        const limit = Math.max(this.auditLogs.length, 1000);
+        this.auditLogs = [...fresh, ...this.auditLogs].slice(0, limit);
+        this.updateOverviewStats();
+        this.renderAudit();
+    }
 
     renderRegionDropdowns() {
         ['new-node-region', 'edit-node-region', 'new-user-region'].forEach(id => {
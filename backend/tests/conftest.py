@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time: point the app at a throwaway database first.
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.setdefault("INIT_LOCK_PATH", f"{_tmp}/.init.lock")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlmodel import SQLModel  # noqa: E402
+
+from app.core.deps import engine  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    SQLModel.metadata.drop_all(engine)
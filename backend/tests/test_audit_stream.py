@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import Session
+
+from app.models.database import AuditLog
+from app.services.audit_stream import Filters, backlog, cursor_of, record_of
+
+
+def _record(details, action="OTHER"):
+    return {"id": "1", "user_id": None, "action": action, "details": details,
+            "created_at": datetime.utcnow().isoformat()}
+
+
+def test_node_filter_matches_the_whole_name():
+    filters = Filters(node_name="Miami-01")
+    assert filters.match(_record("Provisioned on node Miami-01 for alice"))
+    assert filters.match(_record("Drained Miami-01."))
+    assert not filters.match(_record("Provisioned on node Miami-010 for alice"))
+    assert not filters.match(_record("Provisioned on node XMiami-01"))
+
+
+def test_backlog_returns_rows_committed_late_with_an_earlier_stamp(db):
+    now = datetime.utcnow()
+    with Session(db) as session:
+        seen = AuditLog(action="OTHER", details="seen", created_at=now)
+        session.add(seen)
+        session.commit()
+        cursor = cursor_of(record_of(seen))
+        # Stamped before ``seen`` but committed after the client read it.
+        session.add(AuditLog(action="OTHER", details="late", created_at=now - timedelta(seconds=1)))
+        session.add(AuditLog(action="OTHER", details="newer", created_at=now + timedelta(seconds=1)))
+        session.commit()
+
+    records, gap = backlog(cursor, Filters(), 10)
+    assert [r["details"] for r in records] == ["late", "newer"]
+    assert not gap
+
+
+def test_backlog_limit_counts_only_exact_node_matches(db):
+    now = datetime.utcnow()
+    with Session(db) as session:
+        start = AuditLog(action="OTHER", details="start", created_at=now)
+        session.add(start)
+        for i in range(3):
+            session.add(AuditLog(action="OTHER", details=f"on Miami-010 #{i}", created_at=now + timedelta(seconds=i + 1)))
+        session.add(AuditLog(action="OTHER", details="on Miami-01", created_at=now + timedelta(seconds=0.5)))
+        session.commit()
+        cursor = cursor_of(record_of(start))
+
+    records, gap = backlog(cursor, Filters(node_name="Miami-01"), 1)
+    assert [r["details"] for r in records] == ["on Miami-01"]
+    assert not gap
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from app.core import deadlines
+from app.core.config import settings
+from app.core.deadlines import Budget, DeadlineExceeded
+from app.services import mikrotik
+from app.services.bulkhead import Bulkhead, RouterTimeout
+from app.services.mikrotik import MikroTikService
+
+
+def test_queue_wait_with_budget_left_is_a_router_timeout():
+    async def main():
+        bulkhead = Bulkhead("r:1", limit=1, max_queue=5)
+        await bulkhead.acquire(1.0)
+        with pytest.raises(RouterTimeout):
+            await bulkhead.acquire(0.05, Budget(5))
+
+    asyncio.run(main())
+
+
+def test_queue_wait_that_spends_the_budget_is_a_deadline():
+    async def main():
+        bulkhead = Bulkhead("r:1", limit=1, max_queue=5)
+        await bulkhead.acquire(1.0)
+        with pytest.raises(DeadlineExceeded):
+            await bulkhead.acquire(1.0, Budget(0.05))
+
+    asyncio.run(main())
+
+
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on():
+    async def main():
+        bulkhead = Bulkhead("r:1", limit=1, max_queue=5)
+        await bulkhead.acquire(1.0)
+        first = asyncio.ensure_future(bulkhead.acquire(1.0))
+        second = asyncio.ensure_future(bulkhead.acquire(1.0))
+        await asyncio.sleep(0)
+        # The slot goes to ``first`` and it is cancelled before it resumes.
+        bulkhead.release()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.wait_for(second, 1.0)
+        bulkhead.release()
+        assert bulkhead.active == 0
+        assert not bulkhead._waiters
+
+    asyncio.run(main())
+
+
+def test_add_that_lands_after_its_timeout_is_removed(monkeypatch):
+    monkeypatch.setattr(settings, "MIKROTIK_DRIVER", "asyncio")
+    monkeypatch.setattr(settings, "ROUTER_CALL_TIMEOUT", 0.05)
+    router = {}
+
+    async def slow_add(self, interface, public_key, allowed_address, comment):
+        await asyncio.sleep(0.2)
+        router["*1"] = public_key
+        return "*1"
+
+    async def delete(self, peer_id):
+        router.pop(peer_id)
+
+    monkeypatch.setattr(MikroTikService, "_async_add_peer", slow_add)
+    monkeypatch.setattr(MikroTikService, "_async_delete_peer", delete)
+
+    async def main():
+        # A request with a budget: the clean-up must not inherit it.
+        deadlines._budget.set(Budget(0.1))
+        async with MikroTikService("late-add.test", "u", "p") as mt:
+            with pytest.raises(RouterTimeout):
+                await mt.add_peer("wg0", "KEY", "10.0.0.2/32", "User: x")
+        await asyncio.sleep(0.3)
+        await asyncio.gather(*mikrotik._late_adds)
+
+    asyncio.run(main())
+    assert router == {}
+
+
+def test_add_refused_by_the_router_after_its_timeout_is_left_alone(monkeypatch):
+    monkeypatch.setattr(settings, "MIKROTIK_DRIVER", "asyncio")
+    monkeypatch.setattr(settings, "ROUTER_CALL_TIMEOUT", 0.05)
+    removed = []
+
+    async def slow_refused_add(self, *args):
+        await asyncio.sleep(0.2)
+        from app.services.routeros_async import RouterOsTrap
+        raise RouterOsTrap("failure: peer with such public key already exists")
+
+    async def remove_peer(self, public_key):
+        removed.append(public_key)
+
+    monkeypatch.setattr(MikroTikService, "_async_add_peer", slow_refused_add)
+    monkeypatch.setattr(MikroTikService, "remove_peer", remove_peer)
+
+    async def main():
+        async with MikroTikService("late-refused.test", "u", "p") as mt:
+            with pytest.raises(RouterTimeout):
+                await mt.add_peer("wg0", "KEY", "10.0.0.2/32", "User: x")
+        await asyncio.sleep(0.3)
+        assert not mikrotik._late_adds
+
+    asyncio.run(main())
+    assert removed == []
@@ -0,0 +1,73 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core import sql_profiler, tracing
+from app.core.config import settings
+from app.core.middleware import RequestContextMiddleware
+from app.services import node_events
+
+
+def test_detached_task_runs_outside_the_request():
+    async def main():
+        trace, trace_tokens = tracing.start_trace("GET /x")
+        queries, query_token = sql_profiler.start_request("GET /x")
+        seen = await tracing.detached_task(_context())
+        sql_profiler.finish_request(queries, query_token)
+        tracing.finish_trace(trace, trace_tokens)
+        return seen
+
+    async def _context():
+        return tracing.current_trace(), sql_profiler._request.get()
+
+    assert asyncio.run(main()) == (None, None)
+
+
+def test_node_event_poller_stays_out_of_the_first_stream(db, monkeypatch):
+    monkeypatch.setattr(node_events.broker, "poll_interval", 0.01)
+
+    async def main():
+        trace, trace_tokens = tracing.start_trace("GET /api/v1/regions/events")
+        queries, query_token = sql_profiler.start_request("GET /api/v1/regions/events")
+        subscription = await node_events.broker.subscribe()
+        before = (queries.count, len(trace.spans))
+        await asyncio.sleep(0.2)  # Many polls
+        after = (queries.count, len(trace.spans))
+        node_events.broker.unsubscribe(subscription)
+        await node_events.broker._task
+        sql_profiler.finish_request(queries, query_token)
+        tracing.finish_trace(trace, trace_tokens)
+        return before, after
+
+    before, after = asyncio.run(main())
+    assert before == after
+
+
+def test_event_stream_trace_ends_at_response_start(monkeypatch):
+    monkeypatch.setattr(settings, "TRACE_SLOW_MS", 100)
+    exported = []
+    monkeypatch.setattr(tracing._exporter, "submit", exported.append)
+
+    async def stream():
+        yield "data: 1\n\n"
+        await asyncio.sleep(0.3)
+        yield "data: 2\n\n"
+
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.get("/stream")
+    async def events():
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.3)
+        return {}
+
+    with TestClient(app) as client:
+        assert client.get("/stream").text == "data: 1\n\ndata: 2\n\n"
+        client.get("/slow")
+    assert [trace.root.name for trace in exported] == ["GET /slow"]
@@ -0,0 +1,58 @@
+import asyncio
+
+from app.core.config import settings
+from app.services.mikrotik import MikroTikService
+
+
+class FakePeers:
+    """The router's WireGuard peers, .id -> public key."""
+
+    def __init__(self, peers):
+        self.peers = dict(peers)
+        self.deleted = []
+        self.prints = []
+
+    def install(self, monkeypatch):
+        fake = self
+
+        async def print_peers(service, queries):
+            fake.prints.append(queries)
+            return {key: peer_id for peer_id, key in fake.peers.items()
+                    if all({"public-key": key, ".id": peer_id}.get(k) == v for k, v in queries.items())}
+
+        async def delete_peer(service, peer_id):
+            fake.deleted.append(fake.peers.pop(peer_id))
+
+        monkeypatch.setattr(settings, "MIKROTIK_DRIVER", "asyncio")
+        monkeypatch.setattr(MikroTikService, "_async_print_peers", print_peers)
+        monkeypatch.setattr(MikroTikService, "_async_delete_peer", delete_peer)
+
+
+def test_cached_id_reused_after_a_reboot_is_not_trusted(monkeypatch):
+    router = FakePeers({"*1": "ALICE", "*2": "BOB"})
+    router.install(monkeypatch)
+
+    async def main():
+        mt = MikroTikService("reboot.test", "u", "p")
+        await mt.remove_peer("BOB")  # Loads the cache: ALICE is *1
+        # The router reboots and numbers its peers again.
+        router.peers = {"*1": "CAROL", "*2": "ALICE"}
+        await mt.remove_peer("ALICE")
+
+    asyncio.run(main())
+    assert router.deleted == ["BOB", "ALICE"]
+    assert router.peers == {"*1": "CAROL"}
+
+
+def test_cached_id_of_a_peer_removed_elsewhere_is_dropped(monkeypatch):
+    router = FakePeers({"*1": "ALICE", "*2": "BOB"})
+    router.install(monkeypatch)
+
+    async def main():
+        mt = MikroTikService("removed.test", "u", "p")
+        await mt.remove_peer("BOB")
+        del router.peers["*1"]  # Another worker removed ALICE
+        return await mt.remove_peer("ALICE")
+
+    assert asyncio.run(main()) is False
+    assert router.deleted == ["BOB"]
@@ -0,0 +1,178 @@
+import asyncio
+import socket
+
+import pytest
+
+from app.core.config import settings
+from app.services import routeros_async
+from app.services.bulkhead import RouterTimeout
+from app.services.mikrotik import MikroTikService
+from app.services.routeros_async import (
+    RouterOsTrap, _read_length, encode_length, encode_sentence, parse_reply, read_sentence,
+)
+
+
+class FakeRouter:
+    """A RouterOS API server on localhost: replies are scripted per command."""
+
+    def __init__(self, handler):
+        self.handler = handler  # async (router, words, tag) -> None
+        self.received = []
+        self.connections = 0
+        self.server = None
+        self.writers = []
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for writer in self.writers:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def reply(self, writer, *words):
+        writer.write(encode_sentence(words))
+        await writer.drain()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        self.writers.append(writer)
+        try:
+            while True:
+                words = await read_sentence(reader)
+                self.received.append(words)
+                tag = next((w[5:] for w in words if w.startswith(".tag=")), None)
+                if words[0] == "/login":
+                    await self.reply(writer, "!done", f".tag={tag}")
+                elif words[0] != "/cancel":
+                    asyncio.ensure_future(self.handler(self, writer, words, tag))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+
+def run_with_router(handler, body):
+    async def main():
+        router = FakeRouter(handler)
+        port = await router.start()
+        try:
+            return await body(router, port)
+        finally:
+            await routeros_async.close_all()
+            await router.stop()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("length", [0, 1, 0x7F, 0x80, 0x3FFF, 0x4000, 0x1FFFFF, 0x200000, 0xFFFFFFF, 0x10000000])
+def test_length_encoding_round_trip(length):
+    encoded = encode_length(length)
+    assert len(encoded) == (1 if length < 0x80 else 2 if length < 0x4000 else 3 if length < 0x200000
+                            else 4 if length < 0x10000000 else 5)
+
+    async def decode():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encoded)
+        return await _read_length(reader)
+
+    assert asyncio.run(decode()) == length
+
+
+def test_sentence_round_trip():
+    words = ["!re", "=name=" + "x" * 200, ".tag=7", "=comment=ñ"]
+
+    async def decode():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_sentence(words))
+        return await read_sentence(reader)
+
+    decoded = asyncio.run(decode())
+    assert decoded == words
+    assert parse_reply(decoded) == ("!re", "7", {"name": "x" * 200, "comment": "ñ"})
+
+
+def test_replies_are_routed_by_tag():
+    async def handler(router, writer, words, tag):
+        # The first command answers last.
+        delay = 0.1 if words[0] == "/slow/print" else 0.0
+        await asyncio.sleep(delay)
+        await router.reply(writer, "!re", f".tag={tag}", f"=name={words[0]}")
+        await router.reply(writer, "!done", f".tag={tag}")
+
+    async def body(router, port):
+        api = await routeros_async.connect("127.0.0.1", port, "admin", "pw")
+        slow, fast = await asyncio.gather(api.call("/slow/print"), api.call("/fast/print"))
+        return slow, fast, router.connections
+
+    slow, fast, connections = run_with_router(handler, body)
+    assert slow == [{"name": "/slow/print"}]
+    assert fast == [{"name": "/fast/print"}]
+    assert connections == 1
+
+
+def test_trap_is_raised_after_done_and_done_attributes_are_returned():
+    async def handler(router, writer, words, tag):
+        if words[0] == "/bad/add":
+            await router.reply(writer, "!trap", f".tag={tag}", "=message=failure: already exists")
+        await router.reply(writer, "!done", f".tag={tag}", "=ret=*1A")
+
+    async def body(router, port):
+        api = await routeros_async.connect("127.0.0.1", port, "admin", "pw")
+        with pytest.raises(RouterOsTrap, match="already exists"):
+            await api.call("/bad/add")
+        # The connection is still usable after a trap.
+        return await api.call("/good/add", {"name": "x"}, done=True)
+
+    assert run_with_router(handler, body) == {"ret": "*1A"}
+
+
+def test_stopping_a_stream_early_sends_cancel():
+    async def handler(router, writer, words, tag):
+        for i in range(100):
+            await router.reply(writer, "!re", f".tag={tag}", f"=n={i}")
+            await asyncio.sleep(0.01)
+
+    async def body(router, port):
+        api = await routeros_async.connect("127.0.0.1", port, "admin", "pw")
+        async for row in api.stream("/log/print"):
+            break
+        await asyncio.sleep(0.05)
+        return [words for words in router.received if words[0] == "/cancel"]
+
+    cancels = run_with_router(handler, body)
+    assert cancels == [["/cancel", "=tag=2"]]  # Tag 1 was the login
+
+
+def test_connections_use_tcp_keepalive():
+    async def handler(router, writer, words, tag):
+        await router.reply(writer, "!done", f".tag={tag}")
+
+    async def body(router, port):
+        api = await routeros_async.connect("127.0.0.1", port, "admin", "pw")
+        sock = api._writer.get_extra_info("socket")
+        return sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+
+    assert run_with_router(handler, body) != 0
+
+
+def test_timed_out_command_evicts_the_shared_connection(monkeypatch):
+    monkeypatch.setattr(settings, "MIKROTIK_DRIVER", "asyncio")
+    monkeypatch.setattr(settings, "ROUTER_CALL_TIMEOUT", 0.1)
+    hang = {"on": True}
+
+    async def handler(router, writer, words, tag):
+        if hang["on"]:
+            return  # Never answers
+        await router.reply(writer, "!done", f".tag={tag}")
+
+    async def body(router, port):
+        mt = MikroTikService("127.0.0.1", "admin", "pw", port=port)
+        with pytest.raises(RouterTimeout):
+            await mt._op("get_health")
+        first = mt.async_connection
+        hang["on"] = False
+        await mt._op("set_peer", "*1", {"comment": "x"})
+        second = mt.async_connection
+        return first.closed, second is not first and not second.closed, router.connections
+
+    assert run_with_router(handler, body) == (True, True, 2)
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import random
+
+import httpx
+
+# Códigos que merecen reintento: el servidor está arrancando o sobrecargado.
+RETRY_STATUS = {500, 502, 503, 504}
+# Métodos que se pueden repetir sin efectos secundarios. Un POST (p. ej.
+# /me/wireguard-config, que revoca y crea peers en el router) solo se repite si
+# no llegó a enviarse (error de conexión) o con un 503 que trae Retry-After.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class ApiClient:
+    """Sesión HTTP asíncrona compartida con el backend.
+
+    Una sola conexión keep-alive para todas las llamadas, timeouts explícitos
+    y reintentos con backoff exponencial + jitter ante errores 5xx o de red
+    (solo en métodos idempotentes, ver IDEMPOTENT_METHODS).
+    """
+
+    def __init__(
+        self,
+        base_url,
+        client_version,
+        connect_timeout=5.0,
+        read_timeout=20.0,
+        retries=3,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        http_client=None,
+    ):
+        self.client_version = client_version
+        self.token = None
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # http_client permite compartir un pool entre muchas sesiones (fleet_sim.py);
+        # las cabeceras se envían por petición y el base_url lo pone el pool
+        self._owns_client = http_client is None
+        self._client_args = dict(
+            base_url=base_url,
+            headers={"X-Client-Version": client_version},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=60),
+        )
+        self._client = http_client or httpx.AsyncClient(**self._client_args)
+
+    def _auth_headers(self):
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+    def _delay(self, attempt, response=None):
+        # Respetar Retry-After si el servidor lo indica (p. ej. 503 al arrancar)
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        # "Full jitter": evita que todos los clientes reintenten a la vez
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _retryable(idempotent, response):
+        if idempotent:
+            return response.status_code in RETRY_STATUS
+        return response.status_code == 503 and "Retry-After" in response.headers
+
+    async def request(self, method, path, **kwargs):
+        headers = {"X-Client-Version": self.client_version, **self._auth_headers(), **kwargs.pop("headers", {})}
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(self.retries + 1):
+            last_try = attempt == self.retries
+            try:
+                response = await self._client.request(method, path, headers=headers, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, httpx.RemoteProtocolError) as e:
+                # Tras un ReadTimeout el servidor pudo haber hecho el trabajo
+                if last_try or not (idempotent or isinstance(e, NOT_SENT_ERRORS)):
+                    raise
+                delay = self._delay(attempt)
+                logging.warning(f"API: {method} {path} failed ({e!r}), retry in {delay:.2f}s")
+            else:
+                if last_try or not self._retryable(idempotent, response):
+                    return response
+                delay = self._delay(attempt, response)
+                logging.warning(f"API: {method} {path} -> {response.status_code}, retry in {delay:.2f}s")
+            # CancelledError se propaga desde aquí si el usuario sale de la vista
+            await asyncio.sleep(delay)
+
+    async def warm_up(self):
+        # Abrir la conexión TCP/keep-alive antes del login (GET / del backend)
+        try:
+            await self._client.get(self._client.base_url.copy_with(path="/"))
+        except httpx.HTTPError as e:
+            logging.info(f"API: warm-up failed: {e!r}")
+
+    async def login(self, username, password):
+        response = await self.request("POST", "/auth/login", data={"username": username, "password": password})
+        if response.status_code == 200:
+            self.token = response.json()["access_token"]
+        return response
+
+    async def get_nodes(self):
+        return await self.request("GET", "/regions/")
+
+    async def node_events(self, last_event_id=None):
+        """Stream SSE de disponibilidad de nodos: genera (id, evento, datos).
+
+        Sin reintentos aquí: quien consume reconecta con el último id recibido.
+        El servidor envía un keepalive cada ~15 s, así que un read timeout
+        de 45 s detecta conexiones muertas.
+        """
+        headers = {"X-Client-Version": self.client_version, "Accept": "text/event-stream", **self._auth_headers()}
+        if last_event_id is not None:
+            headers["Last-Event-ID"] = str(last_event_id)
+        timeout = httpx.Timeout(45.0, connect=self._client.timeout.connect)
+        async with self._client.stream("GET", "/regions/events", headers=headers, timeout=timeout) as response:
+            response.raise_for_status()
+            event_id, event, data = None, "message", []
+            async for line in response.aiter_lines():
+                if not line:
+                    if data:
+                        yield event_id, event, json.loads("\n".join(data))
+                    event, data = "message", []
+                elif line.startswith(":"):
+                    continue  # keepalive
+                else:
+                    field, _, value = line.partition(":")
+                    value = value[1:] if value.startswith(" ") else value
+                    if field == "id":
+                        event_id = int(value)
+                    elif field == "event":
+                        event = value
+                    elif field == "data":
+                        data.append(value)
+
+    async def get_wireguard_config(self, payload):
+        return await self.request("POST", "/me/wireguard-config", json=payload)
+
+    async def reset_connections(self):
+        """Abrir conexiones nuevas: al subir/bajar el túnel las del pool quedan
+        atadas a la ruta anterior y sus respuestas ya no llegan."""
+        if not self._owns_client:
+            return
+        old, self._client = self._client, httpx.AsyncClient(**self._client_args)
+        await old.aclose()
+
+    def logout(self):
+        self.token = None
+
+    async def aclose(self):
+        if self._owns_client:
+            await self._client.aclose()
@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+import re
+
+_SERVER_KEY_RE = re.compile(r"^\s*PublicKey\s*=\s*(\S+)", re.MULTILINE)
+
+
+def server_key_of(config):
+    match = _SERVER_KEY_RE.search(config or "")
+    return match.group(1) if match else None
+
+
+class ConfigCache:
+    """Última configuración emitida por el servidor para cada nodo.
+
+    Cada entrada guarda la clave pública del cliente y la del servidor con las
+    que se emitió; si cambia nuestra clave (.wg_keys regenerado) la entrada no
+    se usa. No contiene la clave privada: se añade al levantar el túnel.
+    """
+
+    def __init__(self, path=".wg_config_cache.json"):
+        self.path = path
+        self._entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            logging.warning(f"ConfigCache: ignoring unreadable cache: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, node_id, public_key, server_public_key=None):
+        """Entrada de node_id si se emitió para public_key y, si se conoce la
+        clave actual del nodo (server_public_key), para esa misma clave."""
+        entry = self._entries.get(node_id)
+        if not entry or entry.get("public_key") != public_key:
+            return None
+        if server_public_key and entry.get("server_public_key") != server_public_key:
+            logging.info(f"ConfigCache: server key of node {node_id} changed, ignoring cached config")
+            return None
+        return entry
+
+    def put(self, node_id, public_key, config, node_name):
+        self._entries[node_id] = {
+            "public_key": public_key,
+            "server_public_key": server_key_of(config),
+            "config": config,
+            "node": node_name,
+        }
+        self._save()
+
+    def invalidate(self, node_id=None):
+        if node_id is None:
+            self._entries = {}
+        else:
+            self._entries.pop(node_id, None)
+        self._save()
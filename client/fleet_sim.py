@@ -0,0 +1,212 @@
+"""Simulador de flota: miles de clientes sin interfaz contra el backend.
+
+Cada dispositivo simulado sigue el mismo flujo que la app Flet
+(login -> /regions/ -> /me/wireguard-config) con su propio usuario, par de
+claves (generate_wg_keys) y device_id, usando ApiClient con los mismos
+reintentos/backoff que el cliente real. Al final se imprimen percentiles de
+latencia por paso, códigos de error y el reparto de peers por nodo.
+
+Patrones de llegada:
+    steady  llegadas Poisson repartidas a lo largo de --duration segundos
+    burst   todos los dispositivos llegan dentro de --window segundos
+    storm   conexión steady y después, tras una caída simulada, todos
+            reconectan a la vez dentro de --window segundos (lunes por la mañana)
+
+El backend limita login y wireguard-config por IP: para miles de usuarios
+desde una sola máquina arranque el servidor con RATE_LIMIT_ENABLED=false o
+con límites acordes (RATE_LIMIT_LOGIN / RATE_LIMIT_WIREGUARD_CONFIG).
+Los usuarios se crean al principio vía /admin/users (si ya existen se
+reutilizan).
+
+Uso:
+    python fleet_sim.py --url http://127.0.0.1:8000/api/v1 --devices 2000 --pattern storm
+"""
+import argparse
+import asyncio
+import collections
+import hashlib
+import logging
+import random
+import time
+
+import httpx
+
+from api_client import ApiClient
+from wg_utils import generate_wg_keys
+
+CLIENT_VERSION = "3.0"
+STEPS = ("login", "regions", "wireguard-config", "total")
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Stats:
+    """Latencias (ms) y resultados por fase y por paso."""
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)  # (fase, paso) -> [ms]
+        self.outcomes = collections.defaultdict(collections.Counter)  # (fase, paso) -> {status: n}
+        self.placement = collections.defaultdict(collections.Counter)  # fase -> {nodo: n}
+        self.phases = []
+
+    def record(self, phase, step, started, outcome):
+        if phase not in self.phases:
+            self.phases.append(phase)
+        self.latencies[(phase, step)].append((time.perf_counter() - started) * 1000)
+        self.outcomes[(phase, step)][outcome] += 1
+
+    def report(self):
+        lines = []
+        for phase in self.phases:
+            lines.append(f"== {phase} ==")
+            lines.append(f"{'step':<18}{'n':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'errors':>9}  outcomes")
+            for step in STEPS:
+                samples = self.latencies.get((phase, step))
+                if not samples:
+                    continue
+                outcomes = self.outcomes[(phase, step)]
+                errors = sum(n for code, n in outcomes.items() if code != 200)
+                cells = "".join(f"{percentile(samples, p):9.0f}" for p in (50, 90, 99, 100))
+                detail = ", ".join(f"{code}: {n}" for code, n in outcomes.most_common())
+                lines.append(
+                    f"{step:<18}{len(samples):>7}{cells}{errors / len(samples):>8.1%}  {detail}"
+                )
+            placement = self.placement[phase]
+            total = sum(placement.values())
+            if total:
+                lines.append("placement:")
+                for node, n in placement.most_common():
+                    lines.append(f"  {node:<30}{n:>7}  {n / total:6.1%}")
+        return "\n".join(lines)
+
+
+class SimDevice:
+    """Un usuario con su dispositivo: mismas llamadas que WireGuardClient."""
+
+    def __init__(self, username, password, http_client):
+        self.username = username
+        self.password = password
+        self.device_id = hashlib.sha256(f"sim-{username}".encode()).hexdigest()[:12]
+        _, self.public_key = generate_wg_keys()
+        self.api = ApiClient(str(http_client.base_url), CLIENT_VERSION, http_client=http_client)
+
+    async def _step(self, stats, phase, step, call):
+        started = time.perf_counter()
+        try:
+            response = await call
+        except httpx.HTTPError as e:
+            stats.record(phase, step, started, type(e).__name__)
+            return None
+        stats.record(phase, step, started, response.status_code)
+        return response if response.status_code == 200 else None
+
+    async def connect(self, stats, phase, pick):
+        started = time.perf_counter()
+        self.api.logout()
+        ok = await self._step(stats, phase, "login", self.api.login(self.username, self.password))
+        if ok:
+            nodes_resp = await self._step(stats, phase, "regions", self.api.get_nodes())
+            if nodes_resp:
+                nodes = nodes_resp.json()
+                payload = {"public_key": self.public_key, "device_id": self.device_id}
+                if pick == "random" and nodes:
+                    payload["region"] = random.choice(nodes)["id"]
+                config_resp = await self._step(
+                    stats, phase, "wireguard-config", self.api.get_wireguard_config(payload)
+                )
+                if config_resp:
+                    stats.placement[phase][config_resp.json().get("node", "?")] += 1
+                    stats.record(phase, "total", started, 200)
+                    return
+        stats.record(phase, "total", started, "failed")
+
+
+def arrival_offsets(count, pattern, duration, window):
+    """Instantes (s desde el inicio de la fase) en que llega cada dispositivo."""
+    if pattern == "steady":
+        # Proceso de Poisson con tasa count/duration
+        rate = count / duration
+        offsets, t = [], 0.0
+        for _ in range(count):
+            t += random.expovariate(rate)
+            offsets.append(t)
+        return offsets
+    return sorted(random.uniform(0, window) for _ in range(count))
+
+
+async def run_phase(devices, stats, phase, offsets, pick):
+    start = time.perf_counter()
+
+    async def arrive(device, offset):
+        await asyncio.sleep(max(0.0, offset - (time.perf_counter() - start)))
+        await device.connect(stats, phase, pick)
+
+    await asyncio.gather(*(arrive(d, o) for d, o in zip(devices, offsets)))
+    logging.info(f"Sim: phase {phase} finished in {time.perf_counter() - start:.1f}s")
+
+
+async def create_users(http_client, devices, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(device):
+        async with semaphore:
+            try:
+                await http_client.post(
+                    "/admin/users", json={"username": device.username, "password": device.password}
+                )
+            except httpx.HTTPError:
+                pass  # Si ya existe (o falla), el login lo dirá
+
+    await asyncio.gather(*(create(d) for d in devices))
+
+
+async def simulate(args):
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    timeout = httpx.Timeout(args.timeout, connect=5.0)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as http_client:
+        devices = [
+            SimDevice(f"{args.prefix}{i:05d}", args.password, http_client) for i in range(args.devices)
+        ]
+        logging.info(f"Sim: creating {len(devices)} users")
+        await create_users(http_client, devices, args.connections)
+
+        stats = Stats()
+        if args.pattern == "storm":
+            await run_phase(devices, stats, "warm-up", arrival_offsets(len(devices), "steady", args.duration, args.window), args.pick)
+            logging.info(f"Sim: simulated outage, all devices reconnect within {args.window}s")
+            await run_phase(devices, stats, "storm", arrival_offsets(len(devices), "burst", args.duration, args.window), args.pick)
+        else:
+            offsets = arrival_offsets(len(devices), args.pattern, args.duration, args.window)
+            await run_phase(devices, stats, args.pattern, offsets, args.pick)
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless client fleet load generator")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/api/v1", help="API base URL")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--pattern", choices=("steady", "burst", "storm"), default="steady")
+    parser.add_argument("--duration", type=float, default=60.0, help="steady arrival span (s)")
+    parser.add_argument("--window", type=float, default=2.0, help="burst/storm arrival window (s)")
+    parser.add_argument("--pick", choices=("random", "server"), default="random",
+                        help="random node from /regions/ or let the server choose")
+    parser.add_argument("--prefix", default="sim-", help="username prefix for simulated users")
+    parser.add_argument("--password", default="sim-password")
+    parser.add_argument("--connections", type=int, default=200, help="HTTP connection pool size")
+    parser.add_argument("--timeout", type=float, default=30.0, help="read timeout (s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    stats = asyncio.run(simulate(args))
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
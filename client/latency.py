@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import socket
+import time
+
+
+class LatencyProber:
+    """Mide el RTT hacia los endpoints de los nodos, en paralelo y con caché.
+
+    WireGuard escucha en UDP y no responde a paquetes no autenticados, así que
+    se mide un "TCP ping" al mismo host:puerto: tanto una conexión aceptada
+    como un rechazo (RST) tardan un viaje de ida y vuelta. Si el host descarta
+    el paquete, el intento expira y el nodo queda sin medición (None).
+    """
+
+    def __init__(self, concurrency=8, timeout=1.5, samples=2, ttl=300):
+        self.timeout = timeout
+        self.samples = samples
+        self.ttl = ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache = {}  # (host, port) -> (rtt_ms, medido_en)
+
+    async def _sample(self, addr, family):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, addr), self.timeout)
+        except ConnectionRefusedError:
+            pass  # El RST también cuenta como respuesta
+        finally:
+            sock.close()
+        return (time.perf_counter() - start) * 1000
+
+    async def probe(self, host, port):
+        key = (host, port)
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+
+        async with self._semaphore:
+            rtt = None
+            try:
+                # La resolución DNS no forma parte del RTT
+                loop = asyncio.get_running_loop()
+                infos = await asyncio.wait_for(
+                    loop.getaddrinfo(host, port, type=socket.SOCK_STREAM), self.timeout
+                )
+                family, _, _, _, addr = infos[0]
+                for _ in range(self.samples):
+                    try:
+                        sample = await self._sample(addr, family)
+                    except (asyncio.TimeoutError, OSError):
+                        continue
+                    rtt = sample if rtt is None else min(rtt, sample)
+            except (asyncio.TimeoutError, OSError) as e:
+                logging.info(f"Latency: cannot resolve {host}: {e}")
+
+        self._cache[key] = (rtt, time.monotonic())
+        return rtt
+
+    async def probe_nodes(self, nodes):
+        """Devuelve {node_id: rtt_ms o None} para los nodos de /regions/."""
+        candidates = [n for n in nodes if n.get("endpoint_host")]
+        results = await asyncio.gather(
+            *(self.probe(n["endpoint_host"], n.get("endpoint_port", 51820)) for n in candidates)
+        )
+        return {n["id"]: rtt for n, rtt in zip(candidates, results)}
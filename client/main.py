@@ -1,17 +1,23 @@
+import time
+STARTUP_T0 = time.perf_counter()
+
 import flet as ft
-import requests
 import os
 import uuid
 import platform
 import hashlib
 import ctypes
 from wg_utils import generate_wg_keys, WireGuardManager
-import pystray
-from PIL import Image
+from api_client import ApiClient
+from latency import LatencyProber
+from config_cache import ConfigCache
+from tunnel_monitor import TunnelMonitor
 import threading
 import asyncio
 import logging
+import random
 import sys
+from urllib.parse import urlparse
 
 # Configurar logging para depuración profunda
 logging.basicConfig(
@@ -21,72 +27,64 @@ logging.basicConfig(
 )
 logging.info("--- CLIENT START ---")
 
+def log_startup(phase):
+    # Tiempos de arranque en client_debug.log (ms desde el inicio del proceso)
+    logging.info(f"Startup: {phase} at {(time.perf_counter() - STARTUP_T0) * 1000:.0f} ms")
+
+log_startup("imports done")
+
 CLIENT_VERSION = "3.0"
+AUTO_NODE = "auto"  # Opción "Auto (fastest)" del selector de servidor
+NODE_EVENTS_BACKOFF_START = 2  # segundos antes de reabrir el stream de nodos
+NODE_EVENTS_BACKOFF_MAX = 60
+RECOVERY_BACKOFF_START = 5   # segundos entre nodos al recuperar un túnel caído
+RECOVERY_BACKOFF_MAX = 120
+RECOVERY_MAX_ATTEMPTS = 6
+CACHE_HANDSHAKE_TIMEOUT = 5  # segundos para confirmar con un handshake un túnel levantado desde la caché
 API_BASE = "http://localhost:8000/api/v1"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+def format_rate(bytes_per_second):
+    for unit in ("B/s", "KB/s", "MB/s"):
+        if bytes_per_second < 1024:
+            return f"{bytes_per_second:.0f} {unit}"
+        bytes_per_second /= 1024
+    return f"{bytes_per_second:.1f} GB/s"
+
 class WireGuardClient(ft.Column):
     def __init__(self, app_page: ft.Page):
         super().__init__()
         self.app_page = app_page
-        self.token = None
+        self.api = ApiClient(API_BASE, CLIENT_VERSION)
+        # Tareas de red en curso; se cancelan al cerrar sesión o salir
+        self.pending_tasks = set()
         self.user_data = None
         self.nodes = [] # Renamed from regions
         self.selected_node_id = None # Renamed from selected_region
+        self.prober = LatencyProber()
+        self.node_rtts = {} # node_id -> RTT en ms (None si no responde)
+        self.config_cache = ConfigCache()
         self.device_id = hashlib.sha256(platform.node().encode()).hexdigest()[:12]
-        self.wg_manager = WireGuardManager()
+        self.wg_manager = WireGuardManager(bypass_hosts=[urlparse(API_BASE).hostname])
         self.is_connected = False
+        self.connected_node_id = None
+        # Confirmación en segundo plano de la última config sacada de la caché
+        self.revalidation = None
+        self.tunnel_monitor = TunnelMonitor(self.wg_manager, self.on_tunnel_stats, self.recover_tunnel)
         
         # UI Elements
         self.username = ft.TextField(label="Username", border_radius=10, width=300)
         self.password = ft.TextField(label="Password", password=True, can_reveal_password=True, border_radius=10, width=300)
         self.remember_me = ft.Checkbox(label="Remember Credentials", value=False)
         
-        self.node_dropdown = ft.Dropdown(
-            label="Select Server",
-            width=300,
-            border_radius=10,
-        )
-        self.node_dropdown.on_change = self.on_node_change
-        
-        self.status_text = ft.Text("Ready", color=ft.Colors.BLUE_400, size=18, weight="bold")
-        
-        # Elementos internos del botón para control total
-        self.conn_icon = ft.Icon(ft.Icons.VPN_LOCK, color=ft.Colors.WHITE, size=20)
-        self.conn_label = ft.Text("CONNECT", color=ft.Colors.WHITE, weight="bold")
-        
-        self.connection_btn = ft.FilledButton(
-            content=ft.Row(
-                [self.conn_icon, self.conn_label],
-                alignment=ft.MainAxisAlignment.CENTER,
-                tight=True
-            ),
-            on_click=self.toggle_connection,
-            bgcolor=ft.Colors.GREEN_700,
-            width=220,
-            height=50,
-            style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=10))
-        )
-        
-        self.config_box = ft.TextField(
-            label="Current Configuration",
-            multiline=True,
-            read_only=True,
-            min_lines=5,
-            max_lines=7,
-            text_size=10,
-        )
-        self.log_container = ft.Container(
-            content=self.config_box,
-            height=150,
-            visible=False,
-            padding=5
-        )
-        
-        # View containers
+        # View containers: solo la vista de login para el primer frame;
+        # la vista principal se construye después (build_main_view)
         self.login_view = self.create_login_view()
-        self.main_view = self.create_main_view()
-        self.main_view.visible = False
+        self.main_view = None
+        self.views = ft.Column([
+            self.login_view
+        ], spacing=0, horizontal_alignment=ft.CrossAxisAlignment.CENTER)
+        self.tray_images = {}  # Iconos de bandeja ya decodificados
         
         # Master Container for consistent look (No borders)
         self.master_container = ft.Container(
@@ -127,10 +125,7 @@ class WireGuardClient(ft.Column):
                 
                 # App Views
                 ft.Container(
-                    content=ft.Column([
-                        self.login_view,
-                        self.main_view
-                    ], spacing=0, horizontal_alignment=ft.CrossAxisAlignment.CENTER),
+                    content=self.views,
                     padding=ft.Padding.only(left=20, right=20, bottom=20),
                 )
             ], spacing=0, horizontal_alignment=ft.CrossAxisAlignment.CENTER),
@@ -148,15 +143,84 @@ class WireGuardClient(ft.Column):
         
         self.controls = [self.master_container]
         self.horizontal_alignment = ft.CrossAxisAlignment.CENTER
-        
+
+    async def start_deferred(self):
+        """Trabajo de arranque que no hace falta para el primer frame."""
+        log_startup("first frame")
+
         # Load saved credentials if exist
         self.load_saved_credentials()
+        self.app_page.update()
+
+        # Calentar la conexión keep-alive con el backend mientras el usuario escribe
+        self.spawn(self.api.warm_up())
+
+        # Iniciar sistema de bandeja independiente (pystray) en su propio hilo
+        threading.Thread(target=self.setup_pystray, daemon=True).start()
+
+        self.build_main_view()
+        log_startup("deferred init done")
+
+    def build_main_view(self):
+        if self.main_view is not None:
+            return
+        self.node_dropdown = ft.Dropdown(
+            label="Select Server",
+            width=300,
+            border_radius=10,
+        )
+        self.node_dropdown.on_change = self.on_node_change
+        
+        self.status_text = ft.Text("Ready", color=ft.Colors.BLUE_400, size=18, weight="bold")
+        self.throughput_text = ft.Text("", color=ft.Colors.GREY_400, size=12)
+        
+        # Elementos internos del botón para control total
+        self.conn_icon = ft.Icon(ft.Icons.VPN_LOCK, color=ft.Colors.WHITE, size=20)
+        self.conn_label = ft.Text("CONNECT", color=ft.Colors.WHITE, weight="bold")
+        
+        self.connection_btn = ft.FilledButton(
+            content=ft.Row(
+                [self.conn_icon, self.conn_label],
+                alignment=ft.MainAxisAlignment.CENTER,
+                tight=True
+            ),
+            on_click=self.toggle_connection,
+            bgcolor=ft.Colors.GREEN_700,
+            width=220,
+            height=50,
+            style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=10))
+        )
         
-        # Iniciar sistema de bandeja independiente (pystray)
-        self.setup_pystray()
+        self.config_box = ft.TextField(
+            label="Current Configuration",
+            multiline=True,
+            read_only=True,
+            min_lines=5,
+            max_lines=7,
+            text_size=10,
+        )
+        self.log_container = ft.Container(
+            content=self.config_box,
+            height=150,
+            visible=False,
+            padding=5
+        )
+        
+        self.main_view = self.create_main_view()
+
+    def show_main_view(self):
+        self.build_main_view()
+        if self.main_view not in self.views.controls:
+            self.views.controls.append(self.main_view)
+        self.login_view.visible = False
+        self.main_view.visible = True
 
     def setup_pystray(self):
+        # Se ejecuta en un hilo aparte: pystray y PIL se importan aquí, fuera del arranque
         logging.info("Starting setup_pystray...")
+        import pystray
+        from PIL import Image
+
         def on_restore(icon, item):
             logging.info("Tray: Restore action triggered")
             # Usar run_task para volver al hilo principal de Flet
@@ -172,16 +236,19 @@ class WireGuardClient(ft.Column):
             logging.info("Tray: Exit action triggered")
             asyncio.run_coroutine_threadsafe(self.exit_app(), self.app_page.loop)
 
-        # Cargar imagen inicial
-        img_path = os.path.join(BASE_DIR, "assets", "disconnected.ico")
-        logging.info(f"Tray: Loading icon from {img_path}")
-        
-        if not os.path.exists(img_path):
-            logging.error(f"Tray: Icon file NOT FOUND at {img_path}")
-            return
+        # Decodificar ambos iconos una sola vez; update_tray_state reutiliza la caché
+        for state in ("connected", "disconnected"):
+            img_path = os.path.join(BASE_DIR, "assets", f"{state}.ico")
+            logging.info(f"Tray: Loading icon from {img_path}")
+            if not os.path.exists(img_path):
+                logging.error(f"Tray: Icon file NOT FOUND at {img_path}")
+                return
+            image = Image.open(img_path)
+            image.load()
+            self.tray_images[state] = image
 
         try:
-            self.tray_img = Image.open(img_path)
+            self.tray_img = self.tray_images["connected" if self.is_connected else "disconnected"]
             logging.info("Tray: Image opened successfully")
             
             self.tray_icon = pystray.Icon(
@@ -196,20 +263,17 @@ class WireGuardClient(ft.Column):
             # El clic principal también restaura
             self.tray_icon.on_activate = on_restore
             
-            # Ejecutar en hilo separado para no bloquear la UI
-            logging.info("Tray: Starting pystray thread...")
-            threading.Thread(target=self.tray_icon.run, daemon=True).start()
-            logging.info("Tray: Thread started")
+            # Ya estamos en un hilo separado: run() bloquea solo este hilo
+            log_startup("tray ready")
+            self.tray_icon.run()
         except Exception as e:
             logging.exception(f"Tray: CRITICAL ERROR during setup: {e}")
 
     async def update_tray_state(self, is_connected):
         logging.info(f"Tray: Updating state to {'Connected' if is_connected else 'Disconnected'}")
         if hasattr(self, 'tray_icon'):
-            icon_name = "connected.ico" if is_connected else "disconnected.ico"
-            img_path = os.path.join(BASE_DIR, "assets", icon_name)
             try:
-                self.tray_icon.icon = Image.open(img_path)
+                self.tray_icon.icon = self.tray_images["connected" if is_connected else "disconnected"]
                 logging.info("Tray: Icon updated successfully")
             except Exception as e:
                 logging.error(f"Tray: Failed to update icon: {e}")
@@ -245,7 +309,31 @@ class WireGuardClient(ft.Column):
         except Exception as e:
             logging.exception(f"UI: CRITICAL ERROR during restore_window: {e}")
 
+    async def run_cancellable(self, coro):
+        # Ejecutar una llamada de red que se puede cancelar si el usuario cambia de vista
+        task = asyncio.ensure_future(coro)
+        self.pending_tasks.add(task)
+        try:
+            return await task
+        finally:
+            self.pending_tasks.discard(task)
+
+    def spawn(self, coro):
+        # Tarea en segundo plano, cancelable igual que run_cancellable
+        task = asyncio.ensure_future(coro)
+        self.pending_tasks.add(task)
+        task.add_done_callback(self.pending_tasks.discard)
+        return task
+
+    def cancel_pending(self):
+        for task in list(self.pending_tasks):
+            task.cancel()
+
     async def exit_app(self, e=None):
+        self.tunnel_monitor.stop()
+        self.cancel_pending()
+        await self.api.aclose()
+
         # Detener la bandeja
         if hasattr(self, 'tray_icon'):
             self.tray_icon.stop()
@@ -321,6 +409,7 @@ class WireGuardClient(ft.Column):
             ft.Container(
                 content=ft.Column([
                     self.status_text,
+                    self.throughput_text,
                     self.connection_btn,
                 ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=10),
                 padding=10,
@@ -338,14 +427,17 @@ class WireGuardClient(ft.Column):
 
     async def handle_login(self, e):
         try:
-            response = requests.post(
-                f"{API_BASE}/auth/login",
-                headers={"X-Client-Version": CLIENT_VERSION},
-                data={"username": self.username.value, "password": self.password.value},
+            response = await self.run_cancellable(
+                self.api.login(self.username.value, self.password.value)
             )
             if response.status_code == 200:
-                self.token = response.json()["access_token"]
-                
+                # /regions/ necesita el token del login, así que no puede ir a la
+                # vez que él: pedir la lista nada más recibirlo y dejar que la
+                # petición salga antes del resto del trabajo de la vista
+                self.spawn(self.load_available_nodes())
+                self.spawn(self.follow_node_events())
+                await asyncio.sleep(0)
+
                 # Persistir credenciales si se solicita (usando archivo local)
                 if self.remember_me.value:
                     with open(".user_prefs", "w") as f:
@@ -354,35 +446,166 @@ class WireGuardClient(ft.Column):
                     if os.path.exists(".user_prefs"):
                         os.remove(".user_prefs")
 
-                await self.load_available_nodes()
-                self.login_view.visible = False
-                self.main_view.visible = True
+                # Mostrar la vista principal ya; la lista de nodos llega en paralelo
+                self.show_main_view()
                 self.app_page.update()
             else:
                 await self.show_message("Invalid credentials")
+        except asyncio.CancelledError:
+            logging.info("API: login cancelled")
         except Exception as ex:
             await self.show_message(f"Connection Error: {ex}")
 
     async def load_available_nodes(self):
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "X-Client-Version": CLIENT_VERSION,
-        }
         try:
             # Modified endpoint now returns list of available nodes
             # response format: [{"id": "uuid", "name": "NodeName (US)", "region_code": "US"}, ...]
-            response = requests.get(f"{API_BASE}/regions/", headers=headers)
+            # Ya corre como tarea de spawn (cancelable): llamar directamente
+            # para que la petición salga en el primer paso de la tarea
+            response = await self.api.get_nodes()
             if response.status_code == 200:
                 self.nodes = response.json()
-                self.node_dropdown.options = [
-                    ft.dropdown.Option(n["id"], n["name"]) for n in self.nodes
-                ]
+                self.render_node_options()
+                # Medir latencias sin bloquear la UI; el selector se reordena al terminar
+                self.spawn(self.probe_node_latency())
             self.app_page.update()
-        except:
-            pass
+        except asyncio.CancelledError:
+            logging.info("API: node list request cancelled")
+        except Exception as ex:
+            logging.error(f"API: failed to load nodes: {ex}")
 
-    def on_node_change(self, e):
+    async def follow_node_events(self):
+        # Cambios de disponibilidad empujados por el servidor (SSE); reconecta
+        # con Last-Event-ID para no perder eventos durante un corte
+        last_id = None
+        delay = NODE_EVENTS_BACKOFF_START
+        while self.api.token:
+            try:
+                async for event_id, event, data in self.api.node_events(last_id):
+                    last_id = event_id
+                    delay = NODE_EVENTS_BACKOFF_START
+                    self.apply_node_event(event, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logging.info(f"Events: stream interrupted ({ex!r}), reconnecting in {delay}s")
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, NODE_EVENTS_BACKOFF_MAX)
+
+    def apply_node_event(self, event, data):
+        if event == "reprovision":
+            # Un drenado movió nuestro peer a otro nodo: el servidor mantiene el
+            # actual un tiempo de gracia, cambiar antes de que lo quite
+            node_id = data["node"]["id"]
+            logging.info(f"Events: peer moved to {data['node']['name']}, switching")
+            if self.is_connected and node_id != self.connected_node_id:
+                self.spawn(self.switch_node(node_id))
+            return
+        known = {n["id"] for n in self.nodes}
+        if event == "snapshot":
+            self.nodes = data
+        else:
+            node = data["node"]
+            logging.info(f"Events: {event} {node['name']} (available={data['available']})")
+            self.nodes = [n for n in self.nodes if n["id"] != node["id"]]
+            if data["available"]:
+                self.nodes.append(node)
+        # Si se eligió un nodo que ya no está disponible, volver a Auto
+        if self.node_dropdown.value not in {AUTO_NODE} | {n["id"] for n in self.nodes}:
+            self.node_dropdown.value = AUTO_NODE
+            self.selected_node_id = AUTO_NODE
+        self.render_node_options()
+        self.app_page.update()
+        if any(n["id"] not in known for n in self.nodes):
+            self.spawn(self.probe_node_latency())
+
+    async def probe_node_latency(self):
+        try:
+            self.node_rtts = await self.prober.probe_nodes(self.nodes)
+            logging.info(f"Latency: {self.node_rtts}")
+            self.render_node_options()
+            self.app_page.update()
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logging.error(f"Latency: probing failed: {ex}")
+
+    def ranked_nodes(self):
+        # Nodos medidos primero (menor RTT), luego los que no respondieron
+        return sorted(
+            self.nodes,
+            key=lambda n: (self.node_rtts.get(n["id"]) is None, self.node_rtts.get(n["id"]) or 0),
+        )
+
+    def fastest_node_id(self):
+        ranked = self.ranked_nodes()
+        return ranked[0]["id"] if ranked else None
+
+    def render_node_options(self):
+        options = [ft.dropdown.Option(AUTO_NODE, "Auto (fastest)")]
+        for n in self.ranked_nodes():
+            rtt = self.node_rtts.get(n["id"])
+            label = f"{n['name']} · {rtt:.0f} ms" if rtt is not None else n["name"]
+            options.append(ft.dropdown.Option(n["id"], label))
+        self.node_dropdown.options = options
+        if not self.node_dropdown.value:
+            self.node_dropdown.value = AUTO_NODE
+
+    async def on_node_change(self, e):
         self.selected_node_id = self.node_dropdown.value
+        # Con el túnel activo, cambiar de servidor sin bajarlo
+        if self.is_connected:
+            await self.switch_node()
+
+    async def switch_node(self, node_id=None):
+        """Cambio de servidor con el túnel activo: bring_up aplica el nuevo peer
+        con switch() (wg syncconf en Linux) y no hay hueco sin túnel.
+
+        Provisionar el nodo nuevo revoca el peer del actual, así que la petición
+        a la API no puede viajar por el túnel: si no hay bypass (ver
+        WireGuardManager.add_bypass) se baja antes, como al desconectar.
+
+        node_id: nodo destino; por defecto el elegido en el selector.
+        """
+        node_id = node_id or self.node_dropdown.value
+        if node_id == AUTO_NODE:
+            node_id = self.fastest_node_id()
+        if not node_id or node_id == self.connected_node_id:
+            return
+
+        started = time.perf_counter()
+        self.status_text.value = "SWITCHING..."
+        self.status_text.color = ft.Colors.AMBER_400
+        self.connection_btn.disabled = True
+        self.node_dropdown.disabled = True
+        self.app_page.update()
+
+        # Una confirmación pendiente del nodo anterior lo volvería a provisionar
+        # y el servidor revocaría el peer del nodo nuevo
+        if self.revalidation and not self.revalidation.done():
+            self.revalidation.cancel()
+            await asyncio.gather(self.revalidation, return_exceptions=True)
+
+        # Al dejar ese nodo el servidor revocó nuestro peer allí: su config en
+        # caché ya no sirve y solo retrasaría el cambio
+        self.config_cache.invalidate(node_id)
+        # La API sale fuera del túnel solo durante el cambio
+        await asyncio.to_thread(self.wg_manager.add_bypass)
+        try:
+            if not self.wg_manager.api_outside_tunnel():
+                await self.tear_down()
+            success = await self.connect_to_node(node_id)
+        finally:
+            await asyncio.to_thread(self.wg_manager.remove_bypass)
+            # Las conexiones abiertas fuera del túnel dejarían de funcionar
+            await self.api.reset_connections()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logging.info(f"Tunnel: server change to node {node_id} took {elapsed_ms:.0f} ms (ok={success})")
+        if success:
+            await self.show_message(f"Server changed in {elapsed_ms:.0f} ms")
+
+        self.node_dropdown.disabled = False
+        await self.finish_connect_attempt()
 
     async def toggle_connection(self, e):
         if self.is_connected:
@@ -406,6 +629,9 @@ class WireGuardClient(ft.Column):
 
     async def connect(self):
         node_id = self.node_dropdown.value
+        if node_id == AUTO_NODE:
+            node_id = self.fastest_node_id()
+            logging.info(f"Auto selection: node {node_id} ({self.node_rtts.get(node_id)} ms)")
         if not node_id:
             await self.show_message("Please select a server")
             return
@@ -415,74 +641,230 @@ class WireGuardClient(ft.Column):
         self.connection_btn.disabled = True
         self.app_page.update()
 
+        await self.connect_to_node(node_id)
+        await self.finish_connect_attempt()
+
+    async def connect_to_node(self, node_id, confirm_cache=False):
+        """Provisiona y levanta el túnel hacia node_id; devuelve True si quedó conectado.
+
+        Con confirm_cache (recuperación) una config de la caché solo cuenta como
+        éxito si el nodo responde con un handshake.
+        """
         priv_key, pub_key = self.get_local_keys()
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "X-Client-Version": CLIENT_VERSION,
-        }
+
+        # Reconexión instantánea: levantar el túnel con la última config de este
+        # nodo y confirmarla con el servidor en segundo plano. No vale si el nodo
+        # rotó su clave desde entonces (la lista la trae; un servidor antiguo no)
+        node = next((n for n in self.nodes if n["id"] == node_id), {})
+        cached = self.config_cache.get(node_id, pub_key, node.get("server_public_key"))
+        if cached:
+            logging.info(f"ConfigCache: bringing up node {node_id} from cache")
+            since = time.time()
+            if await self.bring_up(cached["config"], priv_key, cached["node"], node_id):
+                confirmed = not confirm_cache or await asyncio.to_thread(
+                    self.wg_manager.wait_for_handshake, CACHE_HANDSHAKE_TIMEOUT, since
+                ) is not False
+                if confirmed:
+                    self.revalidation = self.spawn(self.revalidate_config(node_id, pub_key, cached, since))
+                    return True
+                logging.warning(f"ConfigCache: no handshake on cached tunnel to node {node_id}, provisioning")
+                # Bajarlo para que la petición a la API no viaje por él
+                await self.tear_down(stop_monitor=False)
+            self.config_cache.invalidate(node_id)
+
         payload = {
             "region": node_id, # Sending Node UUID in the 'region' field (Backward Comp.)
             "public_key": pub_key,
             "device_id": self.device_id
         }
         
+        success = False
         try:
-            response = requests.post(f"{API_BASE}/me/wireguard-config", headers=headers, json=payload)
+            response = await self.run_cancellable(self.api.get_wireguard_config(payload))
             if response.status_code == 200:
                 config_data = response.json()
                 raw_conf = config_data["config"]
                 
                 # Get display name for the connected node
                 connected_node_name = config_data.get("node", "UNKNOWN")
+                self.config_cache.put(node_id, pub_key, raw_conf, connected_node_name)
                 
-                full_conf = raw_conf.replace("[Interface]", f"[Interface]\nPrivateKey = {priv_key}")
-                
-                # Intentar conexión automática
-                success, msg = self.wg_manager.connect(full_conf)
-                
-                if success:
-                    self.is_connected = True
-                    self.status_text.value = f"SECURED: {connected_node_name.upper()}"
-                    self.status_text.color = ft.Colors.GREEN_400
-                    
-                    # Actualizar UI del botón
-                    self.conn_label.value = "DISCONNECT"
-                    self.conn_icon.name = ft.Icons.STOP
-                    self.connection_btn.bgcolor = ft.Colors.RED_700
-                    
-                    self.config_box.value = full_conf
-                    self.log_container.visible = False
-                    
-                    # Actualizar Tray Icon (pystray)
-                    await self.update_tray_state(True)
-                    
-                    self.app_page.update()
-                    await self.show_message("Secure tunnel established!")
-                else:
-                    self.status_text.value = "DRIVER ERROR"
-                    self.status_text.color = ft.Colors.RED_400
-                    self.config_box.value = full_conf
-                    self.log_container.visible = True
-                    await self.show_message(msg)
+                success = await self.bring_up(raw_conf, priv_key, connected_node_name, node_id)
             else:
                 self.status_text.value = "API ERROR"
                 await self.show_message(f"Error: {response.json().get('detail')}")
+        except asyncio.CancelledError:
+            logging.info("API: provisioning cancelled")
+            self.status_text.value = "READY"
+            self.status_text.color = ft.Colors.BLUE_400
         except Exception as ex:
             await self.show_message(f"Fatal Error: {ex}")
         
+        return success
+
+    async def finish_connect_attempt(self):
         self.connection_btn.disabled = False
         self.connection_btn.update()
         self.app_page.update()
 
-    async def disconnect(self):
-        self.status_text.value = "DISCONNECTING..."
-        self.app_page.update()
+    async def bring_up(self, raw_conf, priv_key, connected_node_name, node_id):
+        full_conf = raw_conf.replace("[Interface]", f"[Interface]\nPrivateKey = {priv_key}")
+
+        # Intentar conexión automática (en un hilo: wg-quick/wireguard.exe bloquean)
+        if self.is_connected:
+            # Cambio de servidor con el túnel activo: intercambio de peer en caliente si es posible
+            success, msg, elapsed_ms = await asyncio.to_thread(self.wg_manager.switch, full_conf)
+            logging.info(f"Tunnel: switched to {connected_node_name} in {elapsed_ms:.0f} ms ({msg})")
+            self.is_connected = success
+        else:
+            success, msg = await asyncio.to_thread(self.wg_manager.connect, full_conf)
         
-        success, msg = self.wg_manager.disconnect()
+        if success:
+            await self.api.reset_connections()
+            self.is_connected = True
+            self.connected_node_id = node_id
+            self.status_text.value = f"SECURED: {connected_node_name.upper()}"
+            self.status_text.color = ft.Colors.GREEN_400
+            
+            # Actualizar UI del botón
+            self.conn_label.value = "DISCONNECT"
+            self.conn_icon.name = ft.Icons.STOP
+            self.connection_btn.bgcolor = ft.Colors.RED_700
+            
+            self.config_box.value = full_conf
+            self.log_container.visible = False
+            
+            # Actualizar Tray Icon (pystray)
+            await self.update_tray_state(True)
+            
+            # Vigilar el túnel (caudal y handshake) mientras esté activo
+            self.tunnel_monitor.start()
+            
+            self.app_page.update()
+            await self.show_message("Secure tunnel established!")
+        else:
+            self.status_text.value = "DRIVER ERROR"
+            self.status_text.color = ft.Colors.RED_400
+            self.config_box.value = full_conf
+            self.log_container.visible = True
+            await self.show_message(msg)
+        return success
+
+    async def revalidate_config(self, node_id, pub_key, cached, since):
+        # La petición viaja por el propio túnel de la caché. Si el nodo ya no tiene
+        # nuestro peer (p. ej. nos revocó al pasar a otro nodo) no habrá handshake
+        # y la petición solo acabaría en timeout: provisionar sin la caché.
+        handshake = await asyncio.to_thread(self.wg_manager.wait_for_handshake, CACHE_HANDSHAKE_TIMEOUT, since)
+        if self.connected_node_id != node_id:
+            return  # Desconectado o cambiado de nodo mientras tanto
+        if handshake is False:
+            logging.warning(f"ConfigCache: no handshake on cached tunnel to node {node_id}, provisioning")
+            await self.provision_without_cache(node_id)
+            return
+
+        payload = {
+            "region": node_id,
+            "public_key": pub_key,
+            "device_id": self.device_id
+        }
+        try:
+            response = await self.api.get_wireguard_config(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            if handshake:
+                # El túnel funciona (hubo handshake): el fallo es del servidor
+                logging.warning(f"ConfigCache: validation failed, keeping cached tunnel: {ex}")
+                return
+            # Sin handshake conocido ni respuesta del servidor la caché no está confirmada
+            logging.warning(f"ConfigCache: validation failed and no handshake seen, provisioning: {ex}")
+            await self.provision_without_cache(node_id)
+            return
+
+        if response.status_code == 200:
+            config_data = response.json()
+            if config_data["config"] == cached["config"]:
+                logging.info("ConfigCache: cached config confirmed by server")
+                return
+            logging.info("ConfigCache: server config changed, re-provisioning tunnel")
+            node_name = config_data.get("node", cached["node"])
+            self.config_cache.put(node_id, pub_key, config_data["config"], node_name)
+            if self.is_connected:
+                priv_key, _ = self.get_local_keys()
+                await self.bring_up(config_data["config"], priv_key, node_name, node_id)
+        elif response.status_code in (400, 401, 403, 404):
+            # El servidor ya no reconoce esta cuenta/dispositivo/nodo
+            self.config_cache.invalidate(node_id)
+            if self.is_connected:
+                await self.disconnect()
+            await self.show_message(f"Error: {response.json().get('detail')}")
+        else:
+            logging.warning(f"ConfigCache: validation returned {response.status_code}, keeping cached tunnel")
+
+    async def provision_without_cache(self, node_id):
+        self.config_cache.invalidate(node_id)
+        await self.tear_down()
+        self.status_text.value = "PROVISIONING..."
+        self.status_text.color = ft.Colors.AMBER_400
+        self.connection_btn.disabled = True
+        self.app_page.update()
+        await self.connect_to_node(node_id)
+        await self.finish_connect_attempt()
+
+    async def on_tunnel_stats(self, rx_rate, tx_rate, handshake_age):
+        self.throughput_text.value = (
+            f"↓ {format_rate(rx_rate)}   ↑ {format_rate(tx_rate)}   ·   handshake {handshake_age:.0f}s"
+        )
+        self.throughput_text.update()
+
+    async def recover_tunnel(self):
+        """Handshake caducado: re-provisionar en el siguiente mejor nodo con backoff."""
+        failed = {self.connected_node_id}
+        if self.connected_node_id:
+            self.config_cache.invalidate(self.connected_node_id)
+        delay = RECOVERY_BACKOFF_START
+        for _ in range(RECOVERY_MAX_ATTEMPTS):
+            # stop() del monitor (desconexión manual) interrumpe la recuperación
+            if not self.tunnel_monitor.running:
+                return
+            candidates = [n["id"] for n in self.ranked_nodes() if n["id"] not in failed]
+            if not candidates:
+                # Todos fallaron: volver a intentar la lista completa tras esperar
+                failed = set()
+                candidates = [n["id"] for n in self.ranked_nodes()]
+            if not candidates:
+                break
+
+            node_id = candidates[0]
+            self.status_text.value = "RECOVERING..."
+            self.status_text.color = ft.Colors.AMBER_400
+            self.app_page.update()
+            logging.info(f"Monitor: re-provisioning on node {node_id}")
+
+            # El túnel caído sigue levantado con AllowedIPs 0.0.0.0/0, ::/0: la
+            # petición a la API viajaría por él y solo daría timeout. El monitor
+            # sigue en marcha (esta recuperación corre dentro de él).
+            if self.is_connected:
+                await self.tear_down(stop_monitor=False)
+            if await self.connect_to_node(node_id, confirm_cache=True):
+                return
+            failed.add(node_id)
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            delay = min(delay * 2, RECOVERY_BACKOFF_MAX)
+
+        self.status_text.value = "CONNECTION LOST"
+        self.status_text.color = ft.Colors.RED_400
+        self.app_page.update()
+
+    async def tear_down(self, stop_monitor=True):
+        """Bajar el túnel y dejar la UI como desconectada; devuelve (ok, mensaje)."""
+        if stop_monitor:
+            self.tunnel_monitor.stop()
+        success, msg = await asyncio.to_thread(self.wg_manager.disconnect)
         if success:
             self.is_connected = False
-            self.status_text.value = "READY"
-            self.status_text.color = ft.Colors.BLUE_400
+            self.connected_node_id = None
+            self.throughput_text.value = ""
             
             # Restaurar UI del botón
             self.conn_label.value = "CONNECT"
@@ -493,7 +875,17 @@ class WireGuardClient(ft.Column):
             
             # Restaurar Tray Icon (pystray)
             await self.update_tray_state(False)
+            await self.api.reset_connections()
+        return success, msg
 
+    async def disconnect(self):
+        self.status_text.value = "DISCONNECTING..."
+        self.app_page.update()
+        
+        success, msg = await self.tear_down()
+        if success:
+            self.status_text.value = "READY"
+            self.status_text.color = ft.Colors.BLUE_400
             self.app_page.update()
             await self.show_message("Disconnected")
         else:
@@ -502,9 +894,11 @@ class WireGuardClient(ft.Column):
         self.app_page.update()
 
     async def handle_logout(self, e):
+        # Abandonar cualquier petición en vuelo de la vista principal
+        self.cancel_pending()
         if self.is_connected:
             await self.disconnect()
-        self.token = None
+        self.api.logout()
         self.main_view.visible = False
         self.login_view.visible = True
         self.app_page.update()
@@ -552,6 +946,7 @@ async def main(page: ft.Page):
     
     page.add(client_app)
     page.update()
+    await client_app.start_deferred()
 
 if __name__ == "__main__":
     # Verificación de privilegios de Administrador (Necesario para WireGuard)
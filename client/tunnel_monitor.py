@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import time
+
+
+class TunnelMonitor:
+    """Vigila el túnel activo leyendo `wg show <iface> dump` periódicamente.
+
+    Calcula el caudal (bytes/s) a partir de la diferencia de contadores entre
+    lecturas y la antigüedad del último handshake. Si el handshake supera
+    `stale_after` segundos (WireGuard renueva cada ~2 min mientras hay tráfico
+    y el keepalive es de 25 s) se considera que el nodo está caído y se llama
+    a `on_stale`.
+    """
+
+    def __init__(self, manager, on_stats, on_stale, interval=2.0, stale_after=180):
+        self.manager = manager
+        self.on_stats = on_stats
+        self.on_stale = on_stale
+        self.interval = interval
+        self.stale_after = stale_after
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        last = None  # (instante, rx, tx)
+        started = time.time()
+        while True:
+            await asyncio.sleep(self.interval)
+            peers = await asyncio.to_thread(self.manager.dump)
+            now = time.time()
+            if not peers:
+                last = None
+                continue
+
+            peer = peers[0]
+            rx_rate = tx_rate = 0.0
+            if last and now > last[0]:
+                # Los contadores se reinician si el túnel se recrea
+                rx_rate = max(0, peer["rx"] - last[1]) / (now - last[0])
+                tx_rate = max(0, peer["tx"] - last[2]) / (now - last[0])
+            last = (now, peer["rx"], peer["tx"])
+
+            # Sin handshake todavía: contar desde que empezó la vigilancia
+            handshake_age = now - (peer["latest_handshake"] or started)
+            # Tras una recuperación se espera otro periodo completo antes de
+            # reintentar (evita encadenar recuperaciones si todas fallan)
+            stale_age = now - max(peer["latest_handshake"], started)
+
+            try:
+                await self.on_stats(rx_rate, tx_rate, handshake_age)
+                if stale_age > self.stale_after:
+                    logging.warning(f"Monitor: stale handshake ({handshake_age:.0f}s), recovering")
+                    await self.on_stale()
+                    # Nuevo túnel: reiniciar referencias
+                    last = None
+                    started = time.time()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"Monitor: callback failed: {e}")
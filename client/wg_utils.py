@@ -1,11 +1,29 @@
 import base64
+import ipaddress
+import logging
 import os
 import platform
+import socket
 import subprocess
 import time
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import x25519
 
+def parse_config(config_content):
+    """Secciones de un .conf de WireGuard: {"Interface": {...}, "Peer": {...}}."""
+    sections = {}
+    current = None
+    for raw_line in config_content.splitlines():
+        line = raw_line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            current = sections.setdefault(line[1:-1], {})
+        elif current is not None and "=" in line:
+            key, value = line.split("=", 1)
+            current[key.strip()] = value.strip()
+    return sections
+
 def generate_wg_keys():
     private_key = x25519.X25519PrivateKey.generate()
     public_key = private_key.public_key()
@@ -26,11 +44,116 @@ def generate_wg_keys():
         base64.b64encode(public_bytes).decode('utf-8')
     )
 
+# Prioridad de las reglas que sacan la API del túnel: antes que las que instala
+# wg-quick para AllowedIPs = 0.0.0.0/0 (32764/32765)
+BYPASS_RULE_PREF = 100
+
 class WireGuardManager:
-    def __init__(self, interface_name="wg_api_wire"):
+    def __init__(self, interface_name="wg_api_wire", bypass_hosts=()):
         self.interface_name = interface_name
         self.os_type = platform.system()
         self.config_path = os.path.join(os.getcwd(), f"{self.interface_name}.conf")
+        self.active_config = None  # Config del túnel levantado (None = desconectado)
+        # Hosts (la API) que pueden salir fuera del túnel durante un cambio de servidor, ver add_bypass
+        self.bypass_hosts = list(bypass_hosts)
+        self._bypass_rules = []
+
+    def _bypass_addresses(self):
+        addresses = set()
+        for host in self.bypass_hosts:
+            try:
+                addresses.update(info[4][0] for info in socket.getaddrinfo(host, None))
+            except OSError as e:
+                logging.warning(f"Bypass: cannot resolve {host}: {e}")
+        return sorted(addresses)
+
+    def add_bypass(self):
+        """Linux: el tráfico hacia bypass_hosts sale por la tabla main, fuera del túnel.
+
+        Solo mientras se cambia de servidor (quitar con remove_bypass): provisionar
+        el nodo nuevo revoca el peer del actual y la respuesta que viajara por el
+        túnel se perdería. El resto del tiempo la API va por el túnel.
+        """
+        if self.os_type != "Linux":
+            return
+        for address in self._bypass_addresses():
+            if ipaddress.ip_address(address.split("%")[0]).is_loopback:
+                continue
+            family = "-6" if ":" in address else "-4"
+            rule = ["ip", family, "rule", "add", "to", address, "lookup", "main", "pref", str(BYPASS_RULE_PREF)]
+            try:
+                subprocess.run(rule, capture_output=True, text=True, check=True)
+                self._bypass_rules.append(rule)
+            except Exception as e:
+                logging.warning(f"Bypass: {' '.join(rule)} failed: {e}")
+
+    def remove_bypass(self):
+        for rule in self._bypass_rules:
+            subprocess.run([*rule[:3], "del", *rule[4:]], capture_output=True)
+        self._bypass_rules = []
+
+    def api_outside_tunnel(self):
+        """True si el tráfico hacia bypass_hosts no pasa por el túnel (reglas o loopback)."""
+        if self._bypass_rules:
+            return True
+        addresses = self._bypass_addresses()
+        return bool(addresses) and all(ipaddress.ip_address(a.split("%")[0]).is_loopback for a in addresses)
+
+    def _wg_bin(self):
+        # wg (herramienta de consulta) viene junto a wireguard.exe en Windows
+        if self.os_type == "Windows":
+            path = os.path.join(os.environ.get("ProgramFiles", "C:\\Program Files"), "WireGuard", "wg.exe")
+            return path if os.path.exists(path) else "wg.exe"
+        return "wg"
+
+    def dump(self):
+        """Estado del túnel según `wg show <iface> dump`.
+
+        Devuelve una lista de peers con latest_handshake (epoch, 0 = nunca),
+        rx/tx acumulados en bytes y endpoint; None si la interfaz no existe.
+        """
+        try:
+            result = subprocess.run(
+                [self._wg_bin(), "show", self.interface_name, "dump"],
+                capture_output=True, text=True, timeout=5
+            )
+        except Exception:
+            return None
+        if result.returncode != 0:
+            return None
+
+        peers = []
+        # La primera línea es la interfaz; el resto, un peer por línea
+        for line in result.stdout.splitlines()[1:]:
+            fields = line.split("\t")
+            if len(fields) < 8:
+                continue
+            peers.append({
+                "public_key": fields[0],
+                "endpoint": fields[2],
+                "latest_handshake": int(fields[4]),
+                "rx": int(fields[5]),
+                "tx": int(fields[6]),
+            })
+        return peers
+
+    def wait_for_handshake(self, timeout, since=0, interval=0.5):
+        """Espera un handshake posterior a `since` (epoch) durante `timeout` segundos.
+
+        True si lo hubo, False si no; None si el túnel no se pudo consultar
+        (sin `wg`), es decir, no se sabe.
+        """
+        deadline = time.monotonic() + timeout
+        queried = False
+        while True:
+            peers = self.dump()
+            if peers is not None:
+                queried = True
+                if any(p["latest_handshake"] >= int(since) for p in peers):
+                    return True
+            if time.monotonic() >= deadline:
+                return False if queried else None
+            time.sleep(interval)
 
     def save_config(self, config_content):
         with open(self.config_path, "w") as f:
@@ -63,6 +186,7 @@ class WireGuardManager:
                     text=True,
                     check=True
                 )
+                self.active_config = config_content
                 return True, "Conectado (Servicio Windows)"
             except subprocess.CalledProcessError as e:
                 error_msg = e.stderr or e.stdout or str(e)
@@ -75,16 +199,61 @@ class WireGuardManager:
         elif self.os_type == "Linux":
             try:
                 subprocess.run(["wg-quick", "up", path], check=True)
+                self.active_config = config_content
                 return True, "Conectado (wg-quick)"
             except Exception as e:
                 return False, f"Error en Linux: {str(e)}"
         
         return False, "Sistema operativo no soportado para conexión automática"
 
+    def can_hot_swap(self, config_content):
+        """True si el cambio solo afecta al peer y se puede aplicar sin recrear la interfaz."""
+        if self.os_type != "Linux" or not self.active_config:
+            return False
+        old, new = parse_config(self.active_config), parse_config(config_content)
+        # Address/DNS/PrivateKey distintos requieren wg-quick (direcciones, DNS)
+        if old.get("Interface") != new.get("Interface"):
+            return False
+        # wg-quick instala rutas para AllowedIPs: si cambian, reinicio completo
+        return old.get("Peer", {}).get("AllowedIPs") == new.get("Peer", {}).get("AllowedIPs")
+
+    def switch(self, config_content):
+        """Cambia de servidor; devuelve (ok, mensaje, milisegundos).
+
+        En Linux, si solo cambia la sección [Peer], se reemplaza el peer en
+        caliente con `wg syncconf` (las conexiones abiertas sobreviven al
+        cambio de endpoint). Si cambia [Interface] se hace down + up.
+        """
+        start = time.perf_counter()
+        if self.can_hot_swap(config_content):
+            path = self.save_config(config_content)
+            try:
+                # syncconf no entiende las claves de wg-quick (Address, DNS...)
+                stripped = subprocess.run(
+                    ["wg-quick", "strip", path], capture_output=True, text=True, check=True
+                ).stdout
+                subprocess.run(
+                    ["wg", "syncconf", self.interface_name, "/dev/stdin"],
+                    input=stripped, text=True, check=True
+                )
+                self.active_config = config_content
+                elapsed = (time.perf_counter() - start) * 1000
+                return True, f"Servidor cambiado en caliente (wg syncconf, {elapsed:.0f} ms)", elapsed
+            except Exception as e:
+                # Si falla el cambio en caliente, intentar el reinicio completo
+                logging.warning(f"wg syncconf falló, reiniciando túnel: {e}")
+
+        if self.active_config:
+            self.disconnect()
+        success, msg = self.connect(config_content)
+        elapsed = (time.perf_counter() - start) * 1000
+        return success, f"{msg} (reinicio completo, {elapsed:.0f} ms)", elapsed
+
     def disconnect(self):
         if self.os_type == "Windows":
             try:
                 subprocess.run(["wireguard.exe", "/uninstalltunnelservice", self.interface_name], check=True)
+                self.active_config = None
                 return True, "Desconectado"
             except:
                 return False, "Error al desconectar (¿Estaba conectado?)"
@@ -92,6 +261,8 @@ class WireGuardManager:
         elif self.os_type == "Linux":
             try:
                 subprocess.run(["wg-quick", "down", self.interface_name], check=True)
+                self.active_config = None
+                self.remove_bypass()
                 return True, "Desconectado"
             except:
                 return False, "Error al desconectar"